@@ -2,25 +2,40 @@
 This file is responsible for routing the incoming requests to the respective endpoints.
 """
 
-from fastapi.responses import JSONResponse
-from fastapi import APIRouter, Request
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, Response
+from fastapi import APIRouter, Query, Request
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from fastapi.templating import Jinja2Templates
+import asyncio
 import logging
 
 from services.chat import ChatService
 from models.company import Company
-from services.embedding import Embedding
 from models.database import get_db_session
 from services.redis_service import RedisService
-from services.qdrant_searcher import QdrantSearcher
+from services.metrics import latest_metrics
+from services.postgres_searcher import start_search_explain
+from services.deadline import start_deadline
+from services.session_service import SessionService
+from services.autocomplete import AutocompleteIndex
+from services.facet_service import FacetService
+from services.cache_warmer import CacheWarmer
+from services.response_cache import ResponseCache
+from services.company_service import CACHE_NAMESPACE, CompanyService
+from services.search_index import active_index
+from config.main import config
 from fastapi import HTTPException
 
 api_router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 chat_service = ChatService()
-embedding_util = Embedding()
 redis_service = RedisService()
+session_service = SessionService(redis_service)
+autocomplete_index = AutocompleteIndex(redis_service)
+facet_service = FacetService(redis_service)
+response_cache = ResponseCache(redis_service)
+company_service = CompanyService(chat_service, active_index, redis_service, autocomplete_index, facet_service)
 logger = logging.getLogger(__name__)
 
 class CompanyCreate(BaseModel):
@@ -31,121 +46,255 @@ class CompanyCreate(BaseModel):
     location: str
 
 
+class CompanyUpdate(BaseModel):
+    id: int
+    name: Optional[str] = None
+    description: Optional[str] = None
+    industry: Optional[str] = None
+    size: Optional[str] = None
+    location: Optional[str] = None
+
+
+class BulkCreateRequest(BaseModel):
+    companies: List[CompanyCreate] = Field(..., min_length=1, max_length=config.BULK_MAX_ITEMS)
+
+
+class BulkUpdateRequest(BaseModel):
+    companies: List[CompanyUpdate] = Field(..., min_length=1, max_length=config.BULK_MAX_ITEMS)
+
+
+class BulkDeleteRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=config.BULK_MAX_ITEMS)
+
+
+def bulk_response(results: list) -> dict:
+    summary = {}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+    return {"results": results, "summary": summary}
+
+
 class SearchRequest(BaseModel):
     query: str
+    # MMR diversity re-ranking, 1.0 is pure relevance and 0.0 pure diversity
+    mmr_lambda: Optional[float] = Field(None, ge=0.0, le=1.0)
+    fetch_k: Optional[int] = Field(None, ge=1, le=200)
+    # Report the candidate depths, per-leg ranks and timings of the Postgres hybrid search
+    explain: bool = False
+
+    def search_options(self) -> dict:
+        """Searcher options set on this request"""
+        options = {"mmr_lambda": self.mmr_lambda, "fetch_k": self.fetch_k}
+        return {key: value for key, value in options.items() if value is not None}
+
+    def cache_key(self, version: int) -> str:
+        """Key of the cached results, `version` is the companies cache namespace version"""
+        options = self.search_options()
+        suffix = "".join(f":{key}={value}" for key, value in sorted(options.items()))
+        return f"search_company:v{version}:{self.query}{suffix}"
+
+def search_results(search_request: SearchRequest) -> dict:
+    """Runs a search through the chat service, the results cached for /search-company"""
+    response, company_recommendations = chat_service.generate_response(
+        search_request.query, search_request.search_options()
+    )
+    return {
+        "response": response,
+        "company_recommendations": [company.to_dict() for company in company_recommendations]
+    }
+
+
+async def warm_search(fields: dict, version: int) -> None:
+    """Caches the results of a popular search for the companies namespace `version`"""
+    search_request = SearchRequest(**fields)
+    cache_key = search_request.cache_key(version)
+    if await redis_service.exists(cache_key):
+        return
+    # In a thread, the event loop keeps serving requests while the warmer runs
+    results = await asyncio.to_thread(search_results, search_request)
+    await response_cache.set(cache_key, {**results, "source": "cache", "degradations": []}, 3600)
+
+
+cache_warmer = CacheWarmer(redis_service, CACHE_NAMESPACE, warm_search)
+
 
 @api_router.post("/companies")
 async def add_company(company: CompanyCreate):
-    content = f"{company.name}\n{company.description}\n{company.industry}\n{company.size}\n{company.location}"
-    
-    try:
-        logger.info(f"Generating Pinecone embedding for company: {company.name}")
-        embedding = embedding_util.generate_pinecone(content, 1024)
-        logger.info(f"Successfully generated Pinecone embedding for company: {company.name}")
-    except Exception as e:
-        logger.error(f"Error generating Pinecone embedding: {e}")
-        logger.info(f"Falling back to OpenAI embedding for company: {company.name}")
-        try:
-            embedding = embedding_util.generate(content, 1024)
-        except Exception as openai_error:
-            logger.error(f"Error generating OpenAI embedding: {openai_error}")
-            raise HTTPException(status_code=500, detail="Failed to generate embeddings")
-    
-    new_company = Company(
-        name=company.name,
-        description=company.description,
-        industry=company.industry,
-        size=company.size,
-        location=company.location,
-        content=content,
-        embedding=embedding
-    )
-    
-    with get_db_session() as session:
-        session.add(new_company)
-        session.commit()
-        session.refresh(new_company)
-    
-    if chat_service.use_qdrant:
-        qdrant_searcher = QdrantSearcher(Company)
-        qdrant_searcher.upsert_company(new_company)
-    
-    await redis_service.delete("all_companies")
-    await redis_service.scan_and_delete("search_company:*")
+    [result] = await company_service.create([company.model_dump()])
+    if result["status"] != "created":
+        raise HTTPException(status_code=500, detail=result["error"])
     
     return {"message": "Company added successfully"}
 
 
+@api_router.post("/companies/bulk", response_class=JSONResponse)
+async def add_companies(request: BulkCreateRequest):
+    """
+    Create companies in one transaction, embedded in batches. Every item reports
+    its own status, failed items do not abort the batch.
+    """
+    results = await company_service.create([company.model_dump() for company in request.companies])
+    return bulk_response(results)
+
+
+@api_router.patch("/companies/bulk", response_class=JSONResponse)
+async def update_companies(request: BulkUpdateRequest):
+    """Partial updates in one transaction, only companies whose content changed are re-embedded"""
+    results = await company_service.update([company.model_dump() for company in request.companies])
+    return bulk_response(results)
+
+
+@api_router.delete("/companies/bulk", response_class=JSONResponse)
+async def delete_companies(request: BulkDeleteRequest):
+    """Delete companies by id in one transaction"""
+    results = await company_service.delete(request.ids)
+    return bulk_response(results)
+
+
 @api_router.post("/search-company", response_class=JSONResponse)
-async def search_company(search_request: SearchRequest):
-    cache_key = f"search_company:{search_request.query}"
-    cached_results = await redis_service.get(cache_key)
+async def search_company(search_request: SearchRequest, request: Request):
+    """
+    Search results are cached with their ETag and gzip (brotli) bodies, a
+    cache hit is sent as stored, without parsing or compressing it again.
+
+    The request runs within SEARCH_DEADLINE_SECONDS: when time runs low the LLM
+    summary is skipped or the vector search falls back to full-text results,
+    listed in "degradations". Degraded results are not cached
+    """
+    if search_request.explain:
+        # Explained searches always run and are not cached
+        explanations = start_search_explain()
+        results = await asyncio.to_thread(search_results, search_request)
+        return {**results, "source": "database", "explain": explanations}
+
+    degradations = start_deadline(config.SEARCH_DEADLINE_SECONDS)
+    await cache_warmer.track({"query": search_request.query, **search_request.search_options()})
+    cache_key = search_request.cache_key(await redis_service.get_namespace_version(CACHE_NAMESPACE))
+    cached_response = await response_cache.get(request, cache_key)
+    
+    if cached_response is not None:
+        return cached_response
+
+    # In a thread so other requests keep being served, the deadline and the
+    # degradations are context variables and follow it there
+    results = await asyncio.to_thread(search_results, search_request)
+    if degradations:
+        return {**results, "source": "database", "degradations": degradations}
     
-    if cached_results:
+    etag = await response_cache.set(cache_key, {**results, "source": "cache", "degradations": []}, 3600)
+    
+    return response_cache.respond(request, {**results, "source": "database", "degradations": []}, etag)
+
+
+@api_router.get("/autocomplete", response_class=JSONResponse)
+async def autocomplete(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    fuzzy: bool = True,
+):
+    """Company-name completions, no embedding or LLM call involved"""
+    return await autocomplete_index.complete(q, limit, fuzzy)
+
+
+@api_router.get("/facets", response_class=JSONResponse)
+async def get_facets(query: str = None, session_id: str = None):
+    """
+    Company counts per industry, size and location. With `query` the counts are
+    scoped to the cached results of that search, with `session_id` to the
+    candidates of that conversation.
+    """
+    if query is not None:
+        version = await redis_service.get_namespace_version(CACHE_NAMESPACE)
+        cached_results = await redis_service.get(SearchRequest(query=query).cache_key(version))
+        if cached_results is None:
+            raise HTTPException(status_code=404, detail="No cached results for this search query")
         return {
-            "response": cached_results["response"],
-            "company_recommendations": cached_results["company_recommendations"],
-            "source": "cache"
+            "facets": facet_service.scoped_counts(cached_results["company_recommendations"]),
+            "scope": "search",
         }
+    if session_id is not None:
+        session = await session_service.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found or expired")
+        return {"facets": facet_service.scoped_counts(session["candidates"]), "scope": "session"}
 
-    response, company_recommendations = chat_service.generate_response(
-        search_request.query
+    return {"facets": await facet_service.counts(), "scope": "all"}
+
+
+@api_router.post("/sessions")
+async def create_session():
+    """Start a multi-turn search conversation"""
+    session_id = await session_service.create()
+    return {"session_id": session_id}
+
+
+@api_router.post("/sessions/{session_id}/messages", response_class=JSONResponse)
+async def send_session_message(session_id: str, search_request: SearchRequest):
+    """
+    Answer a query within a conversation. Follow-ups are answered from the
+    candidates retrieved earlier in the session whenever the model refines
+    instead of searching again.
+    """
+    session = await session_service.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+
+    # In a thread, the LLM turns and the search would block the event loop
+    response, company_recommendations = await asyncio.to_thread(
+        chat_service.continue_session, session, search_request.query, search_request.search_options()
     )
-    
-    results = {
-        "response": response,
-        "company_recommendations": [company.to_dict() for company in company_recommendations]
-    }
-    
-    await redis_service.set(cache_key, results, 3600)
-    
+    await session_service.save(session_id, session)
+
     return {
-        **results,
-        "source": "database"
+        "session_id": session_id,
+        "response": response,
+        "company_recommendations": [company.to_dict() for company in company_recommendations],
     }
 
 
+@api_router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    await session_service.delete(session_id)
+    return {"message": "Session deleted successfully"}
+
+
 @api_router.get("/companies", response_class=JSONResponse)
-async def get_companies():
-    """Get all companies with Redis caching"""
-    cache_key = "all_companies"
+async def get_companies(request: Request):
+    """
+    Get all companies with Redis caching. Responses carry an ETag, a client
+    sending it back in If-None-Match gets a 304 while the list is unchanged,
+    and cached gzip (brotli) bodies are sent without compressing them again
+    """
+    cache_key = f"all_companies:v{await redis_service.get_namespace_version(CACHE_NAMESPACE)}"
     
-    cached_companies = await redis_service.get(cache_key)
-    if cached_companies:
-        return {
-            "companies": cached_companies,
-            "source": "cache"
-        }
+    cached_response = await response_cache.get(request, cache_key)
+    if cached_response is not None:
+        return cached_response
 
     try:
-        with get_db_session() as session:
+        with get_db_session("read") as session:
             companies = session.query(Company).order_by(Company.created_at.desc()).all()
             companies_dict = [company.to_dict() for company in companies]
             
-            await redis_service.set(cache_key, companies_dict, 3600)
+            etag = await response_cache.set(cache_key, {"companies": companies_dict, "source": "cache"}, 3600)
             
-            return {
-                "companies": companies_dict,
-                "source": "database"
-            }
+            return response_cache.respond(request, {"companies": companies_dict, "source": "database"}, etag)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.delete("/companies/{company_id}")
 async def delete_company(company_id: int):
-    try:
-        with get_db_session() as session:
-            company = session.query(Company).filter(Company.id == company_id).first()
-            if not company:
-                raise HTTPException(status_code=404, detail="Company not found")
-            
-            session.delete(company)
-            session.commit()
-            
-        # Clear cache after deletion
-        await redis_service.delete("all_companies")
-        await redis_service.scan_and_delete("search_company:*")
-        
-        return {"message": "Company deleted successfully"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    [result] = await company_service.delete([company_id])
+    if result["status"] == "not_found":
+        raise HTTPException(status_code=404, detail="Company not found")
+    if result["status"] != "deleted":
+        raise HTTPException(status_code=500, detail=result["error"])
+    
+    return {"message": "Company deleted successfully"}
+
+
+@api_router.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms, cache, fallback and LLM token counters"""
+    content, content_type = latest_metrics()
+    return Response(content=content, media_type=content_type)
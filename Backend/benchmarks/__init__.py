@@ -0,0 +1,8 @@
+"""
+    Offline benchmark and load-test suite.
+
+    Provides deterministic stand-ins for Groq, OpenAI, Pinecone and Qdrant
+    (`benchmarks.fakes`), synthetic company corpora (`benchmarks.corpus`) and an
+    async load driver reporting throughput and latency percentiles per endpoint
+    and per stage (`benchmarks.load`). Run `python -m benchmarks --help`.
+"""
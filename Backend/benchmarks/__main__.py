@@ -0,0 +1,181 @@
+"""
+    Benchmark command line, run from the Backend directory.
+
+    Generate a synthetic corpus and load it (PostgreSQL from docker-compose):
+        python -m benchmarks corpus --rows 100k --out data/bench/100k
+        python scripts/snapshot.py import data/bench/100k --target postgres --truncate
+
+    Run the load test in-process against the app with fake providers:
+        python -m benchmarks load --corpus data/bench/100k --requests 2000 --concurrency 32 \\
+            --llm-latency-ms 300 --embedding-latency-ms 40 --error-rate 0.01
+
+    Compare full and coarse-to-fine (SEARCH_MODE=coarse) vector search:
+        python -m benchmarks search --corpus data/bench/100k --target flat
+        python -m benchmarks search --corpus data/bench/100k --target qdrant --load
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+
+sys.path.append(".")
+
+from benchmarks.corpus import PRESETS, generate_companies, generate_queries, write_corpus
+from benchmarks.fakes import FakeProfiles, FaultProfile, install_fakes
+from benchmarks.load import Scenario, format_report, run_load
+from benchmarks.search_bench import (
+    MODES, FlatTarget, PostgresTarget, QdrantTarget, exact_top, format_search_report, load_corpus,
+    query_vectors, run_search_benchmark,
+)
+from config.main import config
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def parse_rows(value: str) -> int:
+    return PRESETS.get(value.lower()) or int(value)
+
+
+def parse_mix(value: str) -> dict:
+    """Parses `search=8,list=1,add=1` into weights."""
+    mix = {}
+    for part in value.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def build_scenarios(mix: dict, unique_queries: int, seed: int) -> list:
+    queries = generate_queries(unique_queries, seed)
+    new_companies = generate_companies(10_000_000, seed=seed + 1)
+    available = {
+        "search": Scenario(
+            "POST /search-company", "POST", "/search-company",
+            body=lambda i: {"query": queries[i % len(queries)]},
+        ),
+        "list": Scenario("GET /companies", "GET", "/companies"),
+        "add": Scenario(
+            "POST /companies", "POST", "/companies",
+            body=lambda i: {k: v for k, v in next(new_companies).items() if k != "content"},
+        ),
+    }
+    scenarios = []
+    for name, weight in mix.items():
+        if name not in available:
+            raise ValueError(f"Unknown scenario '{name}', expected one of: {', '.join(available)}")
+        scenario = available[name]
+        scenario.weight = weight
+        scenarios.append(scenario)
+    return scenarios
+
+
+async def run(args) -> dict:
+    import httpx  # pylint: disable=import-outside-toplevel
+
+    scenarios = build_scenarios(parse_mix(args.mix), args.unique_queries, args.seed)
+    if args.url:
+        transport = None
+        base_url = args.url
+    else:
+        profiles = FakeProfiles(
+            llm=FaultProfile(args.llm_latency_ms, args.jitter_ms, args.error_rate, args.seed),
+            embedding=FaultProfile(args.embedding_latency_ms, args.jitter_ms, args.error_rate, args.seed + 1),
+            pinecone=FaultProfile(args.embedding_latency_ms, args.jitter_ms, args.error_rate, args.seed + 2),
+        )
+        install_fakes(profiles, fake_qdrant=not args.real_qdrant)
+        if args.corpus and not args.real_qdrant:
+            # The in-memory Qdrant lives in this process, seed it from the corpus snapshot
+            from scripts.snapshot import import_qdrant, load_snapshot  # pylint: disable=import-outside-toplevel
+            _, ids, embeddings, payload = load_snapshot(args.corpus)
+            import_qdrant(ids, embeddings, payload, parallel=1)
+
+        from main import app  # pylint: disable=import-outside-toplevel
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://benchmark"
+
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=args.timeout) as client:
+        return await run_load(client, scenarios, args.requests, args.concurrency, args.seed)
+
+
+def run_search(args) -> dict:
+    config.COARSE_RESCORE_DEPTH = args.rescore_depth
+    manifest, ids, embeddings = load_corpus(args.corpus)
+    # The searchers refuse coarse mode for other models, measuring what that costs is the point here
+    config.MATRYOSHKA_MODELS += f",{manifest['embedding_model']}"
+    queries = query_vectors(manifest, embeddings, args.queries, args.seed)
+    logger.info(f"Computing the exact top {args.top} of {len(queries)} queries")
+    truth = exact_top(embeddings, queries, args.top)
+
+    if args.target == "flat":
+        target = FlatTarget(ids, embeddings, args.rescore_depth)
+    else:
+        if args.load:
+            from scripts.snapshot import import_postgres, import_qdrant, load_snapshot  # pylint: disable=import-outside-toplevel
+            _, ids, embeddings, payload = load_snapshot(args.corpus)
+            if args.target == "postgres":
+                import_postgres(ids, embeddings, payload, truncate=True)
+            else:
+                for mode in MODES:
+                    import_qdrant(ids, embeddings, payload, parallel=args.parallel, mode=mode)
+        target = PostgresTarget() if args.target == "postgres" else QdrantTarget(embeddings.shape[1])
+    return run_search_benchmark(target, ids, embeddings, queries, truth, args.top)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Offline benchmark suite")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    corpus_parser = subparsers.add_parser("corpus", help="Generate a synthetic company corpus snapshot")
+    corpus_parser.add_argument("--rows", type=parse_rows, default="10k", help="10k, 100k, 1m or a number")
+    corpus_parser.add_argument("--out", required=True)
+    corpus_parser.add_argument("--seed", type=int, default=42)
+
+    load_parser = subparsers.add_parser("load", help="Run the load test")
+    load_parser.add_argument("--url", help="Target a running server instead of the in-process app with fakes")
+    load_parser.add_argument("--corpus", help="Snapshot to seed the in-memory Qdrant with")
+    load_parser.add_argument("--real-qdrant", action="store_true", help="Use QDRANT_URL instead of in-memory Qdrant")
+    load_parser.add_argument("--requests", type=int, default=1000)
+    load_parser.add_argument("--concurrency", type=int, default=16)
+    load_parser.add_argument("--mix", default="search=1", help="Weighted scenarios, e.g. search=8,list=1,add=1")
+    load_parser.add_argument("--unique-queries", type=int, default=200)
+    load_parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    load_parser.add_argument("--embedding-latency-ms", type=float, default=0.0)
+    load_parser.add_argument("--jitter-ms", type=float, default=0.0)
+    load_parser.add_argument("--error-rate", type=float, default=0.0)
+    load_parser.add_argument("--timeout", type=float, default=60.0)
+    load_parser.add_argument("--seed", type=int, default=0)
+    load_parser.add_argument("--json", help="Also write the report as JSON to this path")
+
+    search_parser = subparsers.add_parser("search", help="Compare full and coarse-to-fine vector search")
+    search_parser.add_argument("--corpus", required=True, help="Snapshot directory")
+    search_parser.add_argument("--target", choices=["flat", "postgres", "qdrant"], default="flat")
+    search_parser.add_argument("--load", action="store_true", help="Import the snapshot into the target first")
+    search_parser.add_argument("--queries", type=int, default=200)
+    search_parser.add_argument("--top", type=int, default=10)
+    search_parser.add_argument("--rescore-depth", type=int, default=config.COARSE_RESCORE_DEPTH)
+    search_parser.add_argument("--parallel", type=int, default=4, help="Parallel Qdrant upload workers")
+    search_parser.add_argument("--seed", type=int, default=0)
+    search_parser.add_argument("--json", help="Also write the report as JSON to this path")
+
+    args = parser.parse_args()
+    if args.command == "corpus":
+        logging.getLogger("benchmarks").setLevel(logging.INFO)
+        write_corpus(args.out, args.rows, seed=args.seed)
+        return
+
+    if args.command == "search":
+        report = run_search(args)
+        print(format_search_report(report))
+    else:
+        report = asyncio.run(run(args))
+        print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Synthetic company corpora for benchmarks.
+
+Corpora are written in the snapshot layout of `scripts/snapshot.py`, so they are
+loaded with the regular importer (binary COPY into PostgreSQL, batched upload
+into Qdrant) and embedded with the local hashing encoder, no API call involved.
+"""
+
+import datetime
+import gzip
+import json
+import logging
+import os
+import random
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+from services.local_embedding import HashingEmbeddingBackend
+
+logger = logging.getLogger(__name__)
+
+# Same layout version as scripts/snapshot.py
+SNAPSHOT_FORMAT_VERSION = 1
+PRESETS = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+EMBED_BATCH_SIZE = 5000
+
+INDUSTRIES = [
+    "Technology", "Renewable Energy", "Healthcare Technology", "Financial Services",
+    "Agriculture & Food", "Manufacturing", "Logistics", "Retail", "Biotechnology",
+    "Education", "Real Estate", "Media & Entertainment", "Cybersecurity", "Automotive",
+]
+SIZES = ["1-10", "10-50", "50-100", "100-500", "500-1000", "1000-5000", "5000+"]
+LOCATIONS = [
+    "San Francisco, CA", "Austin, TX", "Boston, MA", "New York, NY", "Seattle, WA",
+    "Chicago, IL", "Denver, CO", "Berlin, Germany", "London, UK", "Paris, France",
+    "Toronto, Canada", "Singapore", "Bangalore, India", "Sydney, Australia", "Karachi, Pakistan",
+]
+PREFIXES = [
+    "Tech", "Green", "Health", "Global", "Eco", "Quantum", "Smart", "Blue", "Nova",
+    "Bright", "Urban", "Prime", "Cloud", "Data", "Bio", "Solar", "Swift", "Peak",
+]
+SUFFIXES = [
+    "Vision", "Earth", "Plus", "Finance", "Fresh", "Labs", "Systems", "Works",
+    "Dynamics", "Networks", "Analytics", "Logic", "Bridge", "Forge", "Wave", "Path",
+]
+FORMS = ["Solutions", "Inc", "Corp", "Group", "Technologies", "Partners", "Holdings", "Co"]
+PRODUCTS = [
+    "AI and machine learning platforms", "solar and wind power solutions",
+    "telemedicine platforms", "investment banking and wealth management",
+    "organic food distribution", "industrial robotics", "supply chain software",
+    "e-commerce marketplaces", "gene therapy research", "online learning tools",
+    "property management software", "streaming media services", "threat detection systems",
+    "electric vehicle components", "payment processing", "predictive analytics",
+]
+AUDIENCES = [
+    "enterprise businesses", "small and medium businesses", "hospitals and clinics",
+    "residential and commercial customers", "government agencies", "retailers",
+    "financial institutions", "universities", "manufacturers", "consumers",
+]
+
+
+def generate_companies(rows: int, seed: int = 42) -> Iterator[Dict[str, str]]:
+    """
+    Yields `rows` deterministic synthetic companies.
+    """
+    rng = random.Random(seed)
+    for i in range(rows):
+        name = f"{rng.choice(PREFIXES)}{rng.choice(SUFFIXES)} {rng.choice(FORMS)} {i}"
+        industry = rng.choice(INDUSTRIES)
+        size = rng.choice(SIZES)
+        location = rng.choice(LOCATIONS)
+        description = (
+            f"Provider of {rng.choice(PRODUCTS)} for {rng.choice(AUDIENCES)}. "
+            f"Specializing in {rng.choice(PRODUCTS)} and {rng.choice(PRODUCTS)}."
+        )
+        yield {
+            "name": name,
+            "description": description,
+            "industry": industry,
+            "size": size,
+            "location": location,
+            "content": (
+                f"Company: {name}\nDescription: {description}\nIndustry: {industry}\n"
+                f"Size: {size}\nLocation: {location}"
+            ),
+        }
+
+
+def generate_queries(count: int, seed: int = 7) -> List[str]:
+    """
+    Deterministic search queries over the same vocabulary as the corpus.
+    """
+    rng = random.Random(seed)
+    templates = [
+        "{industry} companies in {location}",
+        "companies building {product}",
+        "{size} employee {industry} companies",
+        "{product} for {audience}",
+    ]
+    return [
+        rng.choice(templates).format(
+            industry=rng.choice(INDUSTRIES).lower(),
+            location=rng.choice(LOCATIONS).split(",")[0],
+            product=rng.choice(PRODUCTS),
+            size=rng.choice(SIZES),
+            audience=rng.choice(AUDIENCES),
+        )
+        for _ in range(count)
+    ]
+
+
+def write_corpus(path: str, rows: int, dimensions: int = 1024, seed: int = 42) -> None:
+    """
+    Generates a corpus and writes it as a snapshot directory.
+    """
+    os.makedirs(path, exist_ok=True)
+    encoder = HashingEmbeddingBackend()
+    embeddings = np.lib.format.open_memmap(
+        os.path.join(path, "embeddings.npy"), mode="w+", dtype=np.float32, shape=(rows, dimensions)
+    )
+    fields = ["name", "description", "industry", "size", "location", "content"]
+    payload = {name: [] for name in fields + ["created_at"]}
+    created_at = datetime.datetime(2024, 1, 1)
+
+    batch = []
+    for row, company in enumerate(generate_companies(rows, seed)):
+        for name in fields:
+            payload[name].append(company[name])
+        payload["created_at"].append((created_at + datetime.timedelta(seconds=row)).isoformat())
+        batch.append(company["content"])
+        if len(batch) == EMBED_BATCH_SIZE or row == rows - 1:
+            start = row + 1 - len(batch)
+            embeddings[start:row + 1] = encoder.embed_multiple(batch, dimensions)
+            batch = []
+            logger.info(f"Generated {row + 1}/{rows} companies")
+
+    embeddings.flush()
+    del embeddings
+    np.save(os.path.join(path, "ids.npy"), np.arange(1, rows + 1, dtype=np.int64))
+    with gzip.open(os.path.join(path, "payload.json.gz"), "wt", encoding="utf-8") as f:
+        json.dump(payload, f)
+    with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "format_version": SNAPSHOT_FORMAT_VERSION,
+                "count": rows,
+                "dimensions": dimensions,
+                "dtype": "float32",
+                "embedding_backend": "hashing",
+                "embedding_model": "hashing",
+                "created_at": datetime.datetime.utcnow().isoformat(),
+                "synthetic_seed": seed,
+            },
+            f,
+            indent=2,
+        )
+    logger.info(f"Synthetic corpus of {rows} companies written to {path}")
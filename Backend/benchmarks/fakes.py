@@ -0,0 +1,269 @@
+"""
+Deterministic local stand-ins for the external providers.
+
+`install_fakes()` must run before any `services`/`api` module is imported: it
+replaces the client classes in the `groq`, `openai`, `pinecone` and
+`qdrant_client` packages, so the application code binds to the fakes when it
+does `from openai import OpenAI` and friends.
+"""
+
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from services.local_embedding import HashingEmbeddingBackend
+
+
+class InjectedFault(RuntimeError):
+    """Raised by a fake provider when error injection triggers."""
+
+
+@dataclass
+class FaultProfile:
+    """
+    Latency and error injection for one provider.
+
+    Attributes:
+        latency_ms: Base latency added to every call
+        jitter_ms: Uniform random jitter added on top of the base latency
+        error_rate: Probability (0-1) of raising `InjectedFault`
+    """
+
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    seed: int = 0
+    _random: random.Random = field(init=False, repr=False)
+    _lock: threading.Lock = field(init=False, repr=False, default_factory=threading.Lock)
+
+    def __post_init__(self):
+        self._random = random.Random(self.seed)
+
+    def apply(self, provider: str) -> None:
+        with self._lock:
+            delay = self.latency_ms + self._random.uniform(0, self.jitter_ms)
+            fail = self._random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if fail:
+            raise InjectedFault(f"Injected {provider} failure")
+
+
+@dataclass
+class FakeProfiles:
+    """Fault profiles for every faked provider."""
+
+    llm: FaultProfile = field(default_factory=FaultProfile)
+    embedding: FaultProfile = field(default_factory=FaultProfile)
+    pinecone: FaultProfile = field(default_factory=FaultProfile)
+
+
+PROFILES = FakeProfiles()
+_encoder = HashingEmbeddingBackend()
+
+
+# Chat completions (Groq / OpenAI share the same response shape)
+
+@dataclass
+class _Function:
+    name: str
+    arguments: str
+
+
+@dataclass
+class _ToolCall:
+    id: str
+    function: _Function
+    type: str = "function"
+
+    def model_dump(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "type": self.type,
+            "function": {"name": self.function.name, "arguments": self.function.arguments},
+        }
+
+
+@dataclass
+class _Message:
+    content: Optional[str]
+    tool_calls: Optional[List[_ToolCall]] = None
+    role: str = "assistant"
+
+
+@dataclass
+class _Choice:
+    message: _Message
+    finish_reason: str = "stop"
+    index: int = 0
+
+
+@dataclass
+class _Usage:
+    prompt_tokens: int
+    completion_tokens: int
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+@dataclass
+class _Completion:
+    choices: List[_Choice]
+    usage: _Usage
+    model: str
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class _FakeChatCompletions:
+    def __init__(self, provider: str):
+        self.provider = provider
+
+    def create(self, model: str, messages: List[Dict[str, Any]], **kwargs) -> _Completion:
+        """
+        First turn: calls `search_companies` with the user query.
+        After a tool result: answers with a short summary of it.
+        """
+        PROFILES.llm.apply(self.provider)
+        prompt_tokens = sum(_approx_tokens(str(m.get("content") or "")) for m in messages)
+        last = messages[-1]
+        if last["role"] == "user" and kwargs.get("tools"):
+            call_id = f"call_{len(messages)}"
+            message = _Message(
+                content=None,
+                tool_calls=[
+                    _ToolCall(
+                        id=call_id,
+                        function=_Function(
+                            name="search_companies",
+                            arguments=json.dumps({"search_query": last["content"]}),
+                        ),
+                    )
+                ],
+            )
+            finish_reason = "tool_calls"
+        else:
+            lines = str(last.get("content") or "").splitlines()[1:4]
+            message = _Message(content="**Companies found**\n" + "\n".join(f"- {line}" for line in lines))
+            finish_reason = "stop"
+        usage = _Usage(prompt_tokens, _approx_tokens(message.content or "") + 10)
+        return _Completion(choices=[_Choice(message, finish_reason)], usage=usage, model=model)
+
+
+class _FakeChat:
+    def __init__(self, provider: str):
+        self.completions = _FakeChatCompletions(provider)
+
+
+class FakeGroq:
+    def __init__(self, *args, **kwargs):
+        self.chat = _FakeChat("groq")
+
+    def with_options(self, **kwargs):
+        """Per-request options (timeout, max_retries), the fault profiles set the latency"""
+        return self
+
+
+# Embeddings
+
+@dataclass
+class _EmbeddingItem:
+    embedding: List[float]
+    index: int
+
+
+@dataclass
+class _EmbeddingResponse:
+    data: List[_EmbeddingItem]
+
+
+class _FakeEmbeddings:
+    def create(self, input: List[str], model: str, dimensions: int = 1536, **kwargs):  # pylint: disable=redefined-builtin
+        PROFILES.embedding.apply("openai")
+        vectors = _encoder.encode_batch(list(input), dimensions)
+        return _EmbeddingResponse([_EmbeddingItem(v.tolist(), i) for i, v in enumerate(vectors)])
+
+
+class FakeOpenAI:
+    def __init__(self, *args, **kwargs):
+        self.chat = _FakeChat("openai")
+        self.embeddings = _FakeEmbeddings()
+
+    def with_options(self, **kwargs):
+        """Per-request options (timeout, max_retries), the fault profiles set the latency"""
+        return self
+
+
+class _PineconeEmbeddings:
+    def __init__(self, data):
+        self.data = data
+
+
+class _FakeInference:
+    # multilingual-e5-large produces 1024-d vectors
+    dimensions = 1024
+
+    def embed(self, model: str, inputs: List[str], parameters: Dict[str, Any] = None):
+        PROFILES.pinecone.apply("pinecone")
+        vectors = _encoder.encode_batch(list(inputs), self.dimensions)
+        return _PineconeEmbeddings([{"values": v.tolist()} for v in vectors])
+
+
+class FakePinecone:
+    def __init__(self, *args, **kwargs):
+        self.inference = _FakeInference()
+
+
+# Qdrant: the real client in local, in-memory mode shared by every searcher
+
+_qdrant_client = None
+_qdrant_client_class = None
+_qdrant_lock = threading.Lock()
+
+
+def _local_qdrant_client(*args, **kwargs):
+    global _qdrant_client  # pylint: disable=global-statement
+    with _qdrant_lock:
+        if _qdrant_client is None:
+            _qdrant_client = _qdrant_client_class(location=":memory:")
+        return _qdrant_client
+
+
+def install_fakes(profiles: Optional[FakeProfiles] = None, fake_qdrant: bool = True) -> FakeProfiles:
+    """
+    Replaces the provider clients with the fakes. Must be called before the
+    application modules are imported.
+
+    Args:
+        profiles: Latency / error injection per provider
+        fake_qdrant: Use Qdrant's in-memory local mode instead of QDRANT_URL
+
+    Returns:
+        FakeProfiles: the active profiles, can be tuned between runs
+    """
+    import groq  # pylint: disable=import-outside-toplevel
+    import openai  # pylint: disable=import-outside-toplevel
+    import pinecone  # pylint: disable=import-outside-toplevel
+
+    if profiles is not None:
+        PROFILES.llm = profiles.llm
+        PROFILES.embedding = profiles.embedding
+        PROFILES.pinecone = profiles.pinecone
+
+    groq.Groq = FakeGroq
+    openai.OpenAI = FakeOpenAI
+    pinecone.Pinecone = FakePinecone
+    if fake_qdrant:
+        global _qdrant_client_class  # pylint: disable=global-statement
+        import qdrant_client  # pylint: disable=import-outside-toplevel
+        if _qdrant_client_class is None:
+            _qdrant_client_class = qdrant_client.QdrantClient
+        qdrant_client.QdrantClient = _local_qdrant_client
+    return PROFILES
@@ -0,0 +1,139 @@
+"""
+Async load driver for the FastAPI app.
+
+Requests are sent either in-process through `httpx.ASGITransport` or to a running
+server. Latencies are aggregated per endpoint, and per stage from the
+`Server-Timing` header emitted by the app.
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+
+@dataclass
+class Scenario:
+    """
+    One kind of request in the load mix.
+
+    Attributes:
+        name: Label used in the report
+        method: HTTP method
+        path: Request path
+        body: Builds the JSON body for the i-th request (None for no body)
+        weight: Relative frequency in the mix
+    """
+
+    name: str
+    method: str
+    path: str
+    body: Optional[Callable[[int], Any]] = None
+    weight: float = 1.0
+
+
+@dataclass
+class Samples:
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    stages: Dict[str, List[float]] = field(default_factory=dict)
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """Parses `stage;dur=12.3, other;dur=4.5` into seconds per stage."""
+    stages = {}
+    for entry in header.split(","):
+        parts = [part.strip() for part in entry.split(";")]
+        if not parts[0]:
+            continue
+        for part in parts[1:]:
+            if part.startswith("dur="):
+                stages[parts[0]] = float(part[4:]) / 1000
+    return stages
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    p50, p95, p99 = np.percentile(np.array(values), [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    scenarios: List[Scenario],
+    requests: int,
+    concurrency: int,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Sends `requests` requests drawn from the weighted `scenarios` mix with at
+    most `concurrency` in flight, and returns the aggregated report.
+    """
+    rng = random.Random(seed)
+    plan = rng.choices(scenarios, weights=[s.weight for s in scenarios], k=requests)
+    samples = {scenario.name: Samples() for scenario in scenarios}
+    queue: asyncio.Queue = asyncio.Queue()
+    for i, scenario in enumerate(plan):
+        queue.put_nowait((i, scenario))
+
+    async def worker():
+        while True:
+            try:
+                i, scenario = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            sample = samples[scenario.name]
+            body = scenario.body(i) if scenario.body else None
+            start = time.perf_counter()
+            try:
+                response = await client.request(scenario.method, scenario.path, json=body)
+                elapsed = time.perf_counter() - start
+                if response.status_code >= 400:
+                    sample.errors += 1
+                    continue
+                sample.latencies.append(elapsed)
+                for stage, duration in parse_server_timing(response.headers.get("server-timing", "")).items():
+                    sample.stages.setdefault(stage, []).append(duration)
+            except httpx.HTTPError:
+                sample.errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall_time = time.perf_counter() - started
+
+    report = {"requests": requests, "concurrency": concurrency, "wall_time": wall_time, "endpoints": {}}
+    for name, sample in samples.items():
+        report["endpoints"][name] = {
+            "count": len(sample.latencies),
+            "errors": sample.errors,
+            "throughput": len(sample.latencies) / wall_time if wall_time else 0.0,
+            "latency": percentiles(sample.latencies),
+            "stages": {stage: percentiles(values) for stage, values in sorted(sample.stages.items())},
+        }
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Renders the report as a plain text table (latencies in milliseconds)."""
+    lines = [
+        f"{report['requests']} requests, concurrency {report['concurrency']}, "
+        f"wall time {report['wall_time']:.2f}s",
+        f"{'endpoint / stage':<40} {'count':>7} {'err':>5} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9}",
+    ]
+    for name, endpoint in report["endpoints"].items():
+        latency = endpoint["latency"]
+        lines.append(
+            f"{name:<40} {endpoint['count']:>7} {endpoint['errors']:>5} {endpoint['throughput']:>8.1f} "
+            f"{latency['p50'] * 1000:>9.2f} {latency['p95'] * 1000:>9.2f} {latency['p99'] * 1000:>9.2f}"
+        )
+        for stage, values in endpoint["stages"].items():
+            lines.append(
+                f"  {stage:<38} {'':>7} {'':>5} {'':>8} "
+                f"{values['p50'] * 1000:>9.2f} {values['p95'] * 1000:>9.2f} {values['p99'] * 1000:>9.2f}"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,222 @@
+"""
+Recall and latency of full versus coarse-to-fine (Matryoshka) vector search.
+
+The ground truth is the exact top-k by full-vector cosine similarity, computed
+with NumPy over a snapshot. Both search modes are run against one target:
+
+    flat      in-process exhaustive search, isolates the effect of truncation and
+              rescoring on recall (no service needed)
+    postgres  PostgresSearcher vector query, snapshot imported with scripts/snapshot.py
+    qdrant    QdrantSearcher, snapshot uploaded into both collection layouts
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from benchmarks.corpus import generate_queries
+from benchmarks.load import percentiles
+from config.main import config
+from services.local_embedding import HashingEmbeddingBackend
+from services.metrics import start_request_timings
+
+logger = logging.getLogger(__name__)
+
+MODES = ["full", "coarse"]
+GROUND_TRUTH_BLOCK_ROWS = 65536
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def load_corpus(path: str):
+    """Reads the manifest, ids and memory-mapped embeddings of a snapshot directory."""
+    with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    ids = np.load(os.path.join(path, "ids.npy"))
+    embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+    return manifest, ids, embeddings
+
+
+def query_vectors(manifest: dict, embeddings: np.ndarray, count: int, seed: int) -> np.ndarray:
+    """
+    Synthetic corpora are queried with generated queries embedded by the same
+    hashing encoder; other snapshots with a sample of their own rows.
+    """
+    if manifest.get("embedding_backend") == "hashing":
+        queries = generate_queries(count, seed)
+        return normalize(HashingEmbeddingBackend().embed_multiple(queries, embeddings.shape[1]))
+    rows = np.sort(np.random.default_rng(seed).choice(len(embeddings), size=count, replace=False))
+    return normalize(embeddings[rows])
+
+
+def exact_top(embeddings: np.ndarray, queries: np.ndarray, top: int) -> np.ndarray:
+    """Row indices of the exact `top` neighbours of every query, scanned in blocks."""
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    for start in range(0, len(embeddings), GROUND_TRUTH_BLOCK_ROWS):
+        block = normalize(embeddings[start:start + GROUND_TRUTH_BLOCK_ROWS])
+        scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+        rows = np.concatenate(
+            [best_rows, np.broadcast_to(np.arange(start, start + len(block)), (len(queries), len(block)))],
+            axis=1,
+        )
+        keep = np.argpartition(-scores, min(top, scores.shape[1]) - 1, axis=1)[:, :top]
+        best_scores = np.take_along_axis(scores, keep, axis=1)
+        best_rows = np.take_along_axis(rows, keep, axis=1)
+    return best_rows
+
+
+class FlatTarget:
+    """Exhaustive in-process search over the full or the truncated matrix."""
+
+    stage = None
+
+    def __init__(self, ids: np.ndarray, embeddings: np.ndarray, rescore_depth: int):
+        self.ids = ids
+        self.full = normalize(embeddings)
+        self.coarse = normalize(self.full[:, :config.COARSE_DIMENSIONS])
+        self.rescore_depth = rescore_depth
+
+    def search(self, query: np.ndarray, top: int, mode: str) -> List[int]:
+        if mode == "full":
+            scores = self.full @ query
+            candidates = np.argpartition(-scores, top - 1)[:top]
+        else:
+            depth = min(max(self.rescore_depth, top), len(self.coarse))
+            coarse_scores = self.coarse @ normalize(query[:config.COARSE_DIMENSIONS])
+            candidates = np.argpartition(-coarse_scores, depth - 1)[:depth]
+            rescored = self.full[candidates] @ query
+            candidates = candidates[np.argpartition(-rescored, top - 1)[:top]]
+        return self.ids[candidates].tolist()
+
+    def index_bytes(self, mode: str) -> int:
+        return (self.full if mode == "full" else self.coarse).nbytes
+
+
+class PostgresTarget:
+    """PostgresSearcher vector-only query, the hydration of the rows is not timed."""
+
+    stage = "postgres.vector_query"
+
+    def __init__(self):
+        # Imported lazily, importing the models connects to the database
+        from models.company import Company, index_ada002, index_coarse  # pylint: disable=import-outside-toplevel
+        from services.postgres_searcher import PostgresSearcher  # pylint: disable=import-outside-toplevel
+
+        self.searcher = PostgresSearcher(Company)
+        self.indexes = {"full": index_ada002.name, "coarse": index_coarse.name}
+
+    def search(self, query: np.ndarray, top: int, mode: str) -> List[int]:
+        return [item.id for item in self.searcher.search(None, query.tolist(), top, mode=mode)]
+
+    def index_bytes(self, mode: str) -> int:
+        from sqlalchemy import text  # pylint: disable=import-outside-toplevel
+        from models.database import get_db_session  # pylint: disable=import-outside-toplevel
+
+        with get_db_session() as session:
+            return session.execute(
+                text("SELECT pg_relation_size(CAST(:name AS regclass))"), {"name": self.indexes[mode]}
+            ).scalar() or 0
+
+
+class QdrantTarget:
+    """
+    QdrantSearcher in both collection layouts. Index memory is estimated from the
+    vectors Qdrant keeps in RAM: all of them in full mode, the truncated ones in
+    coarse mode (the full vectors are on disk).
+    """
+
+    stage = "qdrant.search"
+
+    def __init__(self, dimensions: int):
+        from models.company import Company  # pylint: disable=import-outside-toplevel
+        from services.qdrant_searcher import QdrantSearcher  # pylint: disable=import-outside-toplevel
+
+        self.dimensions = dimensions
+        self.searchers = {mode: QdrantSearcher(Company, dimensions, mode=mode) for mode in MODES}
+
+    def search(self, query: np.ndarray, top: int, mode: str) -> List[int]:
+        return [company.id for company in self.searchers[mode].search(query.tolist(), top)]
+
+    def index_bytes(self, mode: str) -> int:
+        searcher = self.searchers[mode]
+        points = searcher.client.count(searcher.collection_name, exact=True).count
+        dimensions = self.dimensions if mode == "full" else config.COARSE_DIMENSIONS
+        return points * dimensions * 4
+
+
+def tie_aware_recall(embeddings: np.ndarray, query: np.ndarray, expected: np.ndarray, found: List[int], top: int) -> float:
+    """
+    Share of the exact top that was found. A result scoring as high as the k-th
+    exact neighbour counts as a hit, synthetic corpora contain many exact ties.
+    """
+    threshold = (normalize(embeddings[np.sort(expected)]) @ query).min() - 1e-5
+    if not found:
+        return 0.0
+    scores = normalize(embeddings[np.sort(found)]) @ query
+    return min(int((scores >= threshold).sum()), top) / top
+
+
+def run_search_benchmark(
+    target, ids: np.ndarray, embeddings: np.ndarray, queries: np.ndarray, truth: np.ndarray, top: int
+) -> Dict[str, Any]:
+    """
+    Runs every query in both modes and returns recall@top, latency percentiles
+    and index size per mode.
+    """
+    # MMR would change the result sets, recall is measured on the raw ranking
+    config.MMR_LAMBDA = None
+    rows_by_id = {int(company_id): row for row, company_id in enumerate(ids)}
+    report = {"queries": len(queries), "top": top, "rescore_depth": config.COARSE_RESCORE_DEPTH, "modes": {}}
+    for mode in MODES:
+        for query in queries[:5]:
+            target.search(query, top, mode)
+
+        latencies, recalls = [], []
+        for query, expected in zip(queries, truth):
+            timings = start_request_timings()
+            start = time.perf_counter()
+            found = target.search(query, top, mode)
+            elapsed = time.perf_counter() - start
+            if target.stage is not None:
+                elapsed = sum(duration for stage, duration in timings if stage == target.stage)
+            latencies.append(elapsed)
+            recalls.append(tie_aware_recall(embeddings, query, expected, [rows_by_id[i] for i in found], top))
+        report["modes"][mode] = {
+            "recall": float(np.mean(recalls)),
+            "latency": percentiles(latencies),
+            "index_bytes": int(target.index_bytes(mode)),
+        }
+        logger.info(f"{mode}: {report['modes'][mode]}")
+
+    full, coarse = report["modes"]["full"], report["modes"]["coarse"]
+    report["latency_speedup"] = full["latency"]["p50"] / coarse["latency"]["p50"] if coarse["latency"]["p50"] else 0.0
+    report["index_reduction"] = full["index_bytes"] / coarse["index_bytes"] if coarse["index_bytes"] else 0.0
+    return report
+
+
+def format_search_report(report: Dict[str, Any]) -> str:
+    """Renders the report as a plain text table (latencies in milliseconds)."""
+    lines = [
+        f"{report['queries']} queries, recall@{report['top']}, rescore depth {report['rescore_depth']}",
+        f"{'mode':<10} {'recall':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'index MiB':>11}",
+    ]
+    for mode, values in report["modes"].items():
+        latency = values["latency"]
+        lines.append(
+            f"{mode:<10} {values['recall']:>8.4f} {latency['p50'] * 1000:>9.3f} {latency['p95'] * 1000:>9.3f} "
+            f"{latency['p99'] * 1000:>9.3f} {values['index_bytes'] / 2 ** 20:>11.1f}"
+        )
+    lines.append(
+        f"full/coarse: {report['latency_speedup']:.2f}x p50 latency, {report['index_reduction']:.2f}x index size"
+    )
+    return "\n".join(lines)
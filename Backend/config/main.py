@@ -21,15 +21,137 @@ class Config(object):
     QDRANT_API_KEY: str = os.getenv("QDRANT_API_KEY")
     QDRANT_URL: str = os.getenv("QDRANT_URL", "http://localhost:6333")  
     QDRANT_COLLECTION_NAME: str = os.getenv("QDRANT_COLLECTION_NAME", "companies")
+
+    # Search backend used by the ChatService: "qdrant", "postgres" or "numpy"
+    SEARCH_BACKEND: str = os.getenv("SEARCH_BACKEND", "qdrant")
+
+    # Vector search mode: "full" searches the full embeddings, "coarse" runs the ANN
+    # pass on the leading COARSE_DIMENSIONS (Matryoshka truncation) and rescores the
+    # best COARSE_RESCORE_DEPTH candidates against the full vectors. "coarse" is
+    # experimental and refused with the remote embedding backend (Pinecone e5 first)
+    SEARCH_MODE: str = os.getenv("SEARCH_MODE", "full")
+    COARSE_DIMENSIONS: int = int(os.getenv("COARSE_DIMENSIONS", 256))
+    COARSE_RESCORE_DEPTH: int = int(os.getenv("COARSE_RESCORE_DEPTH", 200))
+    # Models trained for truncation (Matryoshka), the only ones coarse mode accepts.
+    # ONNX models are matched by their directory name
+    MATRYOSHKA_MODELS: str = os.getenv(
+        "MATRYOSHKA_MODELS",
+        "text-embedding-3-small,text-embedding-3-large,nomic-embed-text-v1.5,mxbai-embed-large-v1",
+    )
+
+    # Hybrid search (PostgresSearcher): each leg fetches HYBRID_DEPTH_FACTOR times the
+    # results kept, within [HYBRID_MIN_DEPTH, HYBRID_MAX_DEPTH]; with filters the HNSW
+    # scan is widened HYBRID_FILTER_FACTOR times since it filters after the scan.
+    # The legs are fused by weighted reciprocal rank, weight / (HYBRID_RRF_K + rank)
+    HYBRID_DEPTH_FACTOR: int = int(os.getenv("HYBRID_DEPTH_FACTOR", 4))
+    HYBRID_MIN_DEPTH: int = int(os.getenv("HYBRID_MIN_DEPTH", 20))
+    HYBRID_MAX_DEPTH: int = int(os.getenv("HYBRID_MAX_DEPTH", 400))
+    HYBRID_FILTER_FACTOR: int = int(os.getenv("HYBRID_FILTER_FACTOR", 4))
+    HYBRID_RRF_K: int = int(os.getenv("HYBRID_RRF_K", 60))
+    HYBRID_VECTOR_WEIGHT: float = float(os.getenv("HYBRID_VECTOR_WEIGHT", 1.0))
+    HYBRID_TEXT_WEIGHT: float = float(os.getenv("HYBRID_TEXT_WEIGHT", 1.0))
+
+    # Seconds between checks of the active search index (embedding model and
+    # dimensions), switched by scripts/reindex.py
+    SEARCH_INDEX_CHECK_SECONDS: float = float(os.getenv("SEARCH_INDEX_CHECK_SECONDS", 5))
+
+    # In-process numpy searcher configuration
+    NUMPY_INDEX_DIR: str = os.getenv("NUMPY_INDEX_DIR", "data/numpy_index")
+    NUMPY_INDEX_DTYPE: str = os.getenv("NUMPY_INDEX_DTYPE", "float32")
+    NUMPY_INDEX_REFRESH_SECONDS: int = int(os.getenv("NUMPY_INDEX_REFRESH_SECONDS", 60))
+    # Writes append delta segments; once their rows exceed this fraction of the
+    # generation's (or there are more segments than the maximum) the index is
+    # compacted into a new generation
+    NUMPY_INDEX_COMPACT_RATIO: float = float(os.getenv("NUMPY_INDEX_COMPACT_RATIO", 0.1))
+    NUMPY_INDEX_MAX_SEGMENTS: int = int(os.getenv("NUMPY_INDEX_MAX_SEGMENTS", 32))
+
+    # Embedding Configuration
+    # "remote" uses Pinecone with OpenAI fallback, "hashing" and "onnx" run in-process
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "remote")
+    EMBEDDING_MODEL_PATH: str = os.getenv("EMBEDDING_MODEL_PATH")
+    EMBEDDING_MAX_TOKENS: int = int(os.getenv("EMBEDDING_MAX_TOKENS", 256))
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+    EMBEDDING_WORKERS: int = int(os.getenv("EMBEDDING_WORKERS", 4))
+
+    # Maximum number of companies in one bulk create / update / delete request
+    BULK_MAX_ITEMS: int = int(os.getenv("BULK_MAX_ITEMS", 1000))
     
+    # Token budget of the search_companies tool result, in total and per company
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1200))
+    CONTEXT_COMPANY_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_COMPANY_TOKEN_BUDGET", 120))
+
+    # Seconds a chat completion stays in the completion cache, 0 disables it
+    LLM_CACHE_TTL: int = int(os.getenv("LLM_CACHE_TTL", 86400))
+
+    # Deadline of a /search-company request in seconds, 0 disables it. The LLM is only
+    # called with DEADLINE_LLM_MIN_SECONDS left, otherwise the ranked companies are
+    # returned without a summary. The vector leg has to finish
+    # DEADLINE_FULLTEXT_RESERVE_SECONDS before the deadline, that time is left for
+    # falling back to full-text results
+    SEARCH_DEADLINE_SECONDS: float = float(os.getenv("SEARCH_DEADLINE_SECONDS", 8))
+    DEADLINE_LLM_MIN_SECONDS: float = float(os.getenv("DEADLINE_LLM_MIN_SECONDS", 1.5))
+    DEADLINE_FULLTEXT_RESERVE_SECONDS: float = float(os.getenv("DEADLINE_FULLTEXT_RESERVE_SECONDS", 0.5))
+
+    # Popular-query cache warming: /search-company requests are counted per day and kept
+    # for POPULAR_QUERY_DAYS (POPULAR_QUERY_KEEP queries a day). At startup and once the
+    # cache namespace settles after an invalidation (checked every CACHE_WARM_CHECK_SECONDS),
+    # the CACHE_WARM_TOP_N most frequent are recomputed, CACHE_WARM_CONCURRENCY at a time.
+    # CACHE_WARM_TOP_N=0 disables warming
+    CACHE_WARM_TOP_N: int = int(os.getenv("CACHE_WARM_TOP_N", 50))
+    CACHE_WARM_CONCURRENCY: int = int(os.getenv("CACHE_WARM_CONCURRENCY", 4))
+    CACHE_WARM_CHECK_SECONDS: float = float(os.getenv("CACHE_WARM_CHECK_SECONDS", 5))
+    POPULAR_QUERY_DAYS: int = int(os.getenv("POPULAR_QUERY_DAYS", 3))
+    POPULAR_QUERY_KEEP: int = int(os.getenv("POPULAR_QUERY_KEEP", 10000))
+
+    # Seconds the facet counts live before they are aggregated from the table again,
+    # bounding the drift left by writes that bypass the API (0 keeps them until invalidated)
+    FACET_COUNTS_TTL: int = int(os.getenv("FACET_COUNTS_TTL", 3600))
+
+    # Conversation sessions: lifetime in seconds and size of the candidate pool kept for refinements.
+    # The last SESSION_HISTORY_TURNS turns are kept, only the latest with its tool calls and results
+    SESSION_TTL: int = int(os.getenv("SESSION_TTL", 1800))
+    SESSION_CANDIDATE_POOL: int = int(os.getenv("SESSION_CANDIDATE_POOL", 20))
+    SESSION_HISTORY_TURNS: int = int(os.getenv("SESSION_HISTORY_TURNS", 6))
+
+    # MMR diversity re-ranking: default lambda (unset disables it), candidates
+    # over-fetched per query and time budget of the selection loop in milliseconds
+    MMR_LAMBDA: float = float(os.getenv("MMR_LAMBDA")) if os.getenv("MMR_LAMBDA") else None
+    MMR_FETCH_K: int = int(os.getenv("MMR_FETCH_K", 30))
+    MMR_BUDGET_MS: float = float(os.getenv("MMR_BUDGET_MS", 5))
+
     DATABASE_NAME: str = os.getenv("DATABASE_NAME", "postgres")
     DATABASE_USER: str = os.getenv("DATABASE_USER", "postgres")
     DATABASE_PASSWORD: str = os.getenv("DATABASE_PASSWORD", "postgres")
     DATABASE_URL: str = os.getenv("DATABASE_URL", "localhost")
     DATABASE_PORT: str = os.getenv("DATABASE_PORT", "5432")
     SQLALCHEMY_DATABASE_URL: str = f"postgresql://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_URL}:{DATABASE_PORT}/{DATABASE_NAME}"
+    # Comma separated SQLAlchemy URLs of read replicas, reads go to the primary when empty
+    DATABASE_READ_URLS: list = [url.strip() for url in os.getenv("DATABASE_READ_URLS", "").split(",") if url.strip()]
+
+    # Connection pools, the read settings apply to every replica
+    DATABASE_POOL_SIZE: int = int(os.getenv("DATABASE_POOL_SIZE", 5))
+    DATABASE_MAX_OVERFLOW: int = int(os.getenv("DATABASE_MAX_OVERFLOW", 10))
+    DATABASE_READ_POOL_SIZE: int = int(os.getenv("DATABASE_READ_POOL_SIZE", 10))
+    DATABASE_READ_MAX_OVERFLOW: int = int(os.getenv("DATABASE_READ_MAX_OVERFLOW", 20))
+    DATABASE_POOL_TIMEOUT: int = int(os.getenv("DATABASE_POOL_TIMEOUT", 30))
+    DATABASE_POOL_RECYCLE: int = int(os.getenv("DATABASE_POOL_RECYCLE", 3600))
+
+    # Statement timeouts in milliseconds, 0 disables them
+    DATABASE_STATEMENT_TIMEOUT_MS: int = int(os.getenv("DATABASE_STATEMENT_TIMEOUT_MS", 0))
+    DATABASE_READ_STATEMENT_TIMEOUT_MS: int = int(os.getenv("DATABASE_READ_STATEMENT_TIMEOUT_MS", 5000))
+
+    # Executions of a statement on one connection before psycopg prepares it server side
+    # (psycopg's default of 5). The search statements are prepared on their first execution.
+    # -1 disables prepared statements (e.g. behind PgBouncer in transaction pooling mode)
+    DATABASE_PREPARE_THRESHOLD: int = int(os.getenv("DATABASE_PREPARE_THRESHOLD", 5))
+
+    # Replica health checks: interval and maximum replication lag before a replica is skipped
+    DATABASE_REPLICA_CHECK_SECONDS: int = int(os.getenv("DATABASE_REPLICA_CHECK_SECONDS", 5))
+    DATABASE_REPLICA_MAX_LAG_SECONDS: float = float(os.getenv("DATABASE_REPLICA_MAX_LAG_SECONDS", 10))
     REDIS_HOST: str = os.getenv("REDIS_HOST", "redis")
     REDIS_PORT: int = int(os.getenv("REDIS_PORT", 6379))
+    # Connect and read timeout of Redis commands in seconds, a slow Redis is a cache miss
+    REDIS_TIMEOUT_SECONDS: float = float(os.getenv("REDIS_TIMEOUT_SECONDS", 1))
 
 
 config = Config()
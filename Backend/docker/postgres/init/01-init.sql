@@ -1,6 +1,15 @@
 -- Create the vector extension
 CREATE EXTENSION IF NOT EXISTS vector;
 
+-- Trigram matching for company-name autocomplete
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- The Company table and its indexes (HNSW, coarse HNSW, name trigram, content
+-- full-text) are created together by the backend on this fresh database. A table
+-- created by an older version is migrated with
+-- `python scripts/build_coarse_index.py --target postgres`, which builds the
+-- missing ones with CREATE INDEX CONCURRENTLY instead of locking the table.
+
 -- Create the HNSW access method (wrapped in DO block to handle if exists)
 DO $$
 BEGIN
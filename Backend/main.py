@@ -2,16 +2,28 @@
     The entry file for the FastAPI application.
 """
 import logging
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
-from api.router import api_router
+from api.router import api_router, cache_warmer
+from services.metrics import server_timing_header, start_request_timings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 logger.info("This is an info message.")
 
-app = FastAPI(title="Hybrid Search with Postgres", debug=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warms the cached results of popular searches in the background."""
+    cache_warmer.start()
+    yield
+    await cache_warmer.stop()
+
+
+app = FastAPI(title="Hybrid Search with Postgres", debug=True, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,4 +33,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def add_server_timing(request: Request, call_next):
+    """Collects the stage timings of the request into a `Server-Timing` header."""
+    timings = start_request_timings()
+    start = time.perf_counter()
+    response = await call_next(request)
+    timings.append(("total", time.perf_counter() - start))
+    response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+
 app.include_router(api_router)
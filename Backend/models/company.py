@@ -1,10 +1,38 @@
 from __future__ import annotations
 import datetime
+import numpy as np
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import Index, Column, Integer, String, DateTime, Text
+from pgvector.utils import Vector as VectorValue
+from sqlalchemy import DDL, Index, Column, Integer, String, DateTime, Text, event, func, inspect, text
+from config.main import config
 from models.database import engine
 from models import Base
 
+
+def truncate_embedding(vector, dimensions: int = None) -> list[float]:
+    """
+    Matryoshka truncation: keeps the leading `dimensions` of `vector` and re-normalizes
+    them, which is what text-embedding-3 returns when asked for fewer dimensions.
+    """
+    truncated = np.asarray(vector, dtype=np.float32)[: dimensions or config.COARSE_DIMENSIONS]
+    norm = np.linalg.norm(truncated)
+    return (truncated / norm if norm > 0 else truncated).tolist()
+
+
+class IndexVector(Vector):
+    """
+    Vector column whose dimensions change with re-indexing (scripts/reindex.py).
+    The `vector(n)` type of the live column checks them, not the mapped type.
+    """
+
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        def process(value):
+            return VectorValue._to_db(value)  # pylint: disable=protected-access
+        return process
+
+
 class Company(Base):
     __tablename__ = "Company"
     id = Column(Integer, primary_key=True)
@@ -13,7 +41,9 @@ class Company(Base):
     industry = Column(String)
     size = Column(String)
     location = Column(String)
-    embedding = Column(Vector(1024))
+    embedding = Column(IndexVector(1024))
+    # Truncated copy of `embedding` for the coarse ANN pass, kept in sync on flush
+    embedding_coarse = Column(Vector(config.COARSE_DIMENSIONS))
     content = Column(Text)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
@@ -38,6 +68,17 @@ class Company(Base):
     def get_embedding_field():
         return "embedding"
 
+    @staticmethod
+    def get_coarse_embedding_field():
+        return "embedding_coarse"
+
+
+@event.listens_for(Company, "before_insert")
+@event.listens_for(Company, "before_update")
+def set_coarse_embedding(mapper, connection, target):
+    if target.embedding is not None and inspect(target).attrs.embedding.history.has_changes():
+        target.embedding_coarse = truncate_embedding(target.embedding)
+
 index_ada002 = Index(
     "hnsw_index_for_innerproduct_company_embedding_ada002",
     Company.embedding,
@@ -46,4 +87,30 @@ index_ada002 = Index(
     postgresql_ops={"embedding": "vector_l2_ops"},
 )
 
+index_coarse = Index(
+    "hnsw_index_company_embedding_coarse",
+    Company.embedding_coarse,
+    postgresql_using="hnsw",
+    postgresql_with={"m": 16, "ef_construction": 64},
+    postgresql_ops={"embedding_coarse": "vector_cosine_ops"},
+)
+
+index_name_trgm = Index(
+    "gin_trgm_index_company_name",
+    Company.name,
+    postgresql_using="gin", # trigram index for fuzzy / infix name matching (autocomplete)
+    postgresql_ops={"name": "gin_trgm_ops"},
+)
+
+index_content_tsvector = Index(
+    "gin_index_company_content_tsvector",
+    func.to_tsvector(text("'english'"), Company.content),
+    postgresql_using="gin", # full-text leg of the hybrid search and its match pre-check
+)
+
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+# Creates the table with its indexes on a fresh database. Existing tables are
+# migrated by scripts/build_coarse_index.py (column and indexes built concurrently),
+# not at import, which would lock the table from every process starting up
 Base.metadata.create_all(engine) 
\ No newline at end of file
@@ -1,14 +1,192 @@
 """
 This file is used to create a database connection and session for the application.
+
+PostgreSQL is reached through psycopg 3: query vectors are sent with pgvector's
+binary dumper. Statements executed with the `prepare=True` execution option (the
+search queries) are prepared server side on their first execution on a connection,
+others only once they repeat DATABASE_PREPARE_THRESHOLD times.
+
+Writes go to the primary engine. Sessions opened with the "read" intent are bound
+to one of the healthy read replicas (DATABASE_READ_URLS), round-robin, or to the
+primary when there is none.
 """
 # pylint: disable=missing-function-docstring
-from sqlalchemy import create_engine
+import itertools
+import logging
+import threading
+import time
+
+import psycopg
+from pgvector.psycopg import register_vector
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from config.main import config
+from services.metrics import DB_POOL_CHECKOUTS, DB_POOL_IN_USE, DB_POOL_WAIT, DB_REPLICA_HEALTHY, FALLBACKS
+
+logger = logging.getLogger(__name__)
+
+# Seconds since the last replayed transaction, 0 when the replica has replayed everything it received
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def driver_url(url: str) -> str:
+    """Selects the psycopg 3 driver for plain `postgresql://` URLs."""
+    if url.startswith("postgresql://"):
+        return "postgresql+psycopg://" + url[len("postgresql://"):]
+    return url
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.labels(self._orig_logging_name).observe(time.perf_counter() - start)
+
+
+def create_pooled_engine(url: str, name: str, pool_size: int, max_overflow: int, statement_timeout_ms: int):
+    url = driver_url(url)
+    psycopg_driver = url.startswith("postgresql+psycopg://")
+    connect_args = {}
+    if statement_timeout_ms > 0:
+        connect_args["options"] = f"-c statement_timeout={statement_timeout_ms}"
+    if psycopg_driver:
+        connect_args["prepare_threshold"] = (
+            config.DATABASE_PREPARE_THRESHOLD if config.DATABASE_PREPARE_THRESHOLD >= 0 else None
+        )
+    pooled_engine = create_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=config.DATABASE_POOL_TIMEOUT,
+        pool_recycle=config.DATABASE_POOL_RECYCLE,
+        pool_pre_ping=True,
+        pool_logging_name=name,
+        connect_args=connect_args,
+    )
+
+    if psycopg_driver and config.DATABASE_PREPARE_THRESHOLD >= 0:
+        @event.listens_for(pooled_engine, "do_execute")
+        def do_execute(cursor, statement, parameters, context):
+            if not context.execution_options.get("prepare"):
+                return False
+            cursor.execute(statement, parameters, prepare=True)
+            return True
 
-engine = create_engine(
-    config.SQLALCHEMY_DATABASE_URL, pool_recycle=3600, pool_pre_ping=True
+    if psycopg_driver:
+        @event.listens_for(pooled_engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            try:
+                register_vector(dbapi_connection)
+            except psycopg.ProgrammingError as e:
+                # Fresh database without the extension yet, numpy vectors cannot be bound until it exists
+                logger.warning(f"pgvector types not registered on {name}: {e}")
+
+    @event.listens_for(pooled_engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKOUTS.labels(name).inc()
+        DB_POOL_IN_USE.labels(name).inc()
+
+    @event.listens_for(pooled_engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        DB_POOL_IN_USE.labels(name).dec()
+
+    return pooled_engine
+
+
+class ReplicaSet:
+    """
+    Read replicas with periodic health checks. A replica that cannot be reached
+    or lags more than DATABASE_REPLICA_MAX_LAG_SECONDS is skipped until it recovers.
+    Replicas only get reads once a first check passed, the primary serves them until then.
+    """
+
+    def __init__(self, engines: list, primary):
+        self.engines = engines
+        self.primary = primary
+        self.healthy = [False] * len(engines)
+        self._counter = itertools.count()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def check(self) -> None:
+        for i, replica in enumerate(self.engines):
+            name = replica.pool._orig_logging_name  # pylint: disable=protected-access
+            try:
+                with replica.connect() as connection:
+                    lag = float(connection.execute(text(REPLICA_LAG_QUERY)).scalar() or 0)
+                healthy = lag <= config.DATABASE_REPLICA_MAX_LAG_SECONDS
+                if not healthy:
+                    logger.warning(f"Read replica {name} lags {lag:.1f}s behind the primary")
+            except Exception as e:  # pylint: disable=broad-except
+                logger.warning(f"Read replica {name} failed its health check: {e}")
+                healthy = False
+            if healthy != self.healthy[i]:
+                logger.info(f"Read replica {name} is now {'healthy' if healthy else 'unhealthy'}")
+            self.healthy[i] = healthy
+            DB_REPLICA_HEALTHY.labels(name).set(int(healthy))
+
+    def mark_unhealthy(self, replica) -> None:
+        """Skips `replica` until the next health check passes, e.g. after a failed connection."""
+        name = replica.pool._orig_logging_name  # pylint: disable=protected-access
+        for i, candidate in enumerate(self.engines):
+            if candidate is replica and self.healthy[i]:
+                logger.info(f"Read replica {name} is now unhealthy")
+                self.healthy[i] = False
+                DB_REPLICA_HEALTHY.labels(name).set(0)
+
+    def _run(self) -> None:
+        while True:
+            self.check()
+            time.sleep(config.DATABASE_REPLICA_CHECK_SECONDS)
+
+    def choose(self):
+        """Next healthy replica, or the primary when none is healthy."""
+        if not self.engines:
+            return self.primary
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="replica-health", daemon=True)
+                    self._thread.start()
+        healthy = [replica for replica, ok in zip(self.engines, self.healthy) if ok]
+        if not healthy:
+            FALLBACKS.labels("database", "primary_read").inc()
+            return self.primary
+        return healthy[next(self._counter) % len(healthy)]
+
+
+engine = create_pooled_engine(
+    config.SQLALCHEMY_DATABASE_URL,
+    "primary",
+    config.DATABASE_POOL_SIZE,
+    config.DATABASE_MAX_OVERFLOW,
+    config.DATABASE_STATEMENT_TIMEOUT_MS,
+)
+read_replicas = ReplicaSet(
+    [
+        create_pooled_engine(
+            url,
+            f"replica{i}",
+            config.DATABASE_READ_POOL_SIZE,
+            config.DATABASE_READ_MAX_OVERFLOW,
+            config.DATABASE_READ_STATEMENT_TIMEOUT_MS,
+        )
+        for i, url in enumerate(config.DATABASE_READ_URLS)
+    ],
+    primary=engine,
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -25,8 +203,27 @@ def get_db():
 
 
 class SessionManager:
-    def __init__(self):
-        self.session = SessionLocal()
+    """
+    Session context manager. `intent="read"` binds the session to a read replica,
+    use it only for queries that tolerate replication lag. The replica connection
+    is opened up front, when it fails the session falls back to the primary.
+    """
+
+    def __init__(self, intent: str = "write"):
+        if intent == "read":
+            replica = read_replicas.choose()
+            self.session = SessionLocal(bind=replica)
+            if replica is not engine:
+                try:
+                    self.session.connection()
+                except OperationalError as e:
+                    self.session.close()
+                    read_replicas.mark_unhealthy(replica)
+                    FALLBACKS.labels("database", "primary_read").inc()
+                    logger.warning(f"Read replica unavailable, reading from the primary: {e}")
+                    self.session = SessionLocal()
+        else:
+            self.session = SessionLocal()
         self.session.expire_on_commit = False
 
     def __enter__(self):
@@ -36,5 +233,5 @@ class SessionManager:
         self.session.close()
 
 
-def get_db_session():
-    return SessionManager()
+def get_db_session(intent: str = "write"):
+    return SessionManager(intent)
@@ -0,0 +1,37 @@
+"""
+    This contains the SearchIndex model, the pointer to the active embedding generation.
+"""
+
+import datetime
+from sqlalchemy import Column, DateTime, Integer, String
+from models.database import engine
+from models import Base
+
+
+class SearchIndex(Base):
+    """
+    One row per index name. scripts/reindex.py inserts or updates it in the
+    transaction that swaps the embedding columns. Searches and writes check the
+    generation they embedded with against this row in their own transaction
+    (ActiveIndex.check / verify) and retry with the new model on a mismatch. Without a
+    row the index is generation 1, embedded with EMBEDDING_BACKEND in 1024 dimensions.
+    """
+
+    __tablename__ = "search_index"
+    name = Column(String, primary_key=True)
+    generation = Column(Integer, nullable=False)
+    embedding_backend = Column(String, nullable=False)
+    embedding_model = Column(String, nullable=False)
+    dimensions = Column(Integer, nullable=False)
+    activated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "generation": self.generation,
+            "embedding_backend": self.embedding_backend,
+            "embedding_model": self.embedding_model,
+            "dimensions": self.dimensions,
+        }
+
+
+SearchIndex.__table__.create(bind=engine, checkfirst=True)
@@ -0,0 +1,142 @@
+"""
+    This script backfills the truncated embeddings used by SEARCH_MODE=coarse
+    from the full embeddings already stored, without calling any embedding API.
+
+    PostgreSQL: migrates a table created before these columns and indexes existed
+    (a fresh database gets them with the table): adds Company.embedding_coarse,
+    builds the name trigram and content full-text indexes with CREATE INDEX
+    CONCURRENTLY, fills embedding_coarse in batches (requires pgvector >= 0.7 for
+    subvector/l2_normalize), then builds its HNSW index concurrently. Re-running it
+    skips what exists and rebuilds indexes left invalid by an interrupted build.
+    Qdrant: copies the full-mode collection into the coarse-mode collection
+    `{QDRANT_COLLECTION_NAME}_{COARSE_DIMENSIONS}`.
+
+    Usage:
+        python scripts/build_coarse_index.py --target all
+"""
+
+import argparse
+import logging
+import sys
+sys.path.append(".")
+
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex
+
+from config.main import config
+from models.company import Company, index_coarse, index_content_tsvector, index_name_trgm
+from models.database import engine, get_db_session
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+
+
+def migrate_postgres(lock_timeout: str = "5s"):
+    """Adds the coarse embedding column, a catalog-only change, giving up instead of queueing behind long transactions."""
+    with engine.begin() as connection:
+        connection.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        connection.execute(text(
+            f'ALTER TABLE "{Company.__tablename__}" ADD COLUMN IF NOT EXISTS '
+            f"{Company.get_coarse_embedding_field()} vector({config.COARSE_DIMENSIONS})"
+        ))
+
+
+def create_indexes(indexes: list):
+    """Builds the missing or invalid `indexes` with CREATE INDEX CONCURRENTLY, writes keep flowing."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for index in indexes:
+            valid = connection.execute(
+                text(
+                    "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                    "WHERE c.relname = :name"
+                ),
+                {"name": index.name},
+            ).scalar()
+            if valid:
+                continue
+            if valid is not None:
+                # Left invalid by an interrupted concurrent build
+                connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+            logger.info(f"Building index {index.name} concurrently")
+            ddl = str(CreateIndex(index).compile(dialect=engine.dialect))
+            connection.exec_driver_sql(ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1))
+
+
+def backfill_postgres(batch_size: int = BATCH_SIZE):
+    table_name = Company.__tablename__
+    embedding_field = Company.get_embedding_field()
+    coarse_field = Company.get_coarse_embedding_field()
+    total = 0
+    while True:
+        with get_db_session() as session:
+            updated = session.execute(
+                text(f"""
+                    UPDATE "{table_name}"
+                        SET {coarse_field} = l2_normalize(subvector({embedding_field}, 1, :dimensions))
+                        WHERE id IN (
+                            SELECT id FROM "{table_name}"
+                                WHERE {embedding_field} IS NOT NULL AND {coarse_field} IS NULL
+                                LIMIT :batch_size
+                        )
+                """),
+                {"dimensions": config.COARSE_DIMENSIONS, "batch_size": batch_size},
+            ).rowcount
+            session.commit()
+        if not updated:
+            break
+        total += updated
+        logger.info(f"Backfilled {total} coarse embeddings in PostgreSQL")
+    logger.info(f"PostgreSQL coarse embeddings up to date ({total} rows updated)")
+
+
+def backfill_qdrant(batch_size: int = 256):
+    # Imported lazily so a PostgreSQL-only backfill does not need a reachable Qdrant
+    from qdrant_client.models import PointStruct  # pylint: disable=import-outside-toplevel
+    from services.qdrant_searcher import QdrantSearcher  # pylint: disable=import-outside-toplevel
+
+    source = QdrantSearcher(Company, mode="full")
+    target = QdrantSearcher(Company, mode="coarse")
+    offset = None
+    total = 0
+    while True:
+        records, offset = source.client.scroll(
+            collection_name=source.collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        if records:
+            target.client.upsert(
+                collection_name=target.collection_name,
+                points=[
+                    PointStruct(id=record.id, vector=target.point_vector(record.vector), payload=record.payload)
+                    for record in records
+                ],
+            )
+            total += len(records)
+            logger.info(f"Copied {total} points into {target.collection_name}")
+        if offset is None:
+            break
+    logger.info(f"Qdrant collection {target.collection_name} up to date ({total} points)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Migrate the search columns and indexes and backfill the coarse (truncated) embeddings"
+    )
+    parser.add_argument("--target", choices=["postgres", "qdrant", "all"], default="all")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.target in ("postgres", "all"):
+        migrate_postgres()
+        create_indexes([index_name_trgm, index_content_tsvector])
+        backfill_postgres(args.batch_size)
+        # Built once the rows are filled rather than maintained through the backfill
+        create_indexes([index_coarse])
+    if args.target in ("qdrant", "all"):
+        backfill_qdrant()
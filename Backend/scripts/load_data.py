@@ -3,6 +3,7 @@
     and inserts it into the database.
 """
 
+import asyncio
 import json
 import sys
 import logging
@@ -10,11 +11,12 @@ sys.path.append(".")
 
 from models.company import Company
 from models.database import get_db_session
-from services.embedding import Embedding
+from services.search_index import active_index
+from services.autocomplete import AutocompleteIndex
 from services.chat import ChatService
+from services.facet_service import FacetService
 from services.qdrant_searcher import QdrantSearcher
 
-embedding_service = Embedding()
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
@@ -27,25 +29,32 @@ def load_data():
     with open("scripts/sample_companies.json", "r") as f: #pylint: disable=unspecified-encoding
         data = json.load(f)
         data = data["companies"]
-    with get_db_session() as session:
-        for item in data:
-            company = Company(**item)
-            company.content = company.to_str()
-            
+    companies = []
+    for item in data:
+        company = Company(**item)
+        company.content = company.to_str()
+        companies.append(company)
+
+    # Embed in batches instead of one API call (or encoder run) per company
+    try:
+        logger.info(f"Generating {active_index.current()['embedding_backend']} embeddings for {len(companies)} companies")
+        embeddings = active_index.embed_multiple([c.content for c in companies])
+    except Exception as e:
+        logger.error(f"Error generating batched embeddings: {e}")
+        logger.info("Falling back to one embedding call per company")
+        embeddings = []
+        for company in companies:
             try:
-                logger.info(f"Generating Pinecone embedding for company: {company.name}")
-                company.embedding = embedding_service.generate_pinecone(company.content, 1024)
-                logger.info(f"Successfully generated Pinecone embedding for company: {company.name}")
-            except Exception as e:
-                logger.error(f"Error generating Pinecone embedding: {e}")
-                logger.info(f"Falling back to OpenAI embedding for company: {company.name}")
-                try:
-                    company.embedding = embedding_service.generate(company.content, 1024)
-                except Exception as openai_error:
-                    logger.error(f"Error generating OpenAI embedding: {openai_error}")
-                    logger.error(f"Skipping company: {company.name} due to embedding generation failure")
-                    continue
-                
+                embeddings.append(active_index.embed(company.content))
+            except Exception as single_error:
+                logger.error(f"Skipping company: {company.name} due to embedding generation failure: {single_error}")
+                embeddings.append(None)
+
+    with get_db_session() as session:
+        for company, embedding in zip(companies, embeddings):
+            if embedding is None:
+                continue
+            company.embedding = embedding
             session.add(company)
         session.commit()
         
@@ -58,6 +67,14 @@ def load_data():
                 if company_query:
                     qdrant_searcher.upsert_company(company_query)
 
+    # The companies were added past the API, facet counts are aggregated again on the next
+    # read and every worker reloads its autocomplete index
+    asyncio.run(FacetService().invalidate())
+    asyncio.run(AutocompleteIndex().invalidate())
+    if chat_service.use_numpy:
+        # Rows below the last indexed id may have been rewritten, a delta refresh would miss them
+        chat_service.searcher.refresh(rebuild=True)
+
 
 if __name__ == "__main__":
     load_data()
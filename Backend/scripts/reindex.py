@@ -0,0 +1,707 @@
+"""
+    This script re-indexes the companies with another embedding model or dimension
+    (blue/green): search keeps serving from the current index until the cutover.
+
+    prepare   once per Qdrant deployment, before the first build: copies the
+              served collection to `{collection}_g{generation}`, then replaces it
+              by an alias of the same name pointing at the copy. Re-running it
+              resumes or does nothing.
+    build     adds the shadow columns `embedding_next` / `embedding_coarse_next`,
+              fills them in throttled batches, then builds their HNSW indexes with
+              CREATE INDEX CONCURRENTLY. With --qdrant the vectors are also upserted
+              into a new collection `{collection}_g{generation}`. A trigger clears
+              the shadow vectors of rows whose content changes meanwhile, they are
+              re-embedded by the next pass. Re-running it resumes the build.
+    cutover   catches up with the rows written since, then in one transaction
+              (writes blocked, reads served) embeds the last ones, renames the
+              shadow columns and indexes into place and switches the SearchIndex
+              pointer (generation, model, dimensions). Once that transaction has
+              committed the Qdrant alias is switched and the new collection synced
+              with the rows written meanwhile; if the switch fails the cutover is
+              reverted.
+    cleanup   drops the columns and collections of previous generations, or with
+              --abort the shadow columns of an unfinished build.
+
+    The previous generation stays in place as `embedding_g<n>` (and its Qdrant
+    collection) until cleanup.
+
+    Usage:
+        python scripts/reindex.py prepare
+        python scripts/reindex.py build --backend onnx --dimensions 768 --rows-per-second 200
+        python scripts/reindex.py cutover
+        python scripts/reindex.py cleanup
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+sys.path.append(".")
+
+import numpy as np
+from sqlalchemy import text
+
+from config.main import config
+from models.company import Company, index_ada002, index_coarse, truncate_embedding
+from models.database import engine, get_db_session
+from models.search_index import SearchIndex
+from services.autocomplete import AutocompleteIndex
+from services.company_service import CACHE_NAMESPACE
+from services.embedding import embedding_model_name, is_matryoshka
+from services.redis_service import RedisService
+from services.search_index import active_index
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 256
+TABLE = f'"{Company.__tablename__}"'
+PAYLOAD_FIELDS = ["name", "description", "industry", "size", "location", "content"]
+NEXT_FIELD = "embedding_next"
+NEXT_COARSE_FIELD = "embedding_coarse_next"
+TRIGGER = "company_reindex_invalidate"
+# (served index, served column, shadow column, shadow index)
+INDEXES = [
+    (index_ada002, Company.get_embedding_field(), NEXT_FIELD, "hnsw_index_company_embedding_next"),
+    (index_coarse, Company.get_coarse_embedding_field(), NEXT_COARSE_FIELD, "hnsw_index_company_embedding_coarse_next"),
+]
+# Catch-up passes of the cutover before the final, locked one
+MAX_CATCH_UP_PASSES = 5
+# Attempts at the Qdrant alias switch before the cutover is reverted
+SWITCH_ATTEMPTS = 3
+
+
+def read_build() -> dict:
+    """Build in progress, recorded as the comment of the shadow column."""
+    with get_db_session() as session:
+        comment = session.execute(
+            text(
+                "SELECT col_description(attrelid, attnum) FROM pg_attribute "
+                "WHERE attrelid = CAST(:table AS regclass) AND attname = :column AND NOT attisdropped"
+            ),
+            {"table": TABLE, "column": NEXT_FIELD},
+        ).scalar()
+    return json.loads(comment) if comment else None
+
+
+def collection_name_for_mode(mode: str) -> str:
+    # Imported lazily so a PostgreSQL-only re-index does not need a reachable Qdrant
+    from services.qdrant_searcher import collection_name_for  # pylint: disable=import-outside-toplevel
+
+    return collection_name_for(mode)
+
+
+def qdrant_searcher(build: dict, collection_name: str = None):
+    """Searcher on the collection of the `build` generation (or `collection_name`) and the served alias."""
+    from services.qdrant_searcher import QdrantSearcher  # pylint: disable=import-outside-toplevel
+
+    alias = collection_name_for_mode(build["qdrant_mode"])
+    return QdrantSearcher(
+        Company,
+        embed_dimensions=build["dimensions"],
+        mode=build["qdrant_mode"],
+        collection_name=collection_name or f"{alias}_g{build['generation']}",
+    ), alias
+
+
+def qdrant_client():
+    from services.qdrant_searcher import QdrantClient  # pylint: disable=import-outside-toplevel
+
+    if config.QDRANT_API_KEY:
+        return QdrantClient(url=config.QDRANT_URL, api_key=config.QDRANT_API_KEY)
+    return QdrantClient(url=config.QDRANT_URL)
+
+
+def served_collection(alias: str, client=None):
+    """The collection `alias` points at, None while the name is a plain collection (or unknown)."""
+    client = client or qdrant_client()
+    return next((a.collection_name for a in client.get_aliases().aliases if a.alias_name == alias), None)
+
+
+def sync_collection(searcher) -> tuple[int, int]:
+    """
+    Makes the searcher's collection match the served PostgreSQL rows: upserts the
+    companies whose point is missing or has another payload (content changes are
+    re-embedded on write, so the payload tells a stale vector apart) and deletes
+    the points of companies that are gone. Re-running it is a no-op.
+
+    Returns:
+        Points upserted and deleted
+    """
+    from qdrant_client.models import PointIdsList  # pylint: disable=import-outside-toplevel
+
+    client = searcher.client
+    payloads, offset = {}, None
+    while True:
+        records, offset = client.scroll(
+            collection_name=searcher.collection_name, limit=1000, offset=offset,
+            with_payload=PAYLOAD_FIELDS, with_vectors=False,
+        )
+        payloads.update((record.id, record.payload) for record in records)
+        if offset is None:
+            break
+
+    upserted, after_id = 0, 0
+    while True:
+        with get_db_session() as session:
+            companies = (
+                session.query(Company)
+                .filter(Company.id > after_id, Company.embedding.isnot(None))
+                .order_by(Company.id)
+                .limit(BATCH_SIZE)
+                .all()
+            )
+            session.expunge_all()
+        if not companies:
+            break
+        after_id = companies[-1].id
+        stale = [
+            company for company in companies
+            if payloads.pop(company.id, None) != {field: getattr(company, field) for field in PAYLOAD_FIELDS}
+        ]
+        if stale and searcher.upsert_companies(stale) != len(stale):
+            raise RuntimeError(f"Could not upsert {len(stale)} companies into {searcher.collection_name}")
+        upserted += len(stale)
+
+    # Left over: points without a company (or without an embedding)
+    if payloads:
+        client.delete(collection_name=searcher.collection_name, points_selector=PointIdsList(points=list(payloads)))
+    return upserted, len(payloads)
+
+
+def create_trigger(connection) -> None:
+    connection.execute(text(f"""
+        CREATE OR REPLACE FUNCTION {TRIGGER}() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.content IS DISTINCT FROM OLD.content THEN
+                NEW.{NEXT_FIELD} := NULL;
+                NEW.{NEXT_COARSE_FIELD} := NULL;
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """))
+    connection.execute(text(f"DROP TRIGGER IF EXISTS {TRIGGER} ON {TABLE}"))
+    connection.execute(text(
+        f"CREATE TRIGGER {TRIGGER} BEFORE UPDATE ON {TABLE} FOR EACH ROW EXECUTE FUNCTION {TRIGGER}()"
+    ))
+
+
+def comment_build(connection, build: dict) -> None:
+    # Not parsed for bind parameters, model names may contain colons
+    connection.exec_driver_sql(
+        f"COMMENT ON COLUMN {TABLE}.{NEXT_FIELD} IS '{json.dumps(build).replace(chr(39), chr(39) * 2)}'"
+    )
+
+
+def start_build(backend: str, dimensions: int, qdrant: bool) -> dict:
+    """Adds the shadow columns and the invalidation trigger, or resumes the build in progress."""
+    build = read_build()
+    if build is not None:
+        if (build["embedding_backend"], build["dimensions"]) != (backend, dimensions):
+            raise SystemExit(
+                f"A build of generation {build['generation']} ({build['embedding_backend']}, "
+                f"{build['dimensions']} dimensions) is in progress, cut it over or run `cleanup --abort` first"
+            )
+        logger.info(f"Resuming the build of generation {build['generation']}")
+        return build
+
+    if dimensions < config.COARSE_DIMENSIONS:
+        raise SystemExit(f"--dimensions must be at least COARSE_DIMENSIONS ({config.COARSE_DIMENSIONS})")
+    if config.SEARCH_MODE == "coarse" and not is_matryoshka(embedding_model_name(backend)):
+        raise SystemExit(f"SEARCH_MODE=coarse needs a Matryoshka model, {embedding_model_name(backend)} is not one")
+    if qdrant and served_collection(collection_name_for_mode(config.SEARCH_MODE)) is None:
+        raise SystemExit("The Qdrant collection is not behind an alias yet, run `prepare` first")
+    active = active_index.refresh()
+    build = {
+        "generation": active["generation"] + 1,
+        "embedding_backend": backend,
+        "embedding_model": embedding_model_name(backend),
+        "dimensions": dimensions,
+        "qdrant_mode": config.SEARCH_MODE if qdrant else None,
+    }
+    with engine.begin() as connection:
+        # Columns without a default are added without rewriting the table
+        connection.execute(text(f"ALTER TABLE {TABLE} ADD COLUMN {NEXT_FIELD} vector({dimensions})"))
+        connection.execute(
+            text(f"ALTER TABLE {TABLE} ADD COLUMN {NEXT_COARSE_FIELD} vector({config.COARSE_DIMENSIONS})")
+        )
+        comment_build(connection, build)
+        create_trigger(connection)
+    if qdrant:
+        qdrant_searcher(build)
+    logger.info(f"Started the build of generation {build['generation']}: {build}")
+    return build
+
+
+def embed_rows(build: dict, rows) -> list:
+    """Embeddings of the rows' content, None where it fails or has the wrong dimension."""
+    contents = [row.content for row in rows]
+    try:
+        embeddings = active_index.embed_multiple(contents, build)
+    except Exception as e:
+        logger.error(f"Error generating batched embeddings, embedding one by one: {e}")
+        embeddings = []
+        for content in contents:
+            try:
+                embeddings.append(active_index.embed(content, build))
+            except Exception as single_error:
+                logger.error(f"Error generating embedding: {single_error}")
+                embeddings.append(None)
+    return [
+        embedding if embedding is not None and len(embedding) == build["dimensions"] else None
+        for embedding in embeddings
+    ]
+
+
+def store_batch(connection, build: dict, rows, embeddings: list, searcher=None) -> tuple[int, int]:
+    """
+    Stores the shadow vectors of `rows`. A row whose content changed since it
+    was read is left for the next pass.
+
+    Returns:
+        Rows written and rows that failed to embed
+    """
+    written = [(row, embedding) for row, embedding in zip(rows, embeddings) if embedding is not None]
+    if written:
+        connection.execute(
+            text(
+                f"UPDATE {TABLE} SET {NEXT_FIELD} = :embedding, {NEXT_COARSE_FIELD} = :coarse "
+                "WHERE id = :id AND content = :content"
+            ),
+            [
+                {
+                    "id": row.id,
+                    "content": row.content,
+                    "embedding": np.asarray(embedding, dtype=np.float32),
+                    "coarse": np.asarray(truncate_embedding(embedding), dtype=np.float32),
+                }
+                for row, embedding in written
+            ],
+        )
+    if searcher is not None and written:
+        companies = [
+            Company(id=row.id, embedding=embedding, **{field: getattr(row, field) for field in PAYLOAD_FIELDS})
+            for row, embedding in written
+        ]
+        if searcher.upsert_companies(companies) != len(companies):
+            raise RuntimeError(f"Could not upsert {len(companies)} companies into {searcher.collection_name}")
+    return len(written), len(rows) - len(written)
+
+
+def pending_rows(connection, after_id: int, limit: int = None):
+    return connection.execute(
+        text(
+            f"SELECT id, {', '.join(PAYLOAD_FIELDS)} FROM {TABLE} "
+            f"WHERE {NEXT_FIELD} IS NULL AND content IS NOT NULL AND id > :after_id ORDER BY id"
+            + (" LIMIT :limit" if limit is not None else "")
+        ),
+        {"after_id": after_id, "limit": limit},
+    ).fetchall()
+
+
+def backfill_pass(build: dict, batch_size: int, rows_per_second: float, searcher=None) -> tuple[int, int]:
+    """
+    One pass over the rows without a shadow vector, in id order. Each batch is
+    committed on its own and the pass sleeps as needed to stay under
+    `rows_per_second` (0 is unthrottled), leaving headroom to the live traffic.
+
+    Returns:
+        Rows written and rows that failed to embed
+    """
+    after_id, written, failed = 0, 0, 0
+    while True:
+        started = time.monotonic()
+        with engine.connect() as connection:
+            rows = pending_rows(connection, after_id, batch_size)
+        if not rows:
+            break
+        # No transaction is held open during the embedding calls
+        embeddings = embed_rows(build, rows)
+        with engine.begin() as connection:
+            batch_written, batch_failed = store_batch(connection, build, rows, embeddings, searcher)
+        written, failed, after_id = written + batch_written, failed + batch_failed, rows[-1].id
+        logger.info(f"Re-indexed {written} companies ({failed} failed), up to id {after_id}")
+        if rows_per_second > 0:
+            time.sleep(max(0.0, len(rows) / rows_per_second - (time.monotonic() - started)))
+    return written, failed
+
+
+def invalid_indexes() -> list:
+    """Shadow indexes that are missing or left invalid by an interrupted concurrent build."""
+    with get_db_session() as session:
+        valid = {
+            name for name, in session.execute(
+                text(
+                    "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                    "WHERE c.relname = ANY(:names) AND i.indisvalid"
+                ),
+                {"names": [shadow_index for *_, shadow_index in INDEXES]},
+            )
+        }
+    return [shadow_index for *_, shadow_index in INDEXES if shadow_index not in valid]
+
+
+def build_indexes() -> None:
+    """Builds the shadow HNSW indexes without blocking writes, with the settings of the served ones."""
+    missing = invalid_indexes()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for index, _, shadow_field, shadow_index in INDEXES:
+            if shadow_index not in missing:
+                continue
+            options = index.dialect_options["postgresql"]
+            ops = next(iter(options["ops"].values()))
+            with_clause = ", ".join(f"{key} = {value}" for key, value in options["with"].items())
+            logger.info(f"Building index {shadow_index} concurrently")
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {shadow_index}"))
+            connection.execute(text(
+                f"CREATE INDEX CONCURRENTLY {shadow_index} ON {TABLE} "
+                f"USING {options['using']} ({shadow_field} {ops}) WITH ({with_clause})"
+            ))
+
+
+def build(backend: str, dimensions: int, qdrant: bool, batch_size: int, rows_per_second: float) -> None:
+    build_info = start_build(backend, dimensions, qdrant)
+    searcher = qdrant_searcher(build_info)[0] if build_info["qdrant_mode"] else None
+    # Qdrant points are upserted in the same batches, a resumed build only sees the rows still missing
+    written, failed = backfill_pass(build_info, batch_size, rows_per_second, searcher)
+    logger.info(f"Backfill done: {written} companies re-indexed, {failed} failed")
+    build_indexes()
+    written, failed = backfill_pass(build_info, batch_size, rows_per_second, searcher)
+    logger.info(
+        f"Generation {build_info['generation']} built ({written} rows caught up, {failed} failed), "
+        "run `cutover` to switch to it"
+    )
+
+
+def prepare_qdrant(mode: str) -> None:
+    """
+    Puts the served collection behind an alias of its name, so cutovers switch
+    the alias atomically. The collection is copied to the active generation's
+    `{name}_g{generation}`, then the name is dropped and re-created as an alias
+    of the copy, two calls apart; the copy is finally synced with the rows
+    written while it ran. Every step is skipped when already done.
+    """
+    # pylint: disable=import-outside-toplevel
+    from qdrant_client.models import CreateAlias, CreateAliasOperation, PointStruct
+
+    alias = collection_name_for_mode(mode)
+    client = qdrant_client()
+    generation = active_index.refresh()
+    target = f"{alias}_g{generation['generation']}"
+    served = served_collection(alias, client)
+    if served is not None:
+        logger.info(f"Qdrant collection {alias} is already an alias of {served}")
+        return
+
+    collections = {collection.name for collection in client.get_collections().collections}
+    if alias in collections:
+        if target not in collections:
+            vectors = client.get_collection(alias).config.params.vectors
+            client.create_collection(collection_name=target, vectors_config=vectors)
+        copied, offset = 0, None
+        while True:
+            records, offset = client.scroll(
+                collection_name=alias, limit=BATCH_SIZE, offset=offset, with_payload=True, with_vectors=True,
+            )
+            if records:
+                client.upsert(
+                    collection_name=target,
+                    points=[PointStruct(id=record.id, vector=record.vector, payload=record.payload) for record in records],
+                )
+            copied += len(records)
+            if offset is None:
+                break
+        logger.info(f"Copied {copied} points from {alias} to {target}")
+        client.delete_collection(alias)
+    elif target not in collections:
+        raise SystemExit(f"Neither the Qdrant collection {alias} nor {target} exists")
+    client.update_collection_aliases(change_aliases_operations=[
+        CreateAliasOperation(create_alias=CreateAlias(collection_name=target, alias_name=alias))
+    ])
+    # Writes that landed in the old collection while it was copied
+    searcher, _ = qdrant_searcher({**generation, "qdrant_mode": mode}, collection_name=target)
+    upserted, deleted = sync_collection(searcher)
+    logger.info(f"Qdrant alias {alias} now points at {target} ({upserted} points re-synced, {deleted} deleted)")
+
+
+def switch_qdrant(build: dict) -> str:
+    """
+    Points the alias at the build's collection in one atomic alias update.
+
+    Returns:
+        The collection the alias pointed at before
+    """
+    # pylint: disable=import-outside-toplevel
+    from qdrant_client.models import CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation
+
+    searcher, alias = qdrant_searcher(build)
+    served = served_collection(alias, searcher.client)
+    if served is None:
+        raise RuntimeError(f"Qdrant collection {alias} is not an alias, run `prepare` first")
+    searcher.client.update_collection_aliases(change_aliases_operations=[
+        DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)),
+        CreateAliasOperation(create_alias=CreateAlias(collection_name=searcher.collection_name, alias_name=alias)),
+    ])
+    logger.info(f"Qdrant alias {alias} now points at {searcher.collection_name}")
+    return served
+
+
+def upsert_pointer(connection, generation: dict) -> None:
+    connection.execute(
+        text(f"""
+            INSERT INTO "{SearchIndex.__tablename__}"
+                (name, generation, embedding_backend, embedding_model, dimensions, activated_at)
+            VALUES (:name, :generation, :embedding_backend, :embedding_model, :dimensions, now())
+            ON CONFLICT (name) DO UPDATE SET
+                generation = EXCLUDED.generation,
+                embedding_backend = EXCLUDED.embedding_backend,
+                embedding_model = EXCLUDED.embedding_model,
+                dimensions = EXCLUDED.dimensions,
+                activated_at = EXCLUDED.activated_at
+        """),
+        {
+            "name": active_index.name,
+            "generation": generation["generation"],
+            "embedding_backend": generation["embedding_backend"],
+            "embedding_model": generation["embedding_model"],
+            "dimensions": generation["dimensions"],
+        },
+    )
+
+
+def lock_for_switch(connection, lock_timeout: str) -> None:
+    # Give up instead of queueing every reader behind the table lock
+    connection.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+    # Blocks writes, not reads: pointer checks of writers (FOR SHARE), then the rows
+    connection.execute(text(f'LOCK TABLE "{SearchIndex.__tablename__}" IN EXCLUSIVE MODE'))
+    connection.execute(text(f"LOCK TABLE {TABLE} IN SHARE ROW EXCLUSIVE MODE"))
+
+
+def revert_cutover(build: dict, previous: dict, cutover_xid: int, lock_timeout: str) -> None:
+    """
+    Undoes a committed cutover: the columns and indexes are renamed back, the
+    pointer restored and the build resumable again. Rows written since the
+    cutover committed (a newer xmin) only have vectors of the new generation,
+    they are re-embedded with the previous one.
+    """
+    with engine.connect() as connection, connection.begin():
+        lock_for_switch(connection, lock_timeout)
+        for index, served_field, shadow_field, shadow_index in INDEXES:
+            connection.execute(text(f"ALTER TABLE {TABLE} RENAME COLUMN {served_field} TO {shadow_field}"))
+            connection.execute(
+                text(f"ALTER TABLE {TABLE} RENAME COLUMN {served_field}_g{previous['generation']} TO {served_field}")
+            )
+            connection.execute(text(f"ALTER INDEX {index.name} RENAME TO {shadow_index}"))
+            connection.execute(text(f"ALTER INDEX IF EXISTS {index.name}_g{previous['generation']} RENAME TO {index.name}"))
+        comment_build(connection, build)
+        create_trigger(connection)
+        upsert_pointer(connection, previous)
+
+        rows = connection.execute(
+            text(
+                f"SELECT id, {', '.join(PAYLOAD_FIELDS)} FROM {TABLE} "
+                "WHERE content IS NOT NULL AND age(xmin) < age(CAST(:xid AS xid)) ORDER BY id"
+            ),
+            {"xid": str(cutover_xid % 2 ** 32)},
+        ).fetchall()
+        embeddings = embed_rows(previous, rows) if rows else []
+        written = [(row, embedding) for row, embedding in zip(rows, embeddings) if embedding is not None]
+        if written:
+            connection.execute(
+                text(f"UPDATE {TABLE} SET {Company.get_embedding_field()} = :embedding, "
+                     f"{Company.get_coarse_embedding_field()} = :coarse WHERE id = :id"),
+                [
+                    {
+                        "id": row.id,
+                        "embedding": np.asarray(embedding, dtype=np.float32),
+                        "coarse": np.asarray(truncate_embedding(embedding), dtype=np.float32),
+                    }
+                    for row, embedding in written
+                ],
+            )
+        if len(written) < len(rows):
+            logger.error(f"{len(rows) - len(written)} companies written during the cutover could not be re-embedded")
+    active_index.refresh()
+    if written and build["qdrant_mode"]:
+        # The alias still points at the previous collection, those points were written with the new model
+        mode = build["qdrant_mode"]
+        searcher, _ = qdrant_searcher({**previous, "qdrant_mode": mode}, collection_name=collection_name_for_mode(mode))
+        searcher.upsert_companies([
+            Company(id=row.id, embedding=embedding, **{field: getattr(row, field) for field in PAYLOAD_FIELDS})
+            for row, embedding in written
+        ])
+    logger.warning(
+        f"Reverted the cutover to generation {build['generation']}, back on generation {previous['generation']} "
+        f"({len(rows)} companies written meanwhile re-embedded)"
+    )
+
+
+def cutover(batch_size: int, rows_per_second: float, max_final_rows: int, lock_timeout: str) -> None:
+    build_info = read_build()
+    if build_info is None:
+        raise SystemExit("No build in progress, run `build` first")
+    if invalid_indexes():
+        raise SystemExit(f"Shadow indexes {invalid_indexes()} are not built, run `build` again")
+    searcher = qdrant_searcher(build_info)[0] if build_info["qdrant_mode"] else None
+
+    for _ in range(MAX_CATCH_UP_PASSES):
+        written, _ = backfill_pass(build_info, batch_size, rows_per_second, searcher)
+        if written <= max_final_rows:
+            break
+
+    if build_info["qdrant_mode"] and served_collection(collection_name_for_mode(build_info["qdrant_mode"])) is None:
+        raise SystemExit("The Qdrant collection is not behind an alias yet, run `prepare` first")
+    previous_index = active_index.refresh()
+    previous = previous_index["generation"]
+    generation = build_info["generation"]
+    with engine.connect() as connection, connection.begin():
+        lock_for_switch(connection, lock_timeout)
+        # Rows with a newer xmin were written after this transaction, see revert_cutover
+        cutover_xid = connection.execute(text("SELECT txid_current()")).scalar()
+
+        rows = pending_rows(connection, 0)
+        if len(rows) > max_final_rows:
+            raise SystemExit(f"{len(rows)} companies changed since the last pass, run `cutover` again")
+        _, failed = store_batch(connection, build_info, rows, embed_rows(build_info, rows), searcher) if rows else (0, 0)
+        if failed:
+            raise SystemExit(f"{failed} companies could not be embedded, run `cutover` again")
+
+        for index, served_field, shadow_field, shadow_index in INDEXES:
+            connection.execute(text(f"ALTER TABLE {TABLE} RENAME COLUMN {served_field} TO {served_field}_g{previous}"))
+            connection.execute(text(f"ALTER TABLE {TABLE} RENAME COLUMN {shadow_field} TO {served_field}"))
+            connection.execute(text(f"ALTER INDEX IF EXISTS {index.name} RENAME TO {index.name}_g{previous}"))
+            connection.execute(text(f"ALTER INDEX {shadow_index} RENAME TO {index.name}"))
+        connection.execute(text(f"COMMENT ON COLUMN {TABLE}.{Company.get_embedding_field()} IS NULL"))
+        connection.execute(text(f"DROP TRIGGER {TRIGGER} ON {TABLE}"))
+        connection.execute(text(f"DROP FUNCTION {TRIGGER}()"))
+        upsert_pointer(connection, {**build_info, "generation": generation})
+
+    if searcher is not None:
+        # Qdrant only follows once PostgreSQL committed, a failed switch reverts PostgreSQL
+        try:
+            # Companies deleted during the build, and writes made since the commit
+            sync_collection(searcher)
+            for attempt in range(SWITCH_ATTEMPTS):
+                try:
+                    switch_qdrant(build_info)
+                    break
+                except Exception as e:
+                    if attempt == SWITCH_ATTEMPTS - 1:
+                        raise
+                    logger.warning(f"Switching the Qdrant alias failed, retrying: {e}")
+                    time.sleep(2 ** attempt)
+        except Exception as e:
+            logger.error(f"Switching Qdrant to generation {generation} failed, reverting the cutover: {e}")
+            revert_cutover(build_info, previous_index, cutover_xid, lock_timeout)
+            raise SystemExit("Cutover reverted, run `cutover` again") from e
+        # Writes that went to the previous collection before the alias moved
+        upserted, deleted = sync_collection(searcher)
+        logger.info(f"Synced {searcher.collection_name} after the switch: {upserted} upserted, {deleted} deleted")
+
+    # Other processes notice the switch on their next search or write and refresh their cached pointer
+    active_index.refresh()
+    logger.info(
+        f"Switched to generation {generation} ({build_info['embedding_model']}, {build_info['dimensions']} "
+        f"dimensions), generation {previous} is kept until `cleanup`"
+    )
+    # Cached results were ranked by the previous generation, workers reload their
+    # autocomplete index along with them
+    asyncio.run(RedisService().bump_namespace_version(CACHE_NAMESPACE))
+    asyncio.run(AutocompleteIndex().invalidate())
+    if config.SEARCH_BACKEND == "numpy":
+        from services.numpy_searcher import NumpySearcher  # pylint: disable=import-outside-toplevel
+
+        NumpySearcher(Company).refresh()
+
+
+def cleanup(abort: bool, qdrant: bool) -> None:
+    """Drops previous generations, or the unfinished build with `abort`."""
+    build_info = read_build()
+    with get_db_session() as session:
+        columns = [
+            name for name, in session.execute(
+                text(
+                    "SELECT attname FROM pg_attribute WHERE attrelid = CAST(:table AS regclass) "
+                    "AND NOT attisdropped AND attname ~ :pattern"
+                ),
+                {
+                    "table": TABLE,
+                    "pattern": "_next$" if abort else f"^({'|'.join(field for _, field, _, _ in INDEXES)})_g[0-9]+$",
+                },
+            )
+        ]
+    with engine.begin() as connection:
+        if abort:
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {TRIGGER} ON {TABLE}"))
+            connection.execute(text(f"DROP FUNCTION IF EXISTS {TRIGGER}()"))
+        for column in columns:
+            # Also drops the column's index, the space is reclaimed as rows are rewritten
+            connection.execute(text(f"ALTER TABLE {TABLE} DROP COLUMN {column}"))
+            logger.info(f"Dropped column {column}")
+
+    if abort and build_info is not None and build_info["qdrant_mode"]:
+        searcher, _ = qdrant_searcher(build_info)
+        searcher.client.delete_collection(searcher.collection_name)
+        logger.info(f"Deleted collection {searcher.collection_name}")
+    elif not abort and qdrant:
+        from services.qdrant_searcher import QdrantSearcher  # pylint: disable=import-outside-toplevel
+
+        # The collection of a build in progress is not served yet, but it is not a previous generation
+        building = None
+        if build_info is not None and build_info["qdrant_mode"]:
+            building = f"{collection_name_for_mode(build_info['qdrant_mode'])}_g{build_info['generation']}"
+        client = QdrantSearcher(Company).client
+        for alias in client.get_aliases().aliases:
+            for collection in client.get_collections().collections:
+                if (
+                    collection.name.startswith(f"{alias.alias_name}_g")
+                    and collection.name not in (alias.collection_name, building)
+                ):
+                    client.delete_collection(collection.name)
+                    logger.info(f"Deleted collection {collection.name}, {alias.alias_name} is on {alias.collection_name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Blue/green re-indexing with another embedding model or dimension")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    prepare_parser = subparsers.add_parser(
+        "prepare", help="Put the served Qdrant collection behind an alias, once before the first build"
+    )
+    prepare_parser.add_argument("--mode", default=config.SEARCH_MODE, choices=["full", "coarse"])
+
+    build_parser = subparsers.add_parser("build", help="Build the next generation next to the served one")
+    build_parser.add_argument("--backend", default=config.EMBEDDING_BACKEND, help="Embedding backend of the new generation")
+    build_parser.add_argument("--dimensions", type=int, default=1024)
+
+    cutover_parser = subparsers.add_parser("cutover", help="Switch search to the built generation")
+    cutover_parser.add_argument(
+        "--max-final-rows", type=int, default=BATCH_SIZE,
+        help="Most rows embedded while writes are blocked, more and the cutover is retried later",
+    )
+    cutover_parser.add_argument("--lock-timeout", default="5s")
+
+    cleanup_parser = subparsers.add_parser("cleanup", help="Drop previous generations")
+    cleanup_parser.add_argument("--abort", action="store_true", help="Drop the unfinished build instead")
+
+    for subparser in (build_parser, cleanup_parser):
+        subparser.add_argument(
+            "--qdrant", action=argparse.BooleanOptionalAction, default=config.SEARCH_BACKEND == "qdrant",
+            help="Also build / drop Qdrant collections (default when SEARCH_BACKEND=qdrant)",
+        )
+    for subparser in (build_parser, cutover_parser):
+        subparser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        subparser.add_argument("--rows-per-second", type=float, default=0, help="Throttle, 0 is unthrottled")
+
+    args = parser.parse_args()
+    if args.command == "prepare":
+        prepare_qdrant(args.mode)
+    elif args.command == "build":
+        build(args.backend, args.dimensions, args.qdrant, args.batch_size, args.rows_per_second)
+    elif args.command == "cutover":
+        cutover(args.batch_size, args.rows_per_second, args.max_final_rows, args.lock_timeout)
+    else:
+        cleanup(args.abort, args.qdrant)
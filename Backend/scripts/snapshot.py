@@ -0,0 +1,315 @@
+"""
+    This script exports the Company table to an on-disk snapshot and imports
+    it back into PostgreSQL and/or Qdrant without calling any embedding API.
+
+    A snapshot is a directory containing:
+        manifest.json     format version, row count, embedding model and dimension
+        ids.npy           Company ids (int64)
+        embeddings.npy    embedding matrix (rows, dimensions), float32 or float16
+        payload.json.gz   columnar payload: {"name": [...], "description": [...], ...}
+
+    Usage:
+        python scripts/snapshot.py export data/snapshots/latest
+        python scripts/snapshot.py import data/snapshots/latest --target all --truncate
+"""
+
+import argparse
+import asyncio
+import datetime
+import gzip
+import io
+import json
+import logging
+import os
+import struct
+import sys
+sys.path.append(".")
+
+import numpy as np
+from sqlalchemy import func, text
+
+from config.main import config
+from models.company import Company, index_ada002, index_coarse
+from models.database import engine, get_db_session
+from services.autocomplete import AutocompleteIndex
+from services.company_service import CACHE_NAMESPACE
+from services.facet_service import FacetService
+from services.redis_service import RedisService
+from services.search_index import active_index
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+PAYLOAD_FIELDS = ["name", "description", "industry", "size", "location", "content"]
+EXPORT_BATCH_SIZE = 2000
+COPY_BATCH_SIZE = 10000
+# PostgreSQL binary timestamps count microseconds from 2000-01-01
+PG_EPOCH = datetime.datetime(2000, 1, 1)
+
+
+def export_snapshot(path: str, dtype: str = "float32"):
+    """
+    Streams the Company table into a snapshot directory. The count and the rows
+    are read in one REPEATABLE READ transaction, writes made meanwhile are not
+    in the snapshot and the embedding matrix is exactly the size of the export.
+    """
+    os.makedirs(path, exist_ok=True)
+    search_index = active_index.current()
+    dimensions = search_index["dimensions"]
+
+    with get_db_session() as session:
+        session.connection(execution_options={"isolation_level": "REPEATABLE READ", "postgresql_readonly": True})
+        count = (
+            session.query(func.count(Company.id))
+            .filter(Company.embedding.isnot(None))
+            .scalar()
+        )
+        logger.info(f"Exporting {count} companies to {path}")
+
+        embeddings = np.lib.format.open_memmap(
+            os.path.join(path, "embeddings.npy"), mode="w+", dtype=dtype, shape=(count, dimensions)
+        )
+        ids = np.empty(count, dtype=np.int64)
+        payload = {field: [] for field in PAYLOAD_FIELDS + ["created_at"]}
+
+        query = (
+            session.query(Company)
+            .filter(Company.embedding.isnot(None))
+            .order_by(Company.id)
+            .yield_per(EXPORT_BATCH_SIZE)
+        )
+        row = 0
+        for company in query:
+            ids[row] = company.id
+            embeddings[row] = np.asarray(company.embedding, dtype=np.float32)
+            for field in PAYLOAD_FIELDS:
+                payload[field].append(getattr(company, field))
+            payload["created_at"].append(
+                company.created_at.isoformat() if company.created_at else None
+            )
+            row += 1
+
+    embeddings.flush()
+    del embeddings
+    np.save(os.path.join(path, "ids.npy"), ids)
+    with gzip.open(os.path.join(path, "payload.json.gz"), "wt", encoding="utf-8") as f:
+        json.dump(payload, f)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "count": row,
+        "dimensions": dimensions,
+        "dtype": dtype,
+        "embedding_backend": search_index["embedding_backend"],
+        "embedding_model": search_index["embedding_model"],
+        "created_at": datetime.datetime.utcnow().isoformat(),
+    }
+    with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Snapshot written: {manifest}")
+
+
+def load_snapshot(path: str):
+    """
+    Loads a snapshot, the embedding matrix is memory-mapped.
+    """
+    with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest["format_version"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version: {manifest['format_version']}")
+
+    search_index = active_index.current()
+    if manifest["dimensions"] != search_index["dimensions"]:
+        raise ValueError(
+            f"Snapshot has {manifest['dimensions']}-d embeddings, the active search index "
+            f"expects {search_index['dimensions']}"
+        )
+    if manifest["embedding_model"] != search_index["embedding_model"]:
+        logger.warning(
+            f"Snapshot embeddings come from '{manifest['embedding_model']}' but the active search index "
+            f"model is '{search_index['embedding_model']}', query vectors will not match"
+        )
+
+    ids = np.load(os.path.join(path, "ids.npy"))
+    embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+    with gzip.open(os.path.join(path, "payload.json.gz"), "rt", encoding="utf-8") as f:
+        payload = json.load(f)
+    return manifest, ids, embeddings, payload
+
+
+def _binary_field(value: bytes) -> bytes:
+    return struct.pack(">i", len(value)) + value
+
+
+def _binary_text(value) -> bytes:
+    if value is None:
+        return struct.pack(">i", -1)
+    return _binary_field(value.encode("utf-8"))
+
+
+def _binary_timestamp(value) -> bytes:
+    if value is None:
+        return struct.pack(">i", -1)
+    delta = datetime.datetime.fromisoformat(value) - PG_EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    return _binary_field(struct.pack(">q", micros))
+
+
+def coarse_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """Matryoshka truncation of an embedding matrix, see `models.company.truncate_embedding`."""
+    coarse = np.asarray(embeddings[:, :config.COARSE_DIMENSIONS], dtype=np.float32)
+    norms = np.linalg.norm(coarse, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return coarse / norms
+
+
+def _vector_header(dimensions: int) -> bytes:
+    # Field length, then pgvector's binary header: int16 dimensions, int16 unused
+    return struct.pack(">iHH", 4 + 4 * dimensions, dimensions, 0)
+
+
+def _copy_batch(ids, embeddings, payload, start, end) -> io.BytesIO:
+    """
+    Encodes rows [start, end) in PostgreSQL's binary COPY format. Vectors are
+    sent as packed big-endian floats (pgvector's binary representation), so
+    the server does not parse any decimal text.
+    """
+    vector_header = _vector_header(embeddings.shape[1])
+    coarse_header = _vector_header(config.COARSE_DIMENSIONS)
+    vectors = np.ascontiguousarray(embeddings[start:end], dtype=">f4")
+    coarse_vectors = np.ascontiguousarray(coarse_embeddings(embeddings[start:end]), dtype=">f4")
+
+    buffer = io.BytesIO()
+    buffer.write(b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0))
+    # id, payload fields, created_at, embedding, embedding_coarse
+    field_count = struct.pack(">h", 1 + len(PAYLOAD_FIELDS) + 3)
+    for offset, row in enumerate(range(start, end)):
+        buffer.write(field_count)
+        buffer.write(_binary_field(struct.pack(">i", int(ids[row]))))
+        for field in PAYLOAD_FIELDS:
+            buffer.write(_binary_text(payload[field][row]))
+        buffer.write(_binary_timestamp(payload["created_at"][row]))
+        buffer.write(vector_header)
+        buffer.write(vectors[offset].tobytes())
+        buffer.write(coarse_header)
+        buffer.write(coarse_vectors[offset].tobytes())
+    buffer.write(struct.pack(">h", -1))
+    buffer.seek(0)
+    return buffer
+
+
+def import_postgres(ids, embeddings, payload, truncate: bool = False, rebuild_index: bool = True):
+    """
+    Bulk-loads a snapshot into the Company table with binary COPY.
+    """
+    table_name = Company.__tablename__
+    columns = ", ".join(
+        ["id"] + PAYLOAD_FIELDS
+        + ["created_at", Company.get_embedding_field(), Company.get_coarse_embedding_field()]
+    )
+
+    with engine.connect() as connection:
+        if truncate:
+            logger.info(f"Truncating {table_name}")
+            connection.execute(text(f'TRUNCATE "{table_name}"'))
+        if rebuild_index:
+            # Building the HNSW indexes once after the load is much faster than maintaining them per row
+            for index in (index_ada002, index_coarse):
+                connection.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        connection.commit()
+
+    raw_connection = engine.raw_connection()
+    try:
+        cursor = raw_connection.cursor()
+        for start in range(0, len(ids), COPY_BATCH_SIZE):
+            end = min(start + COPY_BATCH_SIZE, len(ids))
+            with cursor.copy(f'COPY "{table_name}" ({columns}) FROM STDIN WITH (FORMAT binary)') as copy:
+                copy.write(_copy_batch(ids, embeddings, payload, start, end).getvalue())
+            logger.info(f"Copied {end}/{len(ids)} companies into PostgreSQL")
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('\"{table_name}\"', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM \"{table_name}\"), 1))"
+        )
+        raw_connection.commit()
+    finally:
+        raw_connection.close()
+
+    if rebuild_index:
+        for index in (index_ada002, index_coarse):
+            logger.info(f"Rebuilding index {index.name}")
+            index.create(bind=engine, checkfirst=True)
+
+
+def import_qdrant(ids, embeddings, payload, parallel: int = 1, batch_size: int = 256, mode: str = None):
+    """
+    Uploads a snapshot into Qdrant with batched (optionally parallel) requests.
+    `mode` selects the collection layout, see `QdrantSearcher`; defaults to SEARCH_MODE.
+    """
+    # Imported lazily so a PostgreSQL-only import does not need a reachable Qdrant
+    from services.qdrant_searcher import (  # pylint: disable=import-outside-toplevel
+        COARSE_VECTOR, FULL_VECTOR, QdrantSearcher,
+    )
+
+    searcher = QdrantSearcher(Company, embed_dimensions=embeddings.shape[1], mode=mode)
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if searcher.mode == "coarse":
+        vectors = {COARSE_VECTOR: coarse_embeddings(vectors), FULL_VECTOR: vectors}
+    payloads = (
+        {field: payload[field][row] for field in PAYLOAD_FIELDS}
+        for row in range(len(ids))
+    )
+    searcher.client.upload_collection(
+        collection_name=searcher.collection_name,
+        vectors=vectors,
+        payload=payloads,
+        ids=ids.tolist(),
+        batch_size=batch_size,
+        parallel=parallel,
+    )
+    logger.info(f"Uploaded {len(ids)} companies into Qdrant collection {searcher.collection_name}")
+
+
+def import_snapshot(path: str, target: str, truncate: bool, rebuild_index: bool, parallel: int):
+    manifest, ids, embeddings, payload = load_snapshot(path)
+    logger.info(f"Importing snapshot {path}: {manifest}")
+    if target in ("postgres", "all"):
+        import_postgres(ids, embeddings, payload, truncate=truncate, rebuild_index=rebuild_index)
+        # The rows were copied past the API, facet counts are aggregated again on the next
+        # read and every worker reloads its autocomplete index
+        asyncio.run(FacetService().invalidate())
+        asyncio.run(AutocompleteIndex().invalidate())
+        if config.SEARCH_BACKEND == "numpy":
+            from services.numpy_searcher import NumpySearcher  # pylint: disable=import-outside-toplevel
+
+            # Rows below the last indexed id may have been rewritten, a delta refresh would miss them
+            NumpySearcher(Company).refresh(rebuild=True)
+    if target in ("qdrant", "all"):
+        import_qdrant(ids, embeddings, payload, parallel=parallel)
+    # Cached results and listings were computed from the previous rows
+    asyncio.run(RedisService().bump_namespace_version(CACHE_NAMESPACE))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export/import Company snapshots")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export the Company table to a snapshot")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+
+    import_parser = subparsers.add_parser("import", help="Import a snapshot")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--target", choices=["postgres", "qdrant", "all"], default="all")
+    import_parser.add_argument("--truncate", action="store_true", help="Empty the Company table first")
+    import_parser.add_argument(
+        "--keep-index", action="store_true",
+        help="Keep the HNSW index during the load instead of rebuilding it afterwards",
+    )
+    import_parser.add_argument("--parallel", type=int, default=4, help="Parallel Qdrant upload workers")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_snapshot(args.path, args.dtype)
+    else:
+        import_snapshot(args.path, args.target, args.truncate, not args.keep_index, args.parallel)
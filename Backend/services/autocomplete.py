@@ -0,0 +1,178 @@
+"""
+    This contains the AutocompleteIndex, serving company-name completions in-process.
+"""
+
+import asyncio
+import bisect
+import logging
+import re
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import text
+
+from models.company import Company
+from models.database import get_db_session
+from services.metrics import timed
+from services.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
+
+CHANGE_LOG = "autocomplete"
+WORD_START_PATTERN = re.compile(r"\S+")
+
+
+def normalize(value: str) -> str:
+    return " ".join((value or "").lower().split())
+
+
+class AutocompleteIndex:
+    """
+    Sorted array of (key, id, name) entries, where the keys are the normalized
+    company name and every suffix of it starting at a word, so "solutions"
+    completes "TechVision Solutions". Prefix lookups are two binary searches.
+
+    Writes are applied to the local array and published to a Redis change log,
+    other workers replay the log instead of rebuilding. Bulk writes that bypass
+    the API (load_data, snapshot import, reindex) publish a "rebuild" change
+    with `invalidate()`, every worker then reloads from the database.
+    """
+
+    def __init__(self, redis_service: RedisService = None, check_interval: float = 1.0):
+        self.redis_service = redis_service or RedisService()
+        self.check_interval = check_interval
+        self.entries: List[Tuple[str, int, str]] = []
+        self.keys_by_id: Dict[int, List[str]] = {}
+        self.version = 0
+        self.loaded = False
+        self._last_checked = 0.0
+        self._sync_lock = asyncio.Lock()
+
+    @staticmethod
+    def _keys(name: str) -> List[str]:
+        normalized = normalize(name)
+        return [normalized[match.start():] for match in WORD_START_PATTERN.finditer(normalized)]
+
+    def _add(self, company_id: int, name: str) -> None:
+        self._remove(company_id)
+        keys = self._keys(name)
+        for key in keys:
+            bisect.insort(self.entries, (key, company_id, name))
+        self.keys_by_id[company_id] = keys
+
+    def _remove(self, company_id: int) -> None:
+        for key in self.keys_by_id.pop(company_id, []):
+            position = bisect.bisect_left(self.entries, (key, company_id))
+            if position < len(self.entries) and self.entries[position][:2] == (key, company_id):
+                del self.entries[position]
+
+    def rebuild(self) -> None:
+        """Loads every company name from the database."""
+        with timed("autocomplete.rebuild"), get_db_session() as session:
+            rows = session.query(Company.id, Company.name).filter(Company.name.isnot(None)).all()
+        entries, keys_by_id = [], {}
+        for company_id, name in rows:
+            keys = self._keys(name)
+            keys_by_id[company_id] = keys
+            entries.extend((key, company_id, name) for key in keys)
+        entries.sort()
+        self.entries, self.keys_by_id = entries, keys_by_id
+        self.loaded = True
+        logger.info(f"Autocomplete index rebuilt with {len(rows)} companies")
+
+    async def sync(self) -> None:
+        """
+        Applies the writes of other workers, at most once per `check_interval`.
+        A rebuild reads the table in a thread, one at a time.
+        """
+        now = time.monotonic()
+        if self.loaded and now - self._last_checked < self.check_interval:
+            return
+        async with self._sync_lock:
+            if self.loaded and now - self._last_checked < self.check_interval:
+                return
+            self._last_checked = now
+            version, changes = await self.redis_service.get_changes(CHANGE_LOG, self.version)
+            if not self.loaded or changes is None or any(change["op"] == "rebuild" for change in changes):
+                # The database already has the changes logged after a rebuild
+                await asyncio.to_thread(self.rebuild)
+            else:
+                self._apply_changes(changes)
+            self.version = version
+
+    def _apply_changes(self, changes: List[dict]) -> None:
+        for change in changes:
+            if change["op"] == "add":
+                self._add(change["id"], change["name"])
+            else:
+                self._remove(change["id"])
+
+    async def _publish(self, changes: List[dict]) -> None:
+        self._apply_changes(changes)
+        version = await self.redis_service.publish_changes(CHANGE_LOG, changes)
+        # Only skip our own changes when nobody else wrote in between
+        if version == self.version + len(changes):
+            self.version = version
+
+    async def add(self, company_id: int, name: str) -> None:
+        """Indexes a new or renamed company."""
+        await self._publish([{"op": "add", "id": company_id, "name": name}])
+
+    async def remove(self, company_id: int) -> None:
+        """Removes a deleted company."""
+        await self._publish([{"op": "remove", "id": company_id}])
+
+    async def invalidate(self) -> None:
+        """Makes every worker rebuild, e.g. after companies were written without the API."""
+        await self.redis_service.publish_change(CHANGE_LOG, {"op": "rebuild"})
+        self.loaded = False
+
+    async def apply(self, added: Iterable[Company] = (), removed_ids: Iterable[int] = ()) -> None:
+        """Indexes new or renamed companies and removes deleted ones with one change log write."""
+        changes = [{"op": "remove", "id": company_id} for company_id in removed_ids]
+        changes += [{"op": "add", "id": company.id, "name": company.name} for company in added]
+        if changes:
+            await self._publish(changes)
+
+    def prefix(self, query: str, limit: int) -> List[dict]:
+        """Companies with a name (or a word of it) starting with `query`, full-name matches first."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.entries, (prefix,))
+        end = bisect.bisect_left(self.entries, (prefix + "\uffff",))
+        name_matches, word_matches, seen = [], [], set()
+        for key, company_id, name in self.entries[start:end]:
+            if company_id in seen:
+                continue
+            seen.add(company_id)
+            target = name_matches if normalize(name) == key else word_matches
+            target.append({"id": company_id, "name": name})
+            if len(name_matches) >= limit:
+                break
+        return (name_matches + word_matches)[:limit]
+
+    def fuzzy(self, query: str, limit: int) -> List[dict]:
+        """Trigram similarity matches from PostgreSQL, served by the pg_trgm GIN index."""
+        with timed("autocomplete.fuzzy"), get_db_session("read") as session:
+            rows = session.execute(
+                text(
+                    f'SELECT id, name FROM "{Company.__tablename__}" '
+                    "WHERE name % :query ORDER BY similarity(name, :query) DESC LIMIT :limit"
+                ),
+                {"query": query, "limit": limit},
+            ).fetchall()
+        return [{"id": row.id, "name": row.name} for row in rows]
+
+    async def complete(self, query: str, limit: int = 10, fuzzy: bool = True) -> dict:
+        """
+        Top-N completions from the in-process prefix matches. Only a query no
+        name or word starts with (a typo, an infix) falls back to fuzzy matches,
+        a database query run in a thread.
+        """
+        await self.sync()
+        with timed("autocomplete.prefix"):
+            completions = self.prefix(query, limit)
+        if completions or not fuzzy or len(query.strip()) < 3:
+            return {"completions": completions, "source": "prefix"}
+        return {"completions": await asyncio.to_thread(self.fuzzy, query, limit), "source": "fuzzy"}
@@ -0,0 +1,143 @@
+"""
+    This contains the CacheWarmer, recomputing the cached results of popular searches.
+"""
+
+import asyncio
+import datetime
+import json
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from config.main import config
+from services.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
+
+POPULAR_QUERIES_KEY = "popular_queries"
+# Upper bound of one warming run, another worker takes over once the lock expires
+WARM_LOCK_SECONDS = 300
+
+
+class CacheWarmer:
+    """
+    Counts searches in daily Redis sorted sets and, at startup and after each
+    invalidation of the cache `namespace`, recomputes the results of the most
+    frequent ones, so the hit rate recovers without waiting for users to pay
+    the embedding, search and LLM cost of each popular query.
+
+    A search is identified by its request fields (query and search options),
+    `warm(fields, version)` computes and caches the results of one search for
+    the namespace `version`. Only one worker warms each version.
+    """
+
+    def __init__(
+        self,
+        redis_service: RedisService,
+        namespace: str,
+        warm: Callable[[dict, int], Awaitable[None]],
+        top_n: int = None,
+        concurrency: int = None,
+        check_interval: float = None,
+    ):
+        self.redis_service = redis_service
+        self.namespace = namespace
+        self.warm_search = warm
+        self.top_n = config.CACHE_WARM_TOP_N if top_n is None else top_n
+        self.concurrency = concurrency or config.CACHE_WARM_CONCURRENCY
+        self.check_interval = config.CACHE_WARM_CHECK_SECONDS if check_interval is None else check_interval
+        self._task: Optional[asyncio.Task] = None
+
+    def _key(self, day: datetime.date) -> str:
+        return f"{POPULAR_QUERIES_KEY}:{self.namespace}:{day.isoformat()}"
+
+    def _keys(self) -> List[str]:
+        today = datetime.datetime.utcnow().date()
+        return [self._key(today - datetime.timedelta(days=days)) for days in range(config.POPULAR_QUERY_DAYS)]
+
+    async def track(self, fields: dict) -> None:
+        """Counts a search, `fields` are the request fields identifying it."""
+        if self.top_n <= 0:
+            return
+        await self.redis_service.increment_score(
+            self._keys()[0],
+            json.dumps(fields, sort_keys=True),
+            config.POPULAR_QUERY_DAYS * 86400,
+            config.POPULAR_QUERY_KEEP,
+        )
+
+    async def popular(self) -> List[dict]:
+        """Request fields of the most frequent searches, most frequent first."""
+        members = await self.redis_service.top_scores(self._keys(), self.top_n)
+        return [json.loads(member) for member, _ in members]
+
+    async def warm(self, version: int) -> int:
+        """
+        Recomputes the popular searches for the namespace `version`, at most
+        `concurrency` at a time. Stops early once the namespace is invalidated
+        again, the results would be cached under a stale version.
+
+        Returns:
+            int: The number of searches warmed
+        """
+        if not await self.redis_service.set_if_absent(
+            f"warm_lock:{self.namespace}:{version}", 1, WARM_LOCK_SECONDS
+        ):
+            return 0
+        searches = await self.popular()
+        if not searches:
+            return 0
+
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def warm_one(fields: dict) -> bool:
+            async with semaphore:
+                if await self.redis_service.get_namespace_version(self.namespace) != version:
+                    return False
+                try:
+                    await self.warm_search(fields, version)
+                    return True
+                except Exception as e:
+                    logger.error(f"Error warming search {fields}: {e}")
+                    return False
+
+        warmed = sum(await asyncio.gather(*(warm_one(fields) for fields in searches)))
+        logger.info(
+            f"Warmed {warmed} of {len(searches)} popular searches for {self.namespace} "
+            f"version {version} in {time.perf_counter() - start:.1f}s"
+        )
+        return warmed
+
+    async def _run(self) -> None:
+        """
+        Warms at startup, then whenever the namespace version changed and held
+        still for one check interval, so a burst of writes is warmed once.
+        """
+        warmed, seen = None, None
+        while True:
+            try:
+                version = await self.redis_service.get_namespace_version(self.namespace)
+                if version != warmed and (warmed is None or version == seen):
+                    await self.warm(version)
+                    warmed = version
+                seen = version
+            except Exception as e:
+                logger.error(f"Error warming the {self.namespace} cache: {e}")
+            await asyncio.sleep(self.check_interval)
+
+    def start(self) -> None:
+        """Starts the background warming task on the running event loop."""
+        if self.top_n <= 0 or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run(), name=f"cache-warmer-{self.namespace}")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
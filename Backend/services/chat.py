@@ -4,13 +4,22 @@
 
 import logging
 import json
+import hashlib
+import groq
+import openai
 from groq import Groq
 from openai import OpenAI
 
 from services.postgres_searcher import PostgresSearcher
 from services.qdrant_searcher import QdrantSearcher
+from services.numpy_searcher import NumpySearcher
 from config.main import config
 from models.company import Company
+from services import deadline
+from services.deadline import DeadlineExceeded
+from services.metrics import FALLBACKS, record_llm_usage, timed
+from services.context_builder import ContextBuilder
+from services.redis_service import RedisService
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +35,12 @@ You must use tool `search_companies` to search for companies based on the search
 - Your answer must always show a two liner summary of all the companies found.
 """
 
+SESSION_PROMPT = PROMPT + """
+- This is a multi-turn conversation. When the user narrows down or re-orders companies you already found
+  (e.g. "only the ones in Berlin", "which is largest?"), use the `refine_companies` tool instead of searching again.
+- Only use `search_companies` again when the user asks for companies you have not searched for yet.
+"""
+
 
 class ChatService:
     """
@@ -38,44 +53,85 @@ class ChatService:
         self.model = "llama-3.3-70b-versatile"
         self.openai_model = "gpt-4o"
         self.open_source = True
-        self.use_qdrant = True
-        self.use_postgres = False
+        self.context_builder = ContextBuilder()
+        self.redis_service = RedisService()
+        self.use_qdrant = config.SEARCH_BACKEND == "qdrant"
+        self.use_postgres = config.SEARCH_BACKEND == "postgres"
+        self.use_numpy = config.SEARCH_BACKEND == "numpy"
         
         # Initialize searcher based on preference
         if self.use_qdrant:
             logger.info("Using Qdrant as vector database for search")
+            self.searcher_name = "Qdrant"
             self.searcher = QdrantSearcher(Company)
         elif self.use_postgres:
             logger.info("Using PostgreSQL as vector database for search")
+            self.searcher_name = "PostgreSQL"
             self.searcher = PostgresSearcher(Company)
+        elif self.use_numpy:
+            logger.info("Using in-process numpy index for search")
+            self.searcher_name = "NumPy"
+            self.searcher = NumpySearcher(Company)
+        else:
+            raise ValueError(f"Unknown SEARCH_BACKEND: {config.SEARCH_BACKEND}")
+        # Full-text search used when the vector search misses the request deadline
+        self.fulltext_searcher = self.searcher if self.use_postgres else PostgresSearcher(Company)
 
-    def search_companies(self, search_query: str):
+    def search_companies(
+        self,
+        search_query: str,
+        sent_ids: set = None,
+        candidates: list = None,
+        top: int = 5,
+        search_options: dict = None,
+    ):
         """
         This function is used to search companies based on the search_query.
         Works with both PostgreSQL and Qdrant searchers.
+
+        The tool result is packed into the context token budget, companies in
+        `sent_ids` were already sent in this conversation and are only named.
+        When `candidates` is given (conversation sessions), a larger pool is
+        retrieved and stored in it so follow-ups can be refined locally.
+        `search_options` are passed to the searcher (MMR `mmr_lambda` and `fetch_k`).
         """
         company_recommendations = []
         try:
-            logger.info(f"Searching companies with query: {search_query} using {'Qdrant' if self.use_qdrant else 'PostgreSQL'}")
-            response: list[Company] = self.searcher.search_and_embed(search_query)
+            logger.info(f"Searching companies with query: {search_query} using {self.searcher_name}")
+            fetch = config.SESSION_CANDIDATE_POOL if candidates is not None else top
+            with timed("search_companies"):
+                try:
+                    response: list[Company] = self.searcher.search_and_embed(
+                        search_query, top=fetch, **(search_options or {})
+                    )
+                except DeadlineExceeded as e:
+                    logger.warning(f"{self.searcher_name} search out of time, falling back to full-text search: {e}")
+                    FALLBACKS.labels(self.searcher_name.lower(), "text_only").inc()
+                    deadline.degrade("fulltext_only")
+                    response = self.fulltext_searcher.search_and_embed(
+                        search_query, top=fetch, enable_vector_search=False, **(search_options or {})
+                    )
+            if candidates is not None:
+                candidates[:] = response
+                response = response[:top]
             company_recommendations.extend(response)
             
             if not response:
                 return "No companies found for the given search query.", []
             
-            # Create response text from company content
-            response_text = "\n".join([
-                company.content if company.content else company.to_str() 
-                for company in response
-            ])
+            # Pack the query-relevant parts of each company into the token budget
+            with timed("context_build"):
+                response_text = self.context_builder.build(
+                    search_query, response, sent_ids if sent_ids is not None else set()
+                )
             
             return (
-                f"Retrieved the following companies based on your search query (using {'Qdrant' if self.use_qdrant else 'PostgreSQL'}):\n"
+                f"Retrieved the following companies based on your search query (using {self.searcher_name}):\n"
                 f"{response_text}"
             ), company_recommendations
             
         except Exception as e:
-            logger.error(f"Error searching companies with {'Qdrant' if self.use_qdrant else 'PostgreSQL'}: {e}")
+            logger.error(f"Error searching companies with {self.searcher_name}: {e}")
             return f"Error searching companies: {str(e)}", []
 
     def search_tool_definition(self):
@@ -104,60 +160,264 @@ class ChatService:
             },
         }
 
-    def generate_response(self, user_query):
+    def refine_companies(
+        self,
+        candidates: list,
+        location: str = None,
+        industry: str = None,
+        size: str = None,
+        keywords: str = None,
+        sort_by: str = "relevance",
+        top: int = 5,
+        sent_ids: set = None,
+    ):
+        """
+        This function filters and re-ranks the companies retrieved earlier in the
+        conversation, without embedding or searching again.
+        """
+        def matches(value, expected):
+            return expected is None or expected.lower() in (value or "").lower()
+
+        terms = [term.lower() for term in (keywords or "").split()]
+        refined = [
+            company for company in candidates
+            if matches(company.location, location)
+            and matches(company.industry, industry)
+            and matches(company.size, size)
+            and all(
+                term in f"{company.name} {company.description} {company.content}".lower()
+                for term in terms
+            )
+        ]
+        if sort_by in ("size_desc", "size_asc"):
+            refined.sort(key=lambda company: company_size(company.size), reverse=sort_by == "size_desc")
+        refined = refined[:top]
+
+        if not refined:
+            return "None of the previously found companies match these criteria.", []
+        with timed("context_build"):
+            response_text = self.context_builder.build(
+                " ".join(filter(None, [location, industry, size, keywords])),
+                refined,
+                sent_ids if sent_ids is not None else set(),
+            )
+        return (
+            f"Refined the previously found companies (sorted by {sort_by}):\n{response_text}"
+        ), refined
+
+    def refine_tool_definition(self):
+        """
+        This function is used to get the definition of the refine tool.
+        """
+        return {
+            "type": "function",
+            "function": {
+                "name": "refine_companies",
+                "description": (
+                    "This function filters and re-orders the companies already found in this conversation. "
+                    "Use it for follow-ups instead of searching again."
+                ),
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "location": {"type": "string", "description": "Keep companies whose location contains this text, eg: 'Berlin'"},
+                        "industry": {"type": "string", "description": "Keep companies whose industry contains this text"},
+                        "size": {"type": "string", "description": "Keep companies with this size range, eg: '500-1000'"},
+                        "keywords": {"type": "string", "description": "Keep companies mentioning all of these words"},
+                        "sort_by": {
+                            "type": "string",
+                            "enum": ["relevance", "size_desc", "size_asc"],
+                            "description": "Order of the results, size_desc puts the largest companies first",
+                        },
+                        "top": {"type": "integer", "description": "Maximum number of companies to return"},
+                    },
+                },
+            },
+        }
+
+    def completion_cache_key(self, model: str, tools: list, messages: list) -> str:
+        """
+        Stable key of a chat completion request: the same model, tools and
+        message history always map to the same key.
+        """
+        request = json.dumps(
+            {"model": model, "tools": tools, "messages": messages},
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return f"llm_completion:{hashlib.sha256(request.encode('utf-8')).hexdigest()}"
+
+    def create_completion(self, messages: list, tools: list = None) -> dict:
+        """
+        Runs one chat completion turn, served from the completion cache when the
+        exact same request was answered before.
+
+        Returns:
+            dict: The assistant message as {"content": ..., "tool_calls": [...]}
+        """
+        if self.open_source:
+            provider, client, model = "groq", self.client, self.model
+        else:
+            provider, client, model = "openai", self.openai_client, self.openai_model
+        tools = tools or [self.search_tool_definition()]
+
+        cache_key = self.completion_cache_key(model, tools, messages)
+        if config.LLM_CACHE_TTL > 0:
+            cached = self.redis_service.get_compressed(cache_key)
+            if cached is not None:
+                logger.info("Completion served from cache")
+                return cached
+
+        # Raises DeadlineExceeded when too little of the request budget is left for a completion
+        deadline.check(f"llm.{provider}", config.DEADLINE_LLM_MIN_SECONDS)
+        try:
+            with timed(f"llm.{provider}"):
+                response = deadline.with_deadline(client).chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    tool_choice="auto",
+                    tools=tools,
+                )
+        except (openai.APITimeoutError, groq.APITimeoutError) as e:
+            if deadline.remaining() is None:
+                raise
+            raise DeadlineExceeded(f"llm.{provider} timed out") from e
+        record_llm_usage(provider, model, response.usage)
+
+        response_message = response.choices[0].message
+        message = {
+            "content": response_message.content,
+            "tool_calls": [
+                {
+                    "id": tool_call.id,
+                    "type": "function",
+                    "function": {
+                        "name": tool_call.function.name,
+                        "arguments": tool_call.function.arguments,
+                    },
+                }
+                for tool_call in response_message.tool_calls or []
+            ],
+        }
+        if config.LLM_CACHE_TTL > 0:
+            self.redis_service.set_compressed(cache_key, message, config.LLM_CACHE_TTL)
+        return message
+
+    def generate_response(self, user_query, search_options: dict = None):
         """
         This function is used to generate response for the user query.
+
+        Each turn goes through the completion cache. The tool-selection turn only
+        depends on the prompt and the query, so it is reused after company writes;
+        the summary turn includes the tool result and is recomputed when it changes.
         """
         messages = [
             {"role": "system", "content": PROMPT},
             {"role": "user", "content": user_query},
         ]
+        content, company_recommendations = self.run_conversation(
+            messages, [self.search_tool_definition()], search_options=search_options
+        )
+        return content, company_recommendations
+
+    def continue_session(self, session: dict, user_query: str, search_options: dict = None):
+        """
+        This function is used to answer a follow-up query within a conversation session.
+
+        The session holds the message history, the candidate companies of the
+        last search and the ids already sent to the model. It is updated in place,
+        the history trimmed to SESSION_HISTORY_TURNS turns so the prompt stays bounded.
+        """
+        candidates = [Company(**candidate) for candidate in session.get("candidates", [])]
+        sent_ids = set(session.get("sent_ids", []))
+        messages = [
+            {"role": "system", "content": SESSION_PROMPT},
+            *session.get("messages", []),
+            {"role": "user", "content": user_query},
+        ]
+        tools = [self.search_tool_definition()]
+        if candidates:
+            tools.append(self.refine_tool_definition())
+
+        content, company_recommendations = self.run_conversation(
+            messages, tools, candidates, sent_ids, search_options
+        )
+        messages.append({"role": "assistant", "content": content})
+
+        session["messages"] = session_history(messages[1:], config.SESSION_HISTORY_TURNS)
+        session["candidates"] = [
+            {**company.to_dict(), "content": company.content} for company in candidates
+        ]
+        session["sent_ids"] = sorted(sent_ids)
+        return content, company_recommendations
+
+    def run_conversation(
+        self,
+        messages: list,
+        tools: list,
+        candidates: list = None,
+        sent_ids: set = None,
+        search_options: dict = None,
+    ):
+        """
+        This function runs the tool calling loop until the model answers.
+
+        `candidates` is None for stateless searches; for sessions it holds the
+        retrieved pool that `refine_companies` works on.
+        """
         company_recommendations = []
+        sent_ids = sent_ids if sent_ids is not None else set()
+        user_query = messages[-1]["content"]
+        searched = False
         while True:
-            if self.open_source:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    tool_choice="auto",
-                    tools=[self.search_tool_definition()],
-                )
-            else:
-                response = self.openai_client.chat.completions.create(
-                    model=self.openai_model,
-                    messages=messages,
-                    tool_choice="auto",
-                    tools=[self.search_tool_definition()],
-                )
-            response_message = response.choices[0].message
+            try:
+                response_message = self.create_completion(messages, tools)
+            except DeadlineExceeded as e:
+                # Out of time for the model: search with the query as typed and
+                # answer with the ranked companies instead of a summary
+                logger.warning(f"Skipping the LLM: {e}")
+                FALLBACKS.labels("llm", "deadline").inc()
+                if not searched:
+                    deadline.degrade("tool_selection_skipped")
+                    _, company_recommendations = self.search_companies(
+                        user_query, sent_ids=sent_ids, candidates=candidates, search_options=search_options
+                    )
+                deadline.degrade("summary_skipped")
+                return self.ranked_companies_response(company_recommendations), company_recommendations
 
-            if response_message.tool_calls:
-                tool_calls = response_message.tool_calls
+            if response_message["tool_calls"]:
+                tool_calls = response_message["tool_calls"]
                 messages.append(
                     {
                         "role": "assistant",
-                        "tool_calls": [
-                            tool_call.model_dump() for tool_call in tool_calls
-                        ],
+                        "tool_calls": tool_calls,
                     }
                 )
-                tools_names = [tool_call.function.name for tool_call in tool_calls]
+                tools_names = [tool_call["function"]["name"] for tool_call in tool_calls]
                 logger.info("Tools used: %s", tools_names)
                 tool_call = tool_calls[0]
+                tool_name = tool_call["function"]["name"]
                 try:
-                    logger.info("Calling tool: %s", tool_call.function.name)
-                    tool_name = tool_call.function.name
-                    tool_args = json.loads(tool_call.function.arguments)
+                    logger.info("Calling tool: %s", tool_name)
+                    tool_args = json.loads(tool_call["function"]["arguments"])
                     logger.info("Tool arguments: %s", tool_args)
-                    tool_result, company_recommendations = self.search_companies(
-                        **tool_args
-                    )
+                    if tool_name == "refine_companies" and candidates:
+                        tool_result, company_recommendations = self.refine_companies(
+                            candidates, **tool_args, sent_ids=sent_ids
+                        )
+                    else:
+                        tool_result, company_recommendations = self.search_companies(
+                            **tool_args, sent_ids=sent_ids, candidates=candidates,
+                            search_options=search_options,
+                        )
                 except Exception as e:  # pylint: disable=broad-except
                     tool_result = str(e)
+                searched = True
 
                 logger.info("Tool result: %s", tool_result)
                 messages.append(
                     {
-                        "tool_call_id": tool_call.id,
+                        "tool_call_id": tool_call["id"],
                         "role": "tool",
                         "name": tool_name,
                         "content": tool_result,
@@ -166,4 +426,39 @@ class ChatService:
             else:
                 break
 
-        return response_message.content, company_recommendations
+        return response_message["content"], company_recommendations
+
+    @staticmethod
+    def ranked_companies_response(companies: list) -> str:
+        """Markdown answer listing the companies in rank order, used when the LLM summary is skipped."""
+        if not companies:
+            return "No companies found for the given search query."
+        lines = [
+            f"{rank}. **{company.name}** - {company.industry}, {company.location}"
+            for rank, company in enumerate(companies, start=1)
+        ]
+        return "Companies ranked by relevance to your search:\n\n" + "\n".join(lines)
+
+
+def company_size(size: str) -> int:
+    """Lower bound of a size range such as '500-1000' or '5000+', used for sorting."""
+    digits = "".join(ch if ch.isdigit() else " " for ch in size or "").split()
+    return int(digits[0]) if digits else 0
+
+
+def session_history(messages: list, turns: int) -> list:
+    """
+    The last `turns` turns of a conversation, a turn being a user message and
+    what followed it. Earlier turns keep only the user query and the answer:
+    their tool results are the bulk of the prompt, and the companies they
+    listed are still in the session candidates.
+    """
+    starts = [i for i, message in enumerate(messages) if message["role"] == "user"]
+    if not starts:
+        return []
+    kept = messages[starts[max(len(starts) - max(turns, 1), 0)]:]
+    last = len(kept) - (len(messages) - starts[-1])
+    return [
+        message for i, message in enumerate(kept)
+        if i >= last or (message["role"] != "tool" and not message.get("tool_calls"))
+    ]
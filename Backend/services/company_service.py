@@ -0,0 +1,314 @@
+"""
+    This contains the CompanyService, the write path for single and bulk company changes.
+"""
+
+import asyncio
+import logging
+from collections import Counter
+from functools import partial
+from typing import Callable, Dict, Iterable, List
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from models.company import Company
+from models.database import get_db_session
+from services.metrics import timed
+from services.search_index import IndexSwitched
+
+logger = logging.getLogger(__name__)
+
+# Cache keys of search results and company listings embed this namespace's version
+CACHE_NAMESPACE = "companies"
+CONTENT_FIELDS = ["name", "description", "industry", "size", "location"]
+
+
+def company_content(values: dict) -> str:
+    """The text embedded for a company."""
+    return "\n".join(f"{values[field]}" for field in CONTENT_FIELDS)
+
+
+def error_message(error: Exception) -> str:
+    # DBAPI errors carry the database message, without the statement and parameters
+    return str(getattr(error, "orig", None) or error).strip()
+
+
+class CompanyService:
+    """
+    Creates, updates and deletes companies in batches: contents are embedded in
+    batched calls, all rows are written in one transaction, and Qdrant, the
+    NumPy index, autocomplete, facets and the cache are synced once per batch.
+
+    Every item gets its own status, a row failing to embed or to write only
+    fails that item. Embedding calls, database and Qdrant writes block, they
+    run in a worker thread rather than on the event loop.
+    """
+
+    def __init__(self, chat_service, search_index, redis_service, autocomplete_index, facet_service):
+        self.chat_service = chat_service
+        self.search_index = search_index
+        self.redis_service = redis_service
+        self.autocomplete_index = autocomplete_index
+        self.facet_service = facet_service
+
+    def _embed(self, contents: List[str], generation: dict) -> list:
+        """
+        Embeddings of `contents` in batched calls, with the model of the search
+        index `generation`. When a batch fails the contents are embedded one by
+        one, so the item that cannot be embedded is an exception in the result
+        and the others still get their vector.
+        """
+        if not contents:
+            return []
+        logger.info(f"Generating {generation['embedding_backend']} embeddings for {len(contents)} companies")
+        try:
+            embeddings = self.search_index.embed_multiple(contents, generation)
+            if len(embeddings) == len(contents):
+                return embeddings
+            logger.error(f"Got {len(embeddings)} embeddings for {len(contents)} companies, embedding one by one")
+        except Exception as e:
+            logger.error(f"Error generating embeddings in batch, embedding one by one: {e}")
+        embeddings = []
+        for content in contents:
+            try:
+                embeddings.append(self.search_index.embed(content, generation))
+            except Exception as e:
+                logger.error(f"Error generating embedding: {e}")
+                embeddings.append(e)
+        return embeddings
+
+    @staticmethod
+    def _run_in_savepoints(session, operations: Dict[int, Callable]) -> Dict[int, str]:
+        """
+        Applies and flushes all `operations` in one savepoint. If that fails it is
+        rolled back and every operation is retried in its own savepoint, so a row
+        violating a constraint is the only one left out of the transaction.
+
+        Returns:
+            Error messages by item index
+        """
+        if not operations:
+            return {}
+        try:
+            with session.begin_nested():
+                for operation in operations.values():
+                    operation()
+            return {}
+        except SQLAlchemyError as e:
+            logger.warning(f"Batch write failed, retrying {len(operations)} rows one by one: {error_message(e)}")
+        errors = {}
+        for index, operation in operations.items():
+            try:
+                with session.begin_nested():
+                    operation()
+            except SQLAlchemyError as e:
+                errors[index] = error_message(e)
+        return errors
+
+    def _commit(self, session, results: List[dict], operations: Dict[int, Callable], generation: dict = None) -> bool:
+        """
+        Commits the transaction, on failure every written item is marked as failed.
+        Embeddings made for `generation` are only written while it is still the
+        active search index.
+        """
+        if generation is not None and operations:
+            try:
+                self.search_index.verify(session, generation["generation"])
+            except IndexSwitched as e:
+                session.rollback()
+                logger.warning(f"{e}, failing {len(operations)} company writes")
+                for index in operations:
+                    results[index].update(status="failed", error="Search index switched during the write, retry")
+                return False
+        errors = self._run_in_savepoints(session, operations)
+        for index, error in errors.items():
+            results[index].update(status="failed", error=error)
+        try:
+            with timed("postgres.bulk_commit"):
+                session.commit()
+            return True
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error committing {len(operations)} company writes: {e}")
+            for index in operations:
+                if index not in errors:
+                    results[index].update(status="failed", error=error_message(e))
+            return False
+
+    @staticmethod
+    def _failed(index: int, error: str, company_id: int = None) -> dict:
+        return {"index": index, "status": "failed", "id": company_id, "error": error}
+
+    @staticmethod
+    def _duplicates(ids: List[int]) -> set:
+        return {company_id for company_id, count in Counter(ids).items() if count > 1}
+
+    async def _after_write(
+        self,
+        upserted: Iterable[Company] = (),
+        deleted: Iterable[Company] = (),
+        replaced: Iterable[Company] = (),
+    ) -> None:
+        """
+        Syncs the search index, autocomplete and facets with committed writes and
+        invalidates the cached results once. `replaced` are the previous values of
+        updated companies, only used to decrement their facet counts.
+        """
+        upserted, deleted, replaced = list(upserted), list(deleted), list(replaced)
+        if not (upserted or deleted):
+            return
+        if self.chat_service.use_qdrant:
+            await asyncio.to_thread(self._sync_qdrant, upserted, deleted)
+        elif self.chat_service.use_numpy:
+            # Appends a delta segment, blocking file and database work kept off the event loop
+            await asyncio.to_thread(
+                self.chat_service.searcher.refresh, [company.id for company in upserted + deleted]
+            )
+
+        await self.autocomplete_index.apply(added=upserted, removed_ids=[company.id for company in deleted])
+        await self.facet_service.apply(added=upserted, removed=deleted + replaced)
+        await self.redis_service.bump_namespace_version(CACHE_NAMESPACE)
+
+    def _sync_qdrant(self, upserted: List[Company], deleted: List[Company]) -> None:
+        self.chat_service.searcher.upsert_companies(upserted)
+        self.chat_service.searcher.delete_companies([company.id for company in deleted])
+
+    async def create(self, items: List[dict]) -> List[dict]:
+        """
+        Creates companies from dicts holding the CONTENT_FIELDS.
+
+        Returns:
+            Per item results: index, status ("created" or "failed"), id and error
+        """
+        results, created = await asyncio.to_thread(self._create, items)
+        await self._after_write(upserted=created)
+        return results
+
+    def _create(self, items: List[dict]) -> tuple:
+        generation = self.search_index.current()
+        contents = [company_content(item) for item in items]
+        with timed("companies.bulk_embed"):
+            embeddings = self._embed(contents, generation)
+
+        results, companies = [], {}
+        for index, (item, content, embedding) in enumerate(zip(items, contents, embeddings)):
+            if isinstance(embedding, Exception):
+                results.append(self._failed(index, "Failed to generate embeddings"))
+                continue
+            results.append({"index": index, "status": "created", "id": None})
+            companies[index] = Company(
+                **{field: item[field] for field in CONTENT_FIELDS}, content=content, embedding=embedding
+            )
+
+        with get_db_session() as session:
+            operations = {index: partial(session.add, company) for index, company in companies.items()}
+            committed = self._commit(session, results, operations, generation)
+
+        created = []
+        if committed:
+            for index, company in companies.items():
+                if results[index]["status"] == "created":
+                    results[index]["id"] = company.id
+                    created.append(company)
+        return results, created
+
+    async def update(self, items: List[dict]) -> List[dict]:
+        """
+        Applies partial updates, dicts holding an `id` and the CONTENT_FIELDS to
+        change. Only items changing a content field are re-embedded.
+
+        Returns:
+            Per item results: index, status ("updated", "not_found" or "failed"), id and error
+        """
+        results, upserted, replaced = await asyncio.to_thread(self._update, items)
+        await self._after_write(upserted=upserted, replaced=replaced)
+        return results
+
+    def _update(self, items: List[dict]) -> tuple:
+        generation = self.search_index.current()
+        ids = [item["id"] for item in items]
+        duplicates = self._duplicates(ids)
+        with get_db_session() as session:
+            companies = {
+                company.id: company
+                for company in session.query(Company).filter(Company.id.in_(set(ids))).all()
+            }
+
+            results, changes = [], {}
+            for index, item in enumerate(items):
+                company = companies.get(item["id"])
+                if item["id"] in duplicates:
+                    results.append(self._failed(index, "Company id appears more than once in the batch", item["id"]))
+                elif company is None:
+                    results.append({"index": index, "status": "not_found", "id": item["id"]})
+                else:
+                    results.append({"index": index, "status": "updated", "id": item["id"]})
+                    changes[index] = {
+                        field: item[field] for field in CONTENT_FIELDS
+                        if item.get(field) is not None and item[field] != getattr(company, field)
+                    }
+
+            reembed = [index for index, values in changes.items() if values]
+            contents = {
+                index: company_content({**companies[items[index]["id"]].to_dict(), **changes[index]})
+                for index in reembed
+            }
+            with timed("companies.bulk_embed"):
+                embeddings = dict(zip(reembed, self._embed([contents[index] for index in reembed], generation)))
+
+            # Facet counts of the previous values are decremented after the commit
+            previous, operations = {}, {}
+            for index in reembed:
+                company = companies[items[index]["id"]]
+                if isinstance(embeddings[index], Exception):
+                    results[index] = self._failed(index, "Failed to generate embeddings", company.id)
+                    continue
+                previous[index] = Company(**{field: getattr(company, field) for field in CONTENT_FIELDS})
+                values = {**changes[index], "content": contents[index], "embedding": embeddings[index]}
+                operations[index] = partial(self._assign, company, values)
+            committed = self._commit(session, results, operations, generation if reembed else None)
+
+        updated = [index for index in operations if committed and results[index]["status"] == "updated"]
+        return (
+            results,
+            [companies[items[index]["id"]] for index in updated],
+            [previous[index] for index in updated],
+        )
+
+    @staticmethod
+    def _assign(company: Company, values: dict) -> None:
+        for field, value in values.items():
+            setattr(company, field, value)
+
+    async def delete(self, ids: List[int]) -> List[dict]:
+        """
+        Deletes companies by id.
+
+        Returns:
+            Per item results: index, status ("deleted", "not_found" or "failed"), id and error
+        """
+        results, deleted = await asyncio.to_thread(self._delete, ids)
+        await self._after_write(deleted=deleted)
+        return results
+
+    def _delete(self, ids: List[int]) -> tuple:
+        duplicates = self._duplicates(ids)
+        with get_db_session() as session:
+            companies = {
+                company.id: company
+                for company in session.query(Company).filter(Company.id.in_(set(ids))).all()
+            }
+            results, operations = [], {}
+            for index, company_id in enumerate(ids):
+                if company_id in duplicates:
+                    results.append(self._failed(index, "Company id appears more than once in the batch", company_id))
+                elif company_id not in companies:
+                    results.append({"index": index, "status": "not_found", "id": company_id})
+                else:
+                    results.append({"index": index, "status": "deleted", "id": company_id})
+                    operations[index] = partial(session.delete, companies[company_id])
+            committed = self._commit(session, results, operations)
+
+        deleted = [
+            companies[ids[index]] for index in operations if committed and results[index]["status"] == "deleted"
+        ]
+        return results, deleted
@@ -0,0 +1,125 @@
+"""
+Token-budgeted context assembly for the `search_companies` tool result.
+"""
+
+import logging
+import re
+from typing import Iterable, List, Set
+
+from config.main import config
+from models.company import Company
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+STOP_WORDS = {
+    "a", "an", "and", "are", "based", "companies", "company", "for", "in", "is",
+    "of", "on", "or", "that", "the", "to", "which", "with",
+}
+
+
+class Tokenizer:
+    """
+    Local token counter. Uses tiktoken's cl100k_base encoding when it is installed
+    and its vocabulary is available offline, otherwise a word/punctuation split
+    which is close enough for budgeting.
+    """
+
+    def __init__(self):
+        self._encoding = None
+        try:
+            import tiktoken  # pylint: disable=import-outside-toplevel
+            self._encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:  # pylint: disable=broad-except
+            logger.info(f"tiktoken unavailable ({e}), using approximate token counts")
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return len(WORD_PATTERN.findall(text))
+
+
+class ContextBuilder:
+    """
+    Packs company snippets into a token budget.
+
+    Every company gets a one line header (name, industry, size, location) and the
+    description sentences most relevant to the query, up to a per-company budget.
+    Companies already sent earlier in the conversation are only referenced by name.
+    """
+
+    def __init__(self, token_budget: int = None, company_token_budget: int = None):
+        self.token_budget = token_budget or config.CONTEXT_TOKEN_BUDGET
+        self.company_token_budget = company_token_budget or config.CONTEXT_COMPANY_TOKEN_BUDGET
+        self.tokenizer = Tokenizer()
+
+    @staticmethod
+    def _terms(text: str) -> Set[str]:
+        return {
+            word for word in re.findall(r"[a-z0-9]+", text.lower())
+            if word not in STOP_WORDS
+        }
+
+    def _relevant_sentences(self, query_terms: Set[str], description: str, budget: int) -> str:
+        """Keeps the best matching sentences within `budget` tokens, in their original order."""
+        sentences = [s for s in SENTENCE_PATTERN.split(description.strip()) if s]
+        ranked = sorted(
+            range(len(sentences)),
+            key=lambda i: (-len(query_terms & self._terms(sentences[i])), i),
+        )
+        selected, used = [], 0
+        for i in ranked:
+            tokens = self.tokenizer.count(sentences[i])
+            if used + tokens > budget:
+                continue
+            selected.append(i)
+            used += tokens
+        if not selected and sentences:
+            # Truncate the best sentence rather than dropping the description entirely
+            words = sentences[ranked[0]].split()
+            return " ".join(words[:max(budget // 2, 1)]) + "..."
+        return " ".join(sentences[i] for i in sorted(selected))
+
+    def _snippet(self, query_terms: Set[str], company: Company) -> str:
+        header = f"- {company.name} | {company.industry} | {company.size} | {company.location}"
+        description = company.description or company.content or ""
+        budget = self.company_token_budget - self.tokenizer.count(header)
+        if budget <= 0 or not description:
+            return header
+        return f"{header}\n  {self._relevant_sentences(query_terms, description, budget)}"
+
+    def build(self, query: str, companies: Iterable[Company], sent_ids: Set[int]) -> str:
+        """
+        Builds the tool result text for `companies` and records them in `sent_ids`.
+
+        Args:
+            query: The search query, used to pick relevant sentences
+            companies: Companies in ranking order
+            sent_ids: Ids of companies already sent in this conversation, updated in place
+
+        Returns:
+            str: The packed context
+        """
+        query_terms = self._terms(query)
+        lines: List[str] = []
+        used = 0
+        omitted = 0
+        for company in companies:
+            if company.id is not None and company.id in sent_ids:
+                snippet = f"- {company.name} (already listed above)"
+            else:
+                snippet = self._snippet(query_terms, company)
+            tokens = self.tokenizer.count(snippet)
+            if used + tokens > self.token_budget:
+                omitted += 1
+                continue
+            lines.append(snippet)
+            used += tokens
+            if company.id is not None:
+                sent_ids.add(company.id)
+        if omitted:
+            lines.append(f"({omitted} more companies omitted to fit the context budget)")
+        return "\n".join(lines)
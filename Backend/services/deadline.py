@@ -0,0 +1,101 @@
+"""
+Per-request deadlines for the search pipeline.
+
+A request started with `start_deadline(seconds)` carries an absolute deadline
+in a context variable. Stages read the time left to bound their calls (client
+timeouts, statement_timeout) and record the degradations they fall back to,
+returned with the response.
+"""
+
+import contextvars
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+_degradations: ContextVar[Optional[List[str]]] = ContextVar("degradations", default=None)
+
+# Runs blocking calls without a timeout of their own (e.g. Pinecone inference)
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="deadline")
+
+
+class DeadlineExceeded(Exception):
+    """Not enough of the request budget is left for a stage."""
+
+
+def start_deadline(seconds: float) -> List[str]:
+    """
+    Starts a deadline `seconds` from now for the current request, no deadline
+    when `seconds` is 0. Returns the list the degradations are recorded in.
+    """
+    degradations: List[str] = []
+    _deadline.set(time.monotonic() + seconds if seconds > 0 else None)
+    _degradations.set(degradations)
+    return degradations
+
+
+def remaining(reserve: float = 0.0) -> Optional[float]:
+    """Seconds left before the deadline minus `reserve`, None without a deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - reserve - time.monotonic()
+
+
+def check(stage: str, needed: float = 0.0, reserve: float = 0.0) -> None:
+    """Raises DeadlineExceeded unless `needed` seconds are left before the deadline minus `reserve`."""
+    left = remaining(reserve)
+    if left is not None and left <= needed:
+        raise DeadlineExceeded(f"{left:.3f}s left for {stage}, {needed:.3f}s needed")
+
+
+def with_deadline(client, reserve: float = 0.0):
+    """
+    An OpenAI-compatible client (OpenAI, Groq) bounded by the time left and
+    without retries, or `client` itself without a deadline.
+    """
+    left = remaining(reserve)
+    if left is None:
+        return client
+    return client.with_options(timeout=max(left, 0.001), max_retries=0)
+
+
+def timeout_ms(reserve: float = 0.0) -> Optional[int]:
+    """Milliseconds left, e.g. for statement_timeout, None without a deadline."""
+    left = remaining(reserve)
+    return None if left is None else max(int(left * 1000), 1)
+
+
+def timeout_seconds(reserve: float = 0.0) -> Optional[int]:
+    """Whole seconds left rounded up, for APIs taking an integer timeout, None without a deadline."""
+    left = remaining(reserve)
+    return None if left is None else max(math.ceil(left), 1)
+
+
+def run_within(stage: str, fn: Callable, *args, reserve: float = 0.0, **kwargs):
+    """
+    Calls `fn`, giving up with DeadlineExceeded once the deadline minus `reserve`
+    passes. Without a deadline it is a plain call. The abandoned call finishes
+    in the background, its result is discarded.
+    """
+    left = remaining(reserve)
+    if left is None:
+        return fn(*args, **kwargs)
+    check(stage, reserve=reserve)
+    # The context is copied so timings and the deadline follow into the thread
+    future = _executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    try:
+        return future.result(timeout=left)
+    except FutureTimeoutError as e:
+        future.cancel()
+        raise DeadlineExceeded(f"{stage} did not finish within {left:.3f}s") from e
+
+
+def degrade(name: str) -> None:
+    """Records a degradation taken by the current request."""
+    degradations = _degradations.get()
+    if degradations is not None and name not in degradations:
+        degradations.append(name)
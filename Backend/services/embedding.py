@@ -1,6 +1,7 @@
 # pylint:disable=all
 
 import logging
+import os
 from typing import (
     TypedDict,
     Union,
@@ -9,22 +10,127 @@ from typing import (
 from openai import OpenAI
 from pinecone import Pinecone
 from config.main import config
+from services import deadline
+from services.local_embedding import LocalEmbeddingBackend, get_local_backend
+from services.metrics import FALLBACKS, timed
 
 logger = logging.getLogger(__name__)
 
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+PINECONE_EMBEDDING_MODEL = "multilingual-e5-large"
+
+
+def embedding_model_name(backend: str = None) -> str:
+    """
+    Name of the model producing the vectors for `backend`, recorded alongside
+    stored embeddings (snapshots, index metadata). Does not create any client.
+    """
+    backend = backend or config.EMBEDDING_BACKEND
+    if backend == "remote":
+        return f"{PINECONE_EMBEDDING_MODEL}|{OPENAI_EMBEDDING_MODEL}"
+    if backend == "onnx":
+        return f"onnx:{os.path.basename(os.path.normpath(config.EMBEDDING_MODEL_PATH or ''))}"
+    return backend
+
+
+def is_matryoshka(model_name: str = None) -> bool:
+    """
+    Whether the leading dimensions of `model_name`'s vectors are an embedding on
+    their own, i.e. every model behind it is listed in MATRYOSHKA_MODELS. The remote
+    backend falls back from Pinecone to OpenAI, both have to qualify.
+    """
+    known = {name.strip().lower() for name in config.MATRYOSHKA_MODELS.split(",") if name.strip()}
+    return all(
+        os.path.basename(part.split(":", 1)[-1].strip().rstrip("/")).lower() in known
+        for part in (model_name or embedding_model_name()).split("|")
+    )
+
+
+def require_matryoshka(model_name: str = None) -> None:
+    """Refuses coarse mode for a model whose truncated vectors are not meaningful."""
+    model_name = model_name or embedding_model_name()
+    if not is_matryoshka(model_name):
+        raise ValueError(
+            f"Coarse search needs a Matryoshka embedding model (MATRYOSHKA_MODELS), "
+            f"'{model_name}' is not one: its truncated vectors would rank candidates at random. "
+            f"Coarse mode is experimental and not supported with the remote backend"
+        )
+
+
 class Embedding:
-    def __init__(self):
+    def __init__(self, backend: str = None):
+        """
+        Initializes the Embedding object with Pinecone and OpenAI clients, or with a
+        local encoder when `config.EMBEDDING_BACKEND` is not "remote".
+
+        :param backend: Overrides `config.EMBEDDING_BACKEND` ("remote", "hashing" or "onnx").
+        """
+        self.backend = backend or config.EMBEDDING_BACKEND
+        self.embedding_model_name = OPENAI_EMBEDDING_MODEL
+        self.pinecone_model = PINECONE_EMBEDDING_MODEL
+        self.local_backend: Union[LocalEmbeddingBackend, None] = None
+
+        if self.backend == "remote":
+            self.client = OpenAI(api_key=config.OPENAI_API_KEY)
+            # Initialize Pinecone client
+            self.pinecone_client = Pinecone(api_key=config.PINECONE_API_KEY)
+        else:
+            # Local backends never touch the network, so no API client is created
+            logger.info(f"Using local embedding backend: {self.backend}")
+            self.local_backend = get_local_backend(self.backend)
+
+    @property
+    def model_name(self) -> str:
+        """Name of the model producing the vectors, recorded alongside stored embeddings."""
+        return embedding_model_name(self.backend)
+
+    def embed(self, content, dimensions=1024):
+        """
+        Generates an embedding with the configured backend. For the remote backend
+        Pinecone is tried first and OpenAI is used as a fallback.
+
+        :param content: The text content to generate an embedding for.
+        :param dimensions: Dimensions of the embedding vector.
+        :return: A list representing the generated embedding.
+        """
+        if self.local_backend is not None:
+            with timed(f"embedding.{self.backend}"):
+                return self.local_backend.embed(content, dimensions)
+        try:
+            with timed("embedding.pinecone"):
+                return self.generate_pinecone(content, dimensions)
+        except Exception as e:
+            logger.error(f"Error generating Pinecone embedding: {e}")
+            logger.info("Falling back to OpenAI embedding")
+            FALLBACKS.labels("embedding", "pinecone_error").inc()
+            with timed("embedding.openai"):
+                return self.generate(content, dimensions)
+
+    def embed_multiple(self, contents, dimensions=1024):
         """
-        Initializes the Embedding object with Pinecone and OpenAI clients.
+        Generates embeddings for multiple pieces of content with the configured backend.
 
-        :param api_key: API key for the OpenAI service.
-        :param model_name: The name of the model to use for generating embeddings.
+        :param contents: A list of text content to generate embeddings for.
+        :param dimensions: Dimensions of the embedding vectors.
+        :return: A list of embeddings corresponding to the input content.
         """
-        self.client = OpenAI(api_key=config.OPENAI_API_KEY)
-        self.embedding_model_name = "text-embedding-3-small"
-        # Initialize Pinecone client
-        self.pinecone_client = Pinecone(api_key=config.PINECONE_API_KEY)
-        self.pinecone_model = "multilingual-e5-large"
+        if self.local_backend is not None:
+            with timed(f"embedding.{self.backend}_batch"):
+                return self.local_backend.embed_multiple(contents, dimensions)
+        embeddings = []
+        batch_size = config.EMBEDDING_BATCH_SIZE
+        for i in range(0, len(contents), batch_size):
+            batch = contents[i:i + batch_size]
+            try:
+                with timed("embedding.pinecone_batch"):
+                    embeddings.extend(self.generate_multiple_pinecone(batch))
+            except Exception as e:
+                logger.error(f"Error generating multiple Pinecone embeddings: {e}")
+                logger.info("Falling back to OpenAI embeddings")
+                FALLBACKS.labels("embedding", "pinecone_error").inc()
+                with timed("embedding.openai_batch"):
+                    embeddings.extend(self.generate_multiple(batch, dimensions))
+        return embeddings
 
     def generate(self, content, dimensions=None):
         """
@@ -34,7 +140,7 @@ class Embedding:
         :return: A list representing the generated embedding.
         """
         content = content.replace("\n", " ").strip()
-        res = self.client.embeddings.create(
+        res = deadline.with_deadline(self.client).embeddings.create(
             input=[content], model=self.embedding_model_name,
             dimensions=dimensions if dimensions else 1536
         )
@@ -43,16 +149,18 @@ class Embedding:
         ].embedding  # Assuming the response contains a list of embeddings
         return embed
 
-    def generate_multiple(self, contents):
+    def generate_multiple(self, contents, dimensions=None):
         """
         Generates embeddings for multiple pieces of content using the specified model.
 
         :param contents: A list of text content to generate embeddings for.
+        :param dimensions: Optional dimensions for the embedding vectors.
         :return: A list of embeddings corresponding to the input content.
         """
         contents = [content.replace("\n", " ").strip() for content in contents]
-        res = self.client.embeddings.create(
-            input=contents, model=self.embedding_model_name
+        res = deadline.with_deadline(self.client).embeddings.create(
+            input=contents, model=self.embedding_model_name,
+            dimensions=dimensions if dimensions else 1536
         )
         embeddings = [item.embedding for item in res.data]
         return embeddings
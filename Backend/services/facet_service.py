@@ -0,0 +1,168 @@
+"""
+    This contains the FacetService, serving industry / size / location counts.
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+
+from config.main import config
+from models.company import Company
+from models.database import get_db_session
+from services.metrics import timed
+from services.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
+
+FACET_FIELDS = ["industry", "size", "location"]
+# Marker stored next to the counts once they have been built
+READY_FIELD = "__ready__"
+# Version bumped with every increment, a rebuild is only stored when none happened meanwhile
+VERSION_NAME = "facets"
+VERSION_KEY = f"version:{VERSION_NAME}"
+# One worker aggregates at a time. A rebuild that could not be stored keeps the lock
+# until it expires, so steady writes cause at most one scan per REBUILD_LOCK_SECONDS
+REBUILD_LOCK_KEY = "facets_rebuild_lock"
+REBUILD_LOCK_SECONDS = 30
+# Last aggregated counts, served while the hashes are being rebuilt
+LAST_COUNTS_KEY = "facets_last"
+
+
+def facet_key(field: str) -> str:
+    return f"facets:{field}"
+
+
+class FacetService:
+    """
+    Keeps per-value company counts in Redis hashes (`facets:industry`, ...),
+    incremented and decremented in the write path. The table is aggregated
+    when the hashes are missing their ready marker: they expire after
+    FACET_COUNTS_TTL and are dropped by `invalidate()` after writes that bypass
+    the API (load_data, snapshot import). The aggregation runs in a thread on
+    one worker at a time, the others serve the last aggregated counts meanwhile.
+    """
+
+    def __init__(self, redis_service: RedisService = None):
+        self.redis_service = redis_service or RedisService()
+        # Last aggregated counts in this process, for when Redis is unreachable
+        self._last: Optional[dict] = None
+        self._last_at = 0.0
+
+    @staticmethod
+    def keys() -> list:
+        return [facet_key(field) for field in FACET_FIELDS]
+
+    def _aggregate(self) -> dict:
+        """Counts every facet with a single GROUPING SETS scan of the Company table."""
+        with timed("facets.rebuild"), get_db_session() as session:
+            rows = session.execute(
+                text(
+                    "SELECT industry, size, location, GROUPING(industry) AS g_industry, "
+                    "GROUPING(size) AS g_size, GROUPING(location) AS g_location, COUNT(*) AS count "
+                    f'FROM "{Company.__tablename__}" '
+                    "GROUP BY GROUPING SETS ((industry), (size), (location))"
+                )
+            ).fetchall()
+        counts = {facet_key(field): {} for field in FACET_FIELDS}
+        for row in rows:
+            for field in FACET_FIELDS:
+                if getattr(row, f"g_{field}") == 0 and getattr(row, field) is not None:
+                    counts[facet_key(field)][getattr(row, field)] = row.count
+        return counts
+
+    async def _aggregate_in_thread(self) -> dict:
+        counts = await asyncio.to_thread(self._aggregate)
+        self._last, self._last_at = counts, time.monotonic()
+        return counts
+
+    async def rebuild(self) -> tuple:
+        """
+        Aggregates the counts and replaces the hashes with them, unless a write
+        was counted while aggregating (it may be missing from the result). The
+        counts are stored as the last aggregated ones either way.
+
+        Returns:
+            tuple: The counts and whether the hashes were replaced
+        """
+        version = await self.redis_service.get_namespace_version(VERSION_NAME)
+        counts = await self._aggregate_in_thread()
+        await self.redis_service.set(LAST_COUNTS_KEY, counts, config.FACET_COUNTS_TTL or 3600)
+        stored = await self.redis_service.replace_counters(
+            {key: {**values, READY_FIELD: 1} for key, values in counts.items()},
+            config.FACET_COUNTS_TTL,
+            VERSION_KEY,
+            version,
+        )
+        if stored:
+            logger.info("Facet counts rebuilt")
+        else:
+            logger.info("Facet counts changed during the rebuild, not stored")
+        return counts, stored
+
+    async def invalidate(self) -> None:
+        """Drops the counts, e.g. after companies were written without the API."""
+        await self.redis_service.bump_namespace_version(VERSION_NAME)
+        for key in self.keys():
+            await self.redis_service.delete(key)
+
+    async def counts(self) -> dict:
+        """Counts per facet value, most frequent first."""
+        keys = self.keys()
+        counts = await self.redis_service.get_counters(keys)
+        if counts is None:
+            # Redis is unreachable, the counts of this process are refreshed once per TTL
+            if self._last is None or time.monotonic() - self._last_at > (config.FACET_COUNTS_TTL or 3600):
+                await self._aggregate_in_thread()
+            counts = self._last
+        elif any(READY_FIELD not in counts[key] for key in keys):
+            counts = await self._rebuilt_or_last()
+        return {
+            field: self._sorted(counts[facet_key(field)].items())
+            for field in FACET_FIELDS
+        }
+
+    async def _rebuilt_or_last(self) -> dict:
+        """Rebuilds when no other worker does, otherwise the last aggregated counts."""
+        if await self.redis_service.set_if_absent(REBUILD_LOCK_KEY, 1, REBUILD_LOCK_SECONDS):
+            counts, stored = await self.rebuild()
+            if stored:
+                await self.redis_service.delete(REBUILD_LOCK_KEY)
+            return counts
+        counts = await self.redis_service.get(LAST_COUNTS_KEY) or self._last
+        if counts is None:
+            # Only before the first aggregation has finished anywhere
+            counts = await self._aggregate_in_thread()
+        return counts
+
+    async def apply(self, added: Iterable[Company] = (), removed: Iterable[Company] = ()) -> None:
+        """Updates the counts for written companies, in one Redis round trip."""
+        updates = {facet_key(field): Counter() for field in FACET_FIELDS}
+        for company, delta in [(c, 1) for c in added] + [(c, -1) for c in removed]:
+            for field in FACET_FIELDS:
+                value = getattr(company, field)
+                if value is not None:
+                    updates[facet_key(field)][value] += delta
+        updates = {key: {f: d for f, d in deltas.items() if d} for key, deltas in updates.items()}
+        if any(updates.values()):
+            await self.redis_service.increment_counters(updates, VERSION_KEY)
+
+    @classmethod
+    def scoped_counts(cls, companies: Optional[Iterable[dict]]) -> dict:
+        """Counts over a candidate set (cached search results or session candidates)."""
+        companies = list(companies or [])
+        return {
+            field: cls._sorted(Counter(c.get(field) for c in companies if c.get(field)).items())
+            for field in FACET_FIELDS
+        }
+
+    @staticmethod
+    def _sorted(items) -> list:
+        return [
+            {"value": value, "count": count}
+            for value, count in sorted(items, key=lambda item: (-item[1], item[0]))
+            if value != READY_FIELD and count > 0
+        ]
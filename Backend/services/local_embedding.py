@@ -0,0 +1,184 @@
+"""
+Local, in-process embedding backends.
+
+These encoders run entirely on the host without any network call, which makes
+them suitable for CI, load tests and air-gapped deployments. Both backends share
+the same batching / thread-pool execution in `LocalEmbeddingBackend`.
+"""
+
+import logging
+import os
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import numpy as np
+
+from config.main import config
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+class LocalEmbeddingBackend:
+    """
+    Base class for local encoders. Subclasses implement `encode_batch`, this class
+    takes care of splitting the input in batches and running them on a thread pool.
+    """
+
+    name: str = "local"
+
+    def __init__(self, batch_size: int = None, workers: int = None):
+        self.batch_size = batch_size or config.EMBEDDING_BATCH_SIZE
+        self.workers = workers or config.EMBEDDING_WORKERS
+        self._executor = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix=f"embed-{self.name}"
+            )
+        return self._executor
+
+    def encode_batch(self, contents: List[str], dimensions: int) -> np.ndarray:
+        """
+        Encodes a single batch of texts.
+
+        :return: A float32 matrix of shape (len(contents), dimensions), L2-normalized.
+        """
+        raise NotImplementedError
+
+    def embed(self, content: str, dimensions: int) -> List[float]:
+        """Embeds a single text. Runs inline, there is nothing to parallelise."""
+        return self.encode_batch([content], dimensions)[0].tolist()
+
+    def embed_multiple(self, contents: List[str], dimensions: int) -> List[List[float]]:
+        """Embeds many texts, batched and spread over the thread pool."""
+        if not contents:
+            return []
+        batches = [
+            contents[i:i + self.batch_size]
+            for i in range(0, len(contents), self.batch_size)
+        ]
+        if len(batches) == 1:
+            results = [self.encode_batch(batches[0], dimensions)]
+        else:
+            results = list(
+                self.executor.map(lambda batch: self.encode_batch(batch, dimensions), batches)
+            )
+        return np.vstack(results).tolist()
+
+
+def fit_dimensions(matrix: np.ndarray, dimensions: int) -> np.ndarray:
+    """
+    Pads with zeros or truncates the rows of `matrix` to `dimensions` columns and
+    re-normalizes them. Zero padding keeps cosine / inner product scores unchanged,
+    so a 384-d encoder can be stored in the 1024-d `Company.embedding` column.
+    """
+    current = matrix.shape[1]
+    if current < dimensions:
+        matrix = np.pad(matrix, ((0, 0), (0, dimensions - current)))
+    elif current > dimensions:
+        matrix = matrix[:, :dimensions]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+class HashingEmbeddingBackend(LocalEmbeddingBackend):
+    """
+    Feature-hashing encoder: word unigrams and bigrams are hashed with a signed
+    crc32 into a fixed number of buckets. No model files are needed and the
+    output is deterministic across processes and hosts.
+    """
+
+    name = "hashing"
+
+    def _features(self, content: str) -> List[str]:
+        tokens = TOKEN_PATTERN.findall(content.lower())
+        bigrams = [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        return tokens + bigrams
+
+    def encode_batch(self, contents: List[str], dimensions: int) -> np.ndarray:
+        matrix = np.zeros((len(contents), dimensions), dtype=np.float32)
+        for row, content in enumerate(contents):
+            hashes = np.fromiter(
+                (zlib.crc32(feature.encode("utf-8")) for feature in self._features(content)),
+                dtype=np.uint32,
+            )
+            if hashes.size == 0:
+                continue
+            buckets = (hashes % dimensions).astype(np.intp)
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(matrix[row], buckets, signs)
+        return fit_dimensions(matrix, dimensions)
+
+
+class OnnxEmbeddingBackend(LocalEmbeddingBackend):
+    """
+    Sentence encoder exported to ONNX and executed on CPU with onnxruntime.
+
+    The model directory must contain `model.onnx` and a HuggingFace
+    `tokenizer.json`. Token embeddings are mean pooled using the attention mask.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path: str = None, batch_size: int = None, workers: int = None):
+        super().__init__(batch_size, workers)
+        try:
+            import onnxruntime  # pylint: disable=import-outside-toplevel
+            from tokenizers import Tokenizer  # pylint: disable=import-outside-toplevel
+        except ImportError as e:
+            raise ImportError(
+                "The onnx embedding backend requires `onnxruntime` and `tokenizers` to be installed"
+            ) from e
+
+        self.model_path = model_path or config.EMBEDDING_MODEL_PATH
+        if not self.model_path:
+            raise ValueError("EMBEDDING_MODEL_PATH must be set to use the onnx embedding backend")
+
+        logger.info(f"Loading ONNX embedding model from: {self.model_path}")
+        options = onnxruntime.SessionOptions()
+        # Parallelism comes from the thread pool, keep each inference single threaded
+        options.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(self.model_path, "model.onnx"),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(self.model_path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=config.EMBEDDING_MAX_TOKENS)
+        self.tokenizer.enable_padding()
+
+    def encode_batch(self, contents: List[str], dimensions: int) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(contents)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, inputs)[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return fit_dimensions(pooled.astype(np.float32), dimensions)
+
+
+LOCAL_BACKENDS = {
+    HashingEmbeddingBackend.name: HashingEmbeddingBackend,
+    OnnxEmbeddingBackend.name: OnnxEmbeddingBackend,
+}
+
+
+def get_local_backend(name: str) -> LocalEmbeddingBackend:
+    """Returns the local backend registered under `name`."""
+    if name not in LOCAL_BACKENDS:
+        raise ValueError(
+            f"Unknown embedding backend '{name}', expected one of: remote, {', '.join(LOCAL_BACKENDS)}"
+        )
+    return LOCAL_BACKENDS[name]()
@@ -0,0 +1,124 @@
+"""
+Latency instrumentation for the search pipeline.
+
+Every stage wrapped in `timed(stage)` is recorded in a Prometheus histogram and,
+when called inside a request, collected for the `Server-Timing` response header.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+STAGE_LATENCY = Histogram(
+    "search_stage_duration_seconds",
+    "Latency of each stage of the search pipeline",
+    ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache name and result (hit/miss)",
+    ["cache", "result"],
+)
+FALLBACKS = Counter(
+    "fallbacks_total",
+    "Fallbacks taken when a dependency failed",
+    ["component", "reason"],
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "LLM token usage by provider, model and kind (prompt/completion)",
+    ["provider", "model", "kind"],
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds",
+    "Time spent waiting for a pooled database connection, by engine",
+    ["engine"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_POOL_CHECKOUTS = Counter(
+    "db_pool_checkouts_total",
+    "Database connection checkouts, by engine",
+    ["engine"],
+)
+DB_POOL_IN_USE = Gauge(
+    "db_pool_connections_in_use",
+    "Database connections currently checked out, by engine",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+DB_REPLICA_HEALTHY = Gauge(
+    "db_replica_healthy",
+    "1 when the read replica passed its last health check",
+    ["engine"],
+    multiprocess_mode="liveall",
+)
+
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+@contextmanager
+def timed(stage: str):
+    """Times the enclosed block as `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.labels(stage).observe(elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def start_request_timings() -> List[Tuple[str, float]]:
+    """Starts collecting stage timings for the current request."""
+    timings: List[Tuple[str, float]] = []
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: List[Tuple[str, float]]) -> str:
+    """Formats timings as a `Server-Timing` header, repeated stages are summed."""
+    totals = {}
+    for stage, elapsed in timings:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+    return ", ".join(
+        f"{stage};dur={elapsed * 1000:.2f}" for stage, elapsed in totals.items()
+    )
+
+
+def record_llm_usage(provider: str, model: str, usage) -> None:
+    """Counts prompt and completion tokens of a chat completion."""
+    if usage is None:
+        return
+    LLM_TOKENS.labels(provider, model, "prompt").inc(usage.prompt_tokens or 0)
+    LLM_TOKENS.labels(provider, model, "completion").inc(usage.completion_tokens or 0)
+
+
+def latest_metrics() -> Tuple[bytes, str]:
+    """
+    Renders all metrics in the Prometheus text format. With several Uvicorn
+    workers set PROMETHEUS_MULTIPROC_DIR so the values of all workers are merged.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,575 @@
+"""
+NumpySearcher provides in-process vector search over a memory-mapped embedding matrix.
+
+The index lives on disk in `config.NUMPY_INDEX_DIR` as numbered generations:
+
+    CURRENT                         name of the active generation directory
+    pending                         ids written since the last refresh, one per line,
+                                    or "rebuild" when the next refresh starts over
+    gen-<n>/embeddings.npy          L2-normalized (rows, dimensions) float32/float16 matrix
+    gen-<n>/ids.npy                 Company ids, aligned with the matrix rows
+    gen-<n>/payload.json            Company payloads, aligned with the matrix rows
+    gen-<n>/search_index            search index generation the embeddings belong to (JSON)
+    gen-<n>/SEGMENTS                delta segments appended to the generation, in order
+    gen-<n>/delta-<k>/...           rows added or updated since (embeddings, ids, payload)
+    gen-<n>/delta-<k>/tombstones.npy  ids whose rows in earlier segments are superseded
+
+Every Uvicorn worker maps the same read-only `.npy` files, so the pages are shared
+through the OS page cache. A refresh appends a delta segment and atomically swaps
+`SEGMENTS`, which costs the changed rows only; once the deltas grow past
+NUMPY_INDEX_COMPACT_RATIO of the generation they are compacted into a new one
+and `CURRENT` is swapped. Readers pick either up on their next search and keep
+the segments they already mapped.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from config.main import config
+from models.company import Company
+from models.database import get_db_session
+from services import deadline
+from services.deadline import DeadlineExceeded
+from services.search_index import active_index
+from services.metrics import FALLBACKS, timed
+from services.reranker import rerank, resolve_options
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_FIELDS = ["name", "description", "industry", "size", "location", "content"]
+# Scoring and copying are done in blocks of rows so large matrices are never copied whole
+SCORE_BLOCK_ROWS = 65536
+
+
+def write_atomically(path: str, content: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+class NumpySegment:
+    """
+    Rows written together: their embeddings mapped into memory, ids and payloads,
+    and the ids whose rows in earlier segments they supersede (updated or deleted).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        self.ids = np.load(os.path.join(path, "ids.npy"))
+        with open(os.path.join(path, "payload.json"), "r", encoding="utf-8") as f:
+            self.payloads: List[Dict[str, Any]] = json.load(f)
+        tombstones = os.path.join(path, "tombstones.npy")
+        self.tombstones = np.load(tombstones) if os.path.exists(tombstones) else np.empty(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def write(path: str, ids: np.ndarray, matrix: np.ndarray, payloads: list, dtype, tombstones=None) -> None:
+        """Writes a segment of L2-normalized `matrix` rows."""
+        os.makedirs(path)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        np.save(os.path.join(path, "embeddings.npy"), (matrix / norms).astype(dtype))
+        np.save(os.path.join(path, "ids.npy"), ids)
+        with open(os.path.join(path, "payload.json"), "w", encoding="utf-8") as f:
+            json.dump(payloads, f)
+        if tombstones is not None:
+            np.save(os.path.join(path, "tombstones.npy"), tombstones)
+
+
+class NumpyIndex:
+    """
+    A generation of the index: its base segment followed by the delta segments
+    listed in SEGMENTS when it was opened. Rows are numbered across segments, a
+    row is live unless a later segment supersedes its id.
+    """
+
+    def __init__(self, path: str, loaded: Optional[Dict[str, NumpySegment]] = None):
+        self.path = path
+        try:
+            with open(os.path.join(path, "search_index"), "r", encoding="utf-8") as f:
+                search_index = json.load(f)
+        except FileNotFoundError:
+            search_index = 1
+        # Queries are embedded with the model of this generation, older indexes recorded its number only
+        self.generation: Optional[Dict[str, Any]] = search_index if isinstance(search_index, dict) else None
+        self.search_index = search_index["generation"] if isinstance(search_index, dict) else search_index
+
+        # Segments mapped by the previous view of this generation are reused
+        loaded = loaded or {}
+        self.segment_names = ["", *read_segments(path)]
+        self.segments = [
+            loaded.get(name) or NumpySegment(os.path.join(path, name) if name else path)
+            for name in self.segment_names
+        ]
+        self.offsets = np.cumsum([0] + [len(segment) for segment in self.segments])
+        self.ids = np.concatenate([segment.ids for segment in self.segments])
+        self.payloads: List[Dict[str, Any]] = [payload for segment in self.segments for payload in segment.payloads]
+        self.live = np.ones(len(self.ids), dtype=bool)
+        for i, segment in enumerate(self.segments[1:], start=1):
+            if len(segment.tombstones):
+                start = self.offsets[i]
+                self.live[:start] &= ~np.isin(self.ids[:start], segment.tombstones)
+        self.all_live = bool(self.live.all())
+        self.dimensions = self.segments[0].embeddings.shape[1]
+        self._codes: Dict[str, tuple] = {}
+        self._bitmasks: Dict[tuple, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def live_count(self) -> int:
+        return int(self.live.sum())
+
+    @property
+    def delta_rows(self) -> int:
+        """Rows and tombstones in the delta segments."""
+        return sum(len(segment) + len(segment.tombstones) for segment in self.segments[1:])
+
+    @property
+    def loaded(self) -> Dict[str, NumpySegment]:
+        return dict(zip(self.segment_names, self.segments))
+
+    def _column_codes(self, column: str) -> tuple:
+        """Dictionary-encodes a payload column once per generation."""
+        if column not in self._codes:
+            if column not in PAYLOAD_FIELDS:
+                raise ValueError(f"Unsupported filter column: {column}")
+            values = np.array([payload.get(column) or "" for payload in self.payloads])
+            vocabulary, codes = np.unique(values, return_inverse=True)
+            self._codes[column] = (
+                {value: code for code, value in enumerate(vocabulary.tolist())},
+                codes.astype(np.int32),
+            )
+        return self._codes[column]
+
+    def bitmask(self, column: str, value: str) -> np.ndarray:
+        """Returns the packed bitmask of rows where `column == value`, cached per generation."""
+        key = (column, value)
+        if key not in self._bitmasks:
+            vocabulary, codes = self._column_codes(column)
+            code = vocabulary.get(value)
+            if code is None:
+                mask = np.zeros(len(self), dtype=bool)
+            else:
+                mask = codes == code
+            self._bitmasks[key] = np.packbits(mask)
+        return self._bitmasks[key]
+
+    def filter_mask(self, filters: Union[list[dict], None]) -> Union[np.ndarray, None]:
+        """
+        Combines the bitmasks of all filters into a boolean row mask.
+
+        Filters use the same format as `PostgresSearcher.build_filter_clause`,
+        supported operators are `=`, `!=` and `IN`.
+        """
+        if not filters:
+            return None
+        packed = np.full((len(self) + 7) // 8, 0xFF, dtype=np.uint8)
+        for filter in filters:
+            column = filter["column"]
+            operator = filter["comparison_operator"].upper()
+            if operator == "=":
+                packed &= self.bitmask(column, filter["value"])
+            elif operator == "!=":
+                packed &= ~self.bitmask(column, filter["value"])
+            elif operator == "IN":
+                any_of = np.zeros_like(packed)
+                for value in filter["value"]:
+                    any_of |= self.bitmask(column, value)
+                packed &= any_of
+            else:
+                raise ValueError(f"Unsupported comparison operator: {operator}")
+        return np.unpackbits(packed, count=len(self)).astype(bool)
+
+    def scores(self, query_vector: np.ndarray) -> np.ndarray:
+        """Cosine similarity of every row with the (normalized) query vector."""
+        scores = np.empty(len(self), dtype=np.float32)
+        for segment, offset in zip(self.segments, self.offsets):
+            if segment.embeddings.dtype == np.float32:
+                scores[offset:offset + len(segment)] = segment.embeddings @ query_vector
+                continue
+            for start in range(0, len(segment), SCORE_BLOCK_ROWS):
+                block = segment.embeddings[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+                scores[offset + start:offset + start + len(block)] = block @ query_vector
+        return scores
+
+    def vectors(self, rows: np.ndarray) -> np.ndarray:
+        """The embeddings of `rows`, in their order."""
+        rows = np.asarray(rows)
+        vectors = np.empty((len(rows), self.dimensions), dtype=np.float32)
+        for i, (segment, offset) in enumerate(zip(self.segments, self.offsets)):
+            selected = (rows >= offset) & (rows < self.offsets[i + 1])
+            if selected.any():
+                vectors[selected] = segment.embeddings[rows[selected] - offset]
+        return vectors
+
+
+def read_segments(path: str) -> List[str]:
+    try:
+        with open(os.path.join(path, "SEGMENTS"), "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+class NumpySearcher:
+    """
+    In-process vector searcher over a memory-mapped, L2-normalized embedding matrix.
+    """
+
+    def __init__(self, db_model, embed_dimensions: Optional[int] = None):
+        self.db_model = db_model
+        # Follows the active search index unless fixed
+        self.embed_dimensions = embed_dimensions
+        self.index_dir = config.NUMPY_INDEX_DIR
+        self.dtype = np.dtype(config.NUMPY_INDEX_DTYPE)
+        self.refresh_interval = config.NUMPY_INDEX_REFRESH_SECONDS
+        self.index: Optional[NumpyIndex] = None
+        self._last_checked = 0.0
+        self._load_lock = threading.Lock()
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        if self._read_current() is None:
+            self.refresh()
+        self._load_current()
+
+        if self.refresh_interval > 0:
+            thread = threading.Thread(target=self._refresh_loop, name="numpy-index-refresh", daemon=True)
+            thread.start()
+
+    def _read_current(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.index_dir, "CURRENT"), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _is_loaded(self, path: str) -> bool:
+        index = self.index
+        return index is not None and index.path == path and index.segment_names[1:] == read_segments(path)
+
+    def _load_current(self) -> None:
+        """Maps the active generation and its new segments if they changed since the last check."""
+        generation = self._read_current()
+        if generation is None:
+            return
+        path = os.path.join(self.index_dir, generation)
+        if self._is_loaded(path):
+            return
+        with self._load_lock:
+            if self._is_loaded(path):
+                return
+            loaded = self.index.loaded if self.index is not None and self.index.path == path else None
+            self.index = NumpyIndex(path, loaded)
+            logger.info(
+                f"Loaded numpy index {generation} ({len(self.index.segments) - 1} delta segments) "
+                f"with {self.index.live_count} companies"
+            )
+
+    def _refresh_loop(self) -> None:
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing numpy index: {e}")
+
+    def _queue(self, ids: List[int], rebuild: bool = False) -> None:
+        """Appends changed ids to the `pending` file, drained by whichever process refreshes next."""
+        if not ids and not rebuild:
+            return
+        with open(os.path.join(self.index_dir, "pending"), "a", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.write("".join(f"{id}\n" for id in ids) + ("rebuild\n" if rebuild else ""))
+
+    def _take_pending(self) -> tuple:
+        """The queued ids and whether a rebuild was requested."""
+        try:
+            with open(os.path.join(self.index_dir, "pending"), "r+", encoding="utf-8") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                lines = {line.strip() for line in f if line.strip()}
+                f.truncate(0)
+        except FileNotFoundError:
+            return set(), False
+        return {int(line) for line in lines if line != "rebuild"}, "rebuild" in lines
+
+    def _has_pending(self) -> bool:
+        try:
+            return os.path.getsize(os.path.join(self.index_dir, "pending")) > 0
+        except FileNotFoundError:
+            return False
+
+    def refresh(self, changed_ids: Iterable[int] = (), rebuild: bool = False) -> bool:
+        """
+        Incrementally syncs the index with Postgres, blocking: writers call it
+        off the event loop.
+
+        `changed_ids` (written or deleted companies) are queued in the `pending`
+        file first. Only one process refreshes at a time; when another one holds
+        the lock the ids stay queued and it drains them before releasing it. A
+        refresh with pending ids re-reads those and the rows above the last
+        indexed id, one without (the periodic refresh) also drops rows deleted
+        from Postgres. The index is rebuilt from scratch after a search index
+        cutover (scripts/reindex.py) or with `rebuild`, after rows were rewritten
+        without the API (scripts/snapshot.py import, scripts/load_data.py).
+
+        Returns:
+            bool: True if a segment or generation was published
+        """
+        self._queue(list(changed_ids), rebuild)
+        published = False
+        lock_path = os.path.join(self.index_dir, "refresh.lock")
+        while True:
+            with open(lock_path, "w", encoding="utf-8") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return published
+                try:
+                    pending, rebuild = self._take_pending()
+                    try:
+                        published = self._refresh_locked(pending, rebuild) or published
+                    except Exception:
+                        self._queue(list(pending), rebuild)
+                        raise
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+            # Ids queued while the lock was held, by processes that could not take it
+            if not self._has_pending():
+                return published
+
+    def _refresh_locked(self, changed_ids: set, rebuild: bool = False) -> bool:
+        generation = self._read_current()
+        current = NumpyIndex(os.path.join(self.index_dir, generation)) if generation and not rebuild else None
+        search_index = active_index.refresh()
+        dimensions = self.embed_dimensions or search_index["dimensions"]
+        if current is not None and (
+            current.search_index != search_index["generation"] or current.dimensions != dimensions
+        ):
+            logger.info(f"Rebuilding numpy index for search index generation {search_index['generation']}")
+            current = None
+        current_ids = current.ids[current.live] if current is not None else np.empty(0, dtype=np.int64)
+        max_id = int(current.ids.max()) if current is not None and len(current) else 0
+
+        with get_db_session() as session:
+            query = session.query(self.db_model).filter(self.db_model.embedding.isnot(None))
+            if changed_ids:
+                query = query.filter(
+                    (self.db_model.id > max_id) | (self.db_model.id.in_(changed_ids))
+                )
+            else:
+                query = query.filter(self.db_model.id > max_id)
+            new_rows = query.order_by(self.db_model.id).all()
+            if current is None:
+                removed = np.empty(0, dtype=np.int64)
+            elif changed_ids:
+                # Written ids are enough to know what changed, no scan of the table
+                removed = np.array(sorted(changed_ids), dtype=np.int64)
+            else:
+                live_ids = np.fromiter(
+                    (row[0] for row in session.query(self.db_model.id).all()), dtype=np.int64
+                )
+                removed = current_ids[~np.isin(current_ids, live_ids)]
+
+        ids = np.array([row.id for row in new_rows], dtype=np.int64)
+        # Superseded rows of earlier segments: removed or re-read ids that are indexed
+        tombstones = np.union1d(removed, ids)
+        tombstones = tombstones[np.isin(tombstones, current_ids)]
+        if current is not None and not len(tombstones) and not new_rows:
+            return False
+
+        matrix = np.array([row.embedding for row in new_rows], dtype=np.float32).reshape(len(new_rows), dimensions)
+        payloads = [{field: getattr(row, field) for field in PAYLOAD_FIELDS} for row in new_rows]
+        delta_rows = len(ids) + len(tombstones)
+        if current is not None and (
+            len(current.segments) <= config.NUMPY_INDEX_MAX_SEGMENTS
+            and current.delta_rows + delta_rows <= config.NUMPY_INDEX_COMPACT_RATIO * len(current.segments[0])
+        ):
+            return self._append_segment(current, ids, matrix, payloads, tombstones)
+        return self._write_generation(current, tombstones, ids, matrix, payloads, search_index, dimensions)
+
+    def _append_segment(self, current: NumpyIndex, ids, matrix, payloads, tombstones) -> bool:
+        name = f"delta-{int(time.time() * 1000)}"
+        NumpySegment.write(os.path.join(current.path, name), ids, matrix, payloads, self.dtype, tombstones)
+        segments = [*current.segment_names[1:], name]
+        write_atomically(os.path.join(current.path, "SEGMENTS"), "".join(f"{segment}\n" for segment in segments))
+        logger.info(
+            f"Appended numpy segment {name} to {os.path.basename(current.path)}: "
+            f"{len(ids)} added/updated, {len(tombstones)} superseded"
+        )
+        return True
+
+    def _write_generation(self, current, tombstones, ids, matrix, payloads, search_index: dict, dimensions: int) -> bool:
+        """Compacts the live rows of `current` and the new rows into a new generation."""
+        keep = current.live & ~np.isin(current.ids, tombstones) if current is not None else np.empty(0, dtype=bool)
+        rows = int(keep.sum()) + len(ids)
+        generation_name = f"gen-{int(time.time() * 1000)}"
+        path = os.path.join(self.index_dir, generation_name)
+        os.makedirs(path)
+
+        embeddings = np.lib.format.open_memmap(
+            os.path.join(path, "embeddings.npy"), mode="w+", dtype=self.dtype,
+            shape=(rows, dimensions),
+        )
+        kept = 0
+        for segment, offset in zip(current.segments, current.offsets) if current is not None else ():
+            for start in range(0, len(segment), SCORE_BLOCK_ROWS):
+                block = segment.embeddings[start:start + SCORE_BLOCK_ROWS]
+                block_keep = keep[offset + start:offset + start + len(block)]
+                count = int(block_keep.sum())
+                if count:
+                    embeddings[kept:kept + count] = block[block_keep]
+                    kept += count
+        if len(ids):
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            embeddings[kept:] = (matrix / norms).astype(self.dtype)
+        embeddings.flush()
+        del embeddings
+
+        np.save(
+            os.path.join(path, "ids.npy"),
+            np.concatenate([current.ids[keep] if current is not None else ids[:0], ids]),
+        )
+        kept_payloads = [p for p, k in zip(current.payloads, keep) if k] if current is not None else []
+        with open(os.path.join(path, "payload.json"), "w", encoding="utf-8") as f:
+            json.dump(kept_payloads + payloads, f)
+        with open(os.path.join(path, "search_index"), "w", encoding="utf-8") as f:
+            json.dump(search_index, f)
+
+        # Atomically publish the new generation
+        previous = self._read_current()
+        write_atomically(os.path.join(self.index_dir, "CURRENT"), generation_name)
+        logger.info(f"Published numpy index {generation_name}: {kept} kept, {len(ids)} added/updated")
+
+        # Older generations can go, readers that still map them keep the unlinked pages
+        for name in os.listdir(self.index_dir):
+            if name.startswith("gen-") and name not in (generation_name, previous):
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+        return True
+
+    def search(
+        self,
+        query_vector: Union[list[float], np.ndarray],
+        top: int = 5,
+        filters: Union[list[dict], None] = None,
+        mmr_lambda: Optional[float] = None,
+        fetch_k: Optional[int] = None,
+    ) -> List[Company]:
+        """
+        Scores all rows with one matmul and selects the best `top` with argpartition.
+
+        Args:
+            query_vector: The embedding vector for similarity search
+            top: Maximum number of results to return
+            filters: Optional payload filters, see `NumpyIndex.filter_mask`
+            mmr_lambda: MMR trade-off between relevance (1.0) and diversity (0.0),
+                defaults to MMR_LAMBDA; None there disables re-ranking
+            fetch_k: Candidates over-fetched for MMR
+
+        Returns:
+            List of Company objects
+        """
+        return self._search(self._mapped_index(), query_vector, top, filters, mmr_lambda, fetch_k)
+
+    def _mapped_index(self) -> Optional[NumpyIndex]:
+        now = time.monotonic()
+        if now - self._last_checked > 1.0:
+            self._last_checked = now
+            self._load_current()
+        return self.index
+
+    def _search(
+        self,
+        index: Optional[NumpyIndex],
+        query_vector: Union[list[float], np.ndarray],
+        top: int,
+        filters: Union[list[dict], None],
+        mmr_lambda: Optional[float],
+        fetch_k: Optional[int],
+    ) -> List[Company]:
+        if index is None or index.live_count == 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        mmr_lambda, limit = resolve_options(top, mmr_lambda, fetch_k)
+
+        with timed("numpy.search"):
+            scores = index.scores(query)
+            mask = index.filter_mask(filters)
+            if not index.all_live:
+                mask = index.live if mask is None else mask & index.live
+            if mask is not None:
+                scores = np.where(mask, scores, -np.inf)
+                limit = min(limit, int(mask.sum()))
+            limit = min(limit, len(index))
+            if limit <= 0:
+                return []
+
+            candidates = np.argpartition(-scores, limit - 1)[:limit]
+            ranked = candidates[np.argsort(-scores[candidates])]
+
+        if mmr_lambda is not None:
+            ranked = rerank(list(ranked), index.vectors(ranked), scores[ranked], top, mmr_lambda)
+
+        return [
+            self.db_model(id=int(index.ids[row]), **index.payloads[row])
+            for row in ranked
+        ]
+
+    def search_and_embed(
+        self,
+        query_text: str,
+        top: int = 5,
+        filters: Union[list[dict], None] = None,
+        mmr_lambda: Optional[float] = None,
+        fetch_k: Optional[int] = None,
+    ) -> List[Company]:
+        """
+        Search for companies using text query.
+
+        Args:
+            query_text: Search query
+            top: Number of results to return
+            filters: Optional payload filters
+            mmr_lambda: MMR trade-off, see `search`
+            fetch_k: Candidates over-fetched for MMR
+
+        Returns:
+            List of Company objects
+
+        Raises:
+            DeadlineExceeded: The embedding did not finish before the request
+                deadline, leaving time for a full-text fallback
+        """
+        try:
+            # Embedded with the model of the mapped generation, it can trail a cutover until rebuilt
+            index = self._mapped_index()
+            query_vector = deadline.run_within(
+                "embedding", active_index.embed, query_text, index.generation if index is not None else None,
+                reserve=config.DEADLINE_FULLTEXT_RESERVE_SECONDS,
+            )
+            return self._search(index, query_vector, top, filters, mmr_lambda, fetch_k)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Error in numpy search: {e}")
+            FALLBACKS.labels("numpy", "search_error").inc()
+            return []
@@ -4,17 +4,65 @@ database using a hybrid search strategy.
 """
 
 # pylint:disable=import-error,missing-function-docstring,missing-class-docstring,unsupported-binary-operation
-from typing import Union
-from sqlalchemy import Float, Integer, column, select, text
+import time
+from contextvars import ContextVar
+from typing import List, Optional, Union
+import numpy as np
+from psycopg.errors import QueryCanceled
+from sqlalchemy import Boolean, Float, Integer, column, select, text
+from sqlalchemy.exc import DataError, OperationalError
 from sqlalchemy.orm import joinedload
 import logging
 
-from services.embedding import Embedding
+from config.main import config
+from services.search_index import IndexSwitched, active_index
+from models.company import truncate_embedding
 from models.database import get_db_session
+from services import deadline
+from services.embedding import require_matryoshka
+from services.metrics import FALLBACKS, timed
+from services.reranker import rerank, resolve_options
 
-embedding_util = Embedding()
 logger = logging.getLogger(__name__)
 
+STATEMENT_CACHE_SIZE = 256
+# pgvector's default hnsw.ef_search, an HNSW scan returns at most this many rows
+HNSW_DEFAULT_EF_SEARCH = 40
+HNSW_MAX_EF_SEARCH = 1000
+
+_search_explain: ContextVar[Optional[List[dict]]] = ContextVar("search_explain", default=None)
+
+
+def start_search_explain() -> List[dict]:
+    """
+    Explains the Postgres searches of the current request: every search appends
+    its candidate depths, weights, per-leg ranks and timings to the returned list.
+    """
+    explanations: List[dict] = []
+    _search_explain.set(explanations)
+    return explanations
+
+
+def candidate_depth(limit: int) -> int:
+    """Candidates each leg of the hybrid search contributes to the fusion."""
+    depth = min(max(limit * config.HYBRID_DEPTH_FACTOR, config.HYBRID_MIN_DEPTH), config.HYBRID_MAX_DEPTH)
+    return max(depth, limit)
+
+
+def fuse(legs: dict, weights: dict, k: int, limit: int) -> list:
+    """
+    Weighted reciprocal rank fusion of the (id, rank) rows of each leg, the
+    score computed by the hybrid statement.
+
+    Returns:
+        list: The best `limit` (id, score) rows
+    """
+    scores = {}
+    for leg, rows in legs.items():
+        for id, rank in rows:
+            scores[id] = scores.get(id, 0.0) + weights[leg] / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
 
 class PostgresSearcher:
     """
@@ -35,6 +83,9 @@ class PostgresSearcher:
     ):
         self.db_model = db_model
         self.embed_dimensions = embed_dimensions
+        self._statement_cache = {}
+        if config.SEARCH_MODE == "coarse":
+            require_matryoshka(active_index.current()["embedding_model"])
 
     def build_filter_clause(self, filters) -> tuple[str, str]:
         """
@@ -84,6 +135,12 @@ class PostgresSearcher:
         query_vector: Union[list[float], list],
         top: int = 5,
         filters: Union[list[dict], None] = None,
+        mmr_lambda: Union[float, None] = None,
+        fetch_k: Union[int, None] = None,
+        mode: Union[str, None] = None,
+        vector_weight: Union[float, None] = None,
+        text_weight: Union[float, None] = None,
+        generation: Union[int, None] = None,
     ):
         """
         Performs hybrid search combining vector similarity and full-text search.
@@ -93,27 +150,165 @@ class PostgresSearcher:
             query_vector (list[float]): The embedding vector for similarity search
             top (int): Maximum number of results to return
             filters (list[dict] | None): Additional filters to apply
+            mmr_lambda (float | None): MMR trade-off between relevance (1.0) and diversity (0.0),
+                defaults to MMR_LAMBDA; None there disables re-ranking
+            fetch_k (int | None): Candidates over-fetched for MMR
+            mode (str | None): "full" or "coarse", defaults to SEARCH_MODE
+            vector_weight (float | None): Weight of the vector leg in the fusion,
+                defaults to HYBRID_VECTOR_WEIGHT
+            text_weight (float | None): Weight of the full-text leg in the fusion,
+                defaults to HYBRID_TEXT_WEIGHT
+            generation (int | None): Search index generation `query_vector` was embedded
+                with, checked in the search transaction
         
         Returns:
             list: List of matching database objects
+
+        Raises:
+            IndexSwitched: The search index was switched to another generation
+            ValueError: Coarse mode with an embedding model that is not Matryoshka-trained
             
         The search combines three possible approaches:
-        1. Vector search: Uses cosine similarity with embeddings
-        2. Full-text search: Uses PostgreSQL's ts_vector/ts_query
-        3. Hybrid: Combines both approaches with a weighted score
+        1. Vector search: Uses cosine similarity with embeddings. In "coarse" mode the
+           HNSW pass runs on the truncated embeddings and its best COARSE_RESCORE_DEPTH
+           rows are re-ranked by their full embeddings
+        2. Full-text search: Uses PostgreSQL's ts_vector/ts_query, skipped when a
+           pre-check finds no row matching the query
+        3. Hybrid: Combines both approaches with weighted reciprocal rank fusion,
+           each leg fetching a candidate depth derived from `top` (see candidate_depth)
         """
+        if query_text is None and len(query_vector) == 0:
+            raise ValueError("Both query text and query vector are empty")
         filter_clause_where, filter_clause_and = self.build_filter_clause(filters)
+        mode = mode or config.SEARCH_MODE
+        if mode == "coarse" and len(query_vector) > 0:
+            require_matryoshka(active_index.current()["embedding_model"])
+        statements = self._statements(mode, filter_clause_where, filter_clause_and)
+        mmr_lambda, limit = resolve_options(top, mmr_lambda, fetch_k)
+
+        depth = candidate_depth(limit)
+        params = {
+            "query": query_text,
+            "k": config.HYBRID_RRF_K,
+            "vector_weight": config.HYBRID_VECTOR_WEIGHT if vector_weight is None else vector_weight,
+            "text_weight": config.HYBRID_TEXT_WEIGHT if text_weight is None else text_weight,
+            "limit": limit,
+            "depth": depth,
+        }
+        # numpy vectors are bound with pgvector's binary dumper, no decimal text on the wire
+        ef_search = None
+        if len(query_vector) > 0:
+            params["embedding"] = np.asarray(query_vector, dtype=np.float32)
+            scan_depth = depth
+            if mode == "coarse":
+                params["coarse_embedding"] = np.asarray(truncate_embedding(query_vector), dtype=np.float32)
+                params["rescore_depth"] = scan_depth = max(config.COARSE_RESCORE_DEPTH, depth)
+            # The HNSW scan returns at most ef_search rows before the filters are applied
+            if filter_clause_where:
+                scan_depth *= config.HYBRID_FILTER_FACTOR
+            ef_search = min(scan_depth, HNSW_MAX_EF_SEARCH)
+
+        explain = _search_explain.get()
+        with get_db_session("read") as db_session:
+            self._set_local(
+                db_session,
+                ef_search=ef_search if ef_search is not None and ef_search > HNSW_DEFAULT_EF_SEARCH else None,
+                statement_timeout=deadline.timeout_ms(),
+            )
+            precheck_start = time.perf_counter()
+            fulltext = query_text is not None and self._fulltext_matches(db_session, statements, params)
+            precheck_ms = (time.perf_counter() - precheck_start) * 1000
+            legs = [leg for leg, used in (("vector", len(query_vector) > 0), ("fulltext", fulltext)) if used]
+
+            if explain is not None:
+                stage = "postgres.hybrid_query"
+                results, explanation = self._explain(db_session, statements, params, legs)
+                explain.append({
+                    "query": query_text,
+                    "mode": mode,
+                    "limit": limit,
+                    "depth": depth,
+                    "ef_search": ef_search,
+                    "k": params["k"],
+                    "weights": {"vector": params["vector_weight"], "fulltext": params["text_weight"]},
+                    "fulltext_skipped": query_text is not None and not fulltext,
+                    "precheck_ms": round(precheck_ms, 3) if query_text is not None else None,
+                    **explanation,
+                })
+            elif legs:
+                stage, sql = statements["hybrid" if len(legs) == 2 else legs[0]]
+                logger.debug("%s: %s", stage, sql)
+                if "vector" in legs and fulltext:
+                    # The vector leg leaves time for a full-text fallback
+                    self._set_local(
+                        db_session,
+                        statement_timeout=deadline.timeout_ms(config.DEADLINE_FULLTEXT_RESERVE_SECONDS),
+                    )
+                try:
+                    # A single leg is the result, it only fetches the rows kept
+                    with timed(stage):
+                        results = db_session.execute(sql, {**params, "depth": depth if len(legs) == 2 else limit}).fetchall()
+                except OperationalError as e:
+                    if not (fulltext and "vector" in legs and isinstance(e.orig, QueryCanceled)):
+                        raise
+                    logger.warning(f"Vector search timed out, falling back to full-text search: {e.orig}")
+                    FALLBACKS.labels("postgres", "text_only").inc()
+                    deadline.degrade("fulltext_only")
+                    db_session.rollback()
+                    self._set_local(db_session, statement_timeout=deadline.timeout_ms())
+                    stage, sql = statements["fulltext"]
+                    with timed(stage):
+                        results = db_session.execute(sql, {**params, "depth": limit}).fetchall()
+            else:
+                results = []
+            if generation is not None and "vector" in legs:
+                active_index.check(db_session, generation)
+        if not results:
+            return []
+
+        if mmr_lambda is not None:
+            results = self._rerank(stage, results[:limit], top, mmr_lambda)
+
+        # Convert results to models
+        with timed("postgres.hydrate"):
+            items = self._hydrate(results[:top])
+        return items
+
+    def _statements(self, mode: str, filter_clause_where: str, filter_clause_and: str) -> dict:
+        """
+        The hybrid, vector and full-text statements for a search mode and filter
+        set, built once. They are prepared server side on their first execution
+        on a connection and reused, psycopg keeps the 100 most recent per connection.
+        """
+        key = (mode, filter_clause_where, filter_clause_and)
+        if key in self._statement_cache:
+            return self._statement_cache[key]
 
         table_name = self.db_model.__tablename__
         embedding_field_name = self.db_model.get_embedding_field()
         search_text_field_name = self.db_model.get_text_search_field()
 
-        vector_query = f"""
+        if mode == "coarse":
+            coarse_field_name = self.db_model.get_coarse_embedding_field()
+            vector_query = f"""
+            SELECT id, RANK () OVER (ORDER BY {embedding_field_name} <=> :embedding) AS rank
+                FROM (
+                    SELECT id, {embedding_field_name}
+                        FROM "{table_name}"
+                        {filter_clause_where}
+                        ORDER BY {coarse_field_name} <=> :coarse_embedding
+                        LIMIT :rescore_depth
+                ) coarse
+                ORDER BY {embedding_field_name} <=> :embedding
+                LIMIT :depth
+            """
+        else:
+            vector_query = f"""
             SELECT id, RANK () OVER (ORDER BY {embedding_field_name} <=> :embedding) AS rank
                 FROM "{table_name}"
                 {filter_clause_where}
                 ORDER BY {embedding_field_name} <=> :embedding
-                LIMIT 20
+                LIMIT :depth
             """
 
         fulltext_query = f"""
@@ -121,7 +316,15 @@ class PostgresSearcher:
                 FROM "{table_name}", plainto_tsquery('english', :query) query
                 WHERE to_tsvector('english', {search_text_field_name}) @@ query {filter_clause_and}
                 ORDER BY ts_rank_cd(to_tsvector('english', {search_text_field_name}), query) DESC
-                LIMIT 20
+                LIMIT :depth
+            """
+
+        fulltext_precheck = f"""
+            SELECT numnode(query) > 0 AND EXISTS (
+                SELECT 1 FROM "{table_name}"
+                    WHERE to_tsvector('english', {search_text_field_name}) @@ query {filter_clause_and}
+            )
+                FROM plainto_tsquery('english', :query) query
             """
 
         hybrid_query = f"""
@@ -133,45 +336,116 @@ class PostgresSearcher:
         )
         SELECT
             COALESCE(vector_search.id, fulltext_search.id) AS id,
-            COALESCE(1.0 / (:k + vector_search.rank), 0.0) +
-            COALESCE(1.0 / (:k + fulltext_search.rank), 0.0) AS score
+            COALESCE(:vector_weight / (:k + vector_search.rank), 0.0) +
+            COALESCE(:text_weight / (:k + fulltext_search.rank), 0.0) AS score
         FROM vector_search
         FULL OUTER JOIN fulltext_search ON vector_search.id = fulltext_search.id
         ORDER BY score DESC
-        LIMIT 20
+        LIMIT :limit
         """
 
-        if query_text is not None and len(query_vector) > 0:
-            print("hybrid_query", hybrid_query)
-            sql = text(hybrid_query).columns(
-                column("id", Integer), column("score", Float)
-            )
-        elif len(query_vector) > 0:
-            print("vector_query", vector_query)
-            sql = text(vector_query).columns(
-                column("id", Integer), column("rank", Integer)
-            )
-        elif query_text is not None:
-            print("fulltext_query", fulltext_query)
-            sql = text(fulltext_query).columns(
-                column("id", Integer), column("rank", Integer)
-            )
-        else:
-            raise ValueError("Both query text and query vector are empty")
+        statements = {
+            "hybrid": (
+                "postgres.hybrid_query",
+                text(hybrid_query).columns(column("id", Integer), column("score", Float)).execution_options(prepare=True),
+            ),
+            "vector": (
+                "postgres.vector_query",
+                text(vector_query).columns(column("id", Integer), column("rank", Integer)).execution_options(prepare=True),
+            ),
+            "fulltext": (
+                "postgres.fulltext_query",
+                text(fulltext_query).columns(column("id", Integer), column("rank", Integer)).execution_options(prepare=True),
+            ),
+            "fulltext_precheck": (
+                "postgres.fulltext_precheck",
+                text(fulltext_precheck).columns(column("matches", Boolean)).execution_options(prepare=True),
+            ),
+        }
+        # Filter values are inlined, bound the cache for many distinct filter sets
+        if len(self._statement_cache) >= STATEMENT_CACHE_SIZE:
+            self._statement_cache.clear()
+        self._statement_cache[key] = statements
+        return statements
+
+    @staticmethod
+    def _set_local(db_session, ef_search: Union[int, None] = None, statement_timeout: Union[int, None] = None) -> None:
+        """Sets hnsw.ef_search and statement_timeout (ms) for the transaction, in one round trip."""
+        settings = {"hnsw.ef_search": ef_search, "statement_timeout": statement_timeout}
+        settings = {name: str(value) for name, value in settings.items() if value is not None}
+        if not settings:
+            return
+        db_session.execute(
+            text("SELECT " + ", ".join(f"set_config('{name}', :p{i}, true)" for i, name in enumerate(settings))),
+            {f"p{i}": value for i, value in enumerate(settings.values())},
+        )
+
+    @staticmethod
+    def _fulltext_matches(db_session, statements: dict, params: dict) -> bool:
+        """
+        Whether the full-text leg can contribute: the tsquery has a term left
+        after stop words and matches at least one row, an index lookup.
+        """
+        _, sql = statements["fulltext_precheck"]
+        with timed("postgres.fulltext_precheck"):
+            return bool(db_session.execute(sql, {"query": params["query"]}).scalar())
+
+    @staticmethod
+    def _explain(db_session, statements: dict, params: dict, legs: list):
+        """
+        Runs each leg on its own and fuses them in Python with the formula of the
+        hybrid statement, so the ranks and timing of every leg can be reported.
+
+        Returns:
+            tuple: The (id, score) result rows and the explanation of the legs and fused rows
+        """
+        ranks, explanation = {}, {"legs": {}}
+        for leg in legs:
+            stage, sql = statements[leg]
+            start = time.perf_counter()
+            with timed(stage):
+                rows = db_session.execute(sql, params).fetchall()
+            ranks[leg] = {id: rank for id, rank in rows}
+            explanation["legs"][leg] = {
+                "ms": round((time.perf_counter() - start) * 1000, 3),
+                "rows": len(rows),
+                "ranks": [{"id": id, "rank": rank} for id, rank in rows],
+            }
 
-        results = []
-        with get_db_session() as db_session:
-            results = (
+        weights = {"vector": params["vector_weight"], "fulltext": params["text_weight"]}
+        results = fuse({leg: ranks[leg].items() for leg in legs}, weights, params["k"], params["limit"])
+        explanation["fused"] = [
+            {"id": id, "score": score, **{f"{leg}_rank": ranks[leg].get(id) for leg in legs}}
+            for id, score in results
+        ]
+        return results, explanation
+
+    def _rerank(self, stage: str, results, top: int, mmr_lambda: float):
+        """
+        Applies MMR to the (id, score) or (id, rank) rows, loading only their
+        embedding column in one query.
+        """
+        if not results:
+            return results
+        embedding_field = getattr(self.db_model, self.db_model.get_embedding_field())
+        ids = [row[0] for row in results]
+        with get_db_session("read") as db_session:
+            vectors = dict(
                 db_session.execute(
-                    sql,
-                    {"embedding": str(query_vector), "query": query_text, "k": 60},
-                )
-            ).fetchall()
+                    select(self.db_model.id, embedding_field).where(self.db_model.id.in_(ids))
+                ).all()
+            )
+        results = [row for row in results if vectors.get(row[0]) is not None]
+        # Hybrid rows carry a fused score, the single-leg queries a rank
+        relevance = [row[1] if stage == "postgres.hybrid_query" else -row[1] for row in results]
+        return rerank(results, [vectors[row[0]] for row in results], relevance, top, mmr_lambda)
 
-        # Convert results to models
+    def _hydrate(self, results):
+        """Loads the database objects for the (id, score) result rows, keeping their order."""
+        table_name = self.db_model.__tablename__
         items = []
-        for id, _ in results[:top]:
-            with get_db_session() as db_session:
+        for id, _ in results:
+            with get_db_session("read") as db_session:
                 if table_name == "menu_item":
                     item = db_session.execute(
                         select(self.db_model)
@@ -192,6 +466,9 @@ class PostgresSearcher:
         enable_vector_search: bool = True,
         enable_text_search: bool = True,
         filters: Union[list[dict], None] = None,
+        mmr_lambda: Union[float, None] = None,
+        fetch_k: Union[int, None] = None,
+        mode: Union[str, None] = None,
     ):
         """
         High-level search function that handles embedding generation and search execution.
@@ -202,6 +479,9 @@ class PostgresSearcher:
             enable_vector_search (bool): Whether to use vector similarity search
             enable_text_search (bool): Whether to use full-text search
             filters (list[dict] | None): Additional filters to apply
+            mmr_lambda (float | None): MMR trade-off, see `search`
+            fetch_k (int | None): Candidates over-fetched for MMR
+            mode (str | None): "full" or "coarse" vector search, see `search`
             
         Returns:
             list: List of matching database objects
@@ -209,31 +489,32 @@ class PostgresSearcher:
         This method automatically generates embeddings if vector search is enabled
         and provides a simplified interface to the search functionality.
         """
-        vector: list[float] = []
-        if enable_vector_search and query_text is not None:
-            try:
-                # Try using Pinecone embeddings first
-                logger.info(f"Generating Pinecone embedding for search query: {query_text}")
-                vector = embedding_util.generate_pinecone(
-                    query_text,
-                    self.embed_dimensions,
-                )
-                logger.info("Successfully generated Pinecone embedding for search query")
-            except Exception as e:
-                logger.error(f"Error generating Pinecone embedding: {e}")
-                # Fallback to OpenAI if Pinecone fails
-                logger.info(f"Falling back to OpenAI embedding for search query")
+        text_query = query_text if enable_text_search else None
+        for attempt in range(2):
+            current = active_index.current()
+            vector: list[float] = []
+            if enable_vector_search and query_text is not None:
                 try:
-                    vector = embedding_util.generate(
-                        query_text,
-                        self.embed_dimensions,
+                    logger.info(f"Generating {current['embedding_backend']} embedding for search query: {query_text}")
+                    vector = deadline.run_within(
+                        "embedding", active_index.embed, query_text, current,
+                        reserve=config.DEADLINE_FULLTEXT_RESERVE_SECONDS,
                     )
-                except Exception as openai_error:
-                    logger.error(f"Error generating OpenAI embedding: {openai_error}")
-                    # If both fail, continue with text search only
+                except Exception as e:
+                    logger.error(f"Error generating embedding: {e}")
+                    # If embedding fails or is late, continue with text search only
+                    FALLBACKS.labels("postgres", "text_only").inc()
+                    deadline.degrade("fulltext_only")
                     vector = []
-                    
-        if not enable_text_search:
-            query_text = None
 
-        return self.search(query_text, vector, top, filters)
+            try:
+                return self.search(
+                    text_query, vector, top, filters, mmr_lambda, fetch_k, mode,
+                    generation=current["generation"] if vector else None,
+                )
+            except (IndexSwitched, DataError) as e:
+                # A cutover committed after the query was embedded (a DataError when
+                # the dimensions changed too): embed again with the new generation
+                if attempt or active_index.refresh()["generation"] == current["generation"]:
+                    raise
+                logger.info(f"Search index switched during the search, retrying: {getattr(e, 'orig', e)}")
@@ -4,28 +4,59 @@ Simple implementation for RAG use case.
 """
 
 import logging
+import time
 from typing import List, Optional, Dict, Any
 
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import Distance, HnswConfigDiff, PointIdsList, Prefetch, VectorParams, PointStruct
 
-from services.embedding import Embedding
+from services import deadline
+from services.deadline import DeadlineExceeded
+from services.embedding import require_matryoshka
+from services.search_index import active_index
 from config.main import config
-from models.company import Company
+from services.metrics import FALLBACKS, timed
+from services.reranker import rerank, resolve_options
+from models.company import Company, truncate_embedding
 
-embedding_util = Embedding()
 logger = logging.getLogger(__name__)
 
+# Named vectors of the coarse-mode collection
+COARSE_VECTOR = "coarse"
+FULL_VECTOR = "full"
+
+
+def collection_name_for(mode: str) -> str:
+    """
+    Coarse mode uses its own collection, `{QDRANT_COLLECTION_NAME}_{COARSE_DIMENSIONS}`.
+    After a re-index (scripts/reindex.py) the name is an alias of the active
+    generation's collection.
+    """
+    if mode == "coarse":
+        return f"{config.QDRANT_COLLECTION_NAME}_{config.COARSE_DIMENSIONS}"
+    return config.QDRANT_COLLECTION_NAME
+
 
 class QdrantSearcher:
     """
     Simple Qdrant searcher for RAG vector search functionality.
     """
 
-    def __init__(self, db_model, embed_dimensions: int = 1024):
+    def __init__(
+        self,
+        db_model,
+        embed_dimensions: Optional[int] = None,
+        mode: Optional[str] = None,
+        collection_name: Optional[str] = None,
+    ):
         self.db_model = db_model
-        self.embed_dimensions = embed_dimensions
-        self.collection_name = config.QDRANT_COLLECTION_NAME
+        self.embed_dimensions = embed_dimensions or active_index.current()["dimensions"]
+        self.mode = mode or config.SEARCH_MODE
+        if self.mode == "coarse":
+            require_matryoshka(active_index.current()["embedding_model"])
+        self.collection_name = collection_name or collection_name_for(self.mode)
+        self._aliased = False
+        self._alias_checked = 0.0
         
         # Initialize client
         logger.info(f"Initializing Qdrant client with URL: {config.QDRANT_URL}")
@@ -46,13 +77,13 @@ class QdrantSearcher:
         """Create collection if it doesn't exist."""
         try:
             collections = self.client.get_collections()
-            if not any(col.name == self.collection_name for col in collections.collections):
+            aliases = self.client.get_aliases()
+            if not any(col.name == self.collection_name for col in collections.collections) and not any(
+                alias.alias_name == self.collection_name for alias in aliases.aliases
+            ):
                 self.client.create_collection(
                     collection_name=self.collection_name,
-                    vectors_config=VectorParams(
-                        size=self.embed_dimensions,
-                        distance=Distance.COSINE
-                    ),
+                    vectors_config=self._vectors_config(),
                 )
                 logger.info(f"Created Qdrant collection: {self.collection_name}")
             else:
@@ -63,78 +94,231 @@ class QdrantSearcher:
             logger.error(f"Make sure your QDRANT_URL and QDRANT_API_KEY are correctly set in .env file")
             raise
     
+    def _vectors_config(self):
+        if self.mode != "coarse":
+            return VectorParams(size=self.embed_dimensions, distance=Distance.COSINE)
+        # Only the truncated vectors are graph-indexed and kept in RAM, the full
+        # vectors stay on disk and are read for the rescoring pass only
+        return {
+            COARSE_VECTOR: VectorParams(size=config.COARSE_DIMENSIONS, distance=Distance.COSINE),
+            FULL_VECTOR: VectorParams(
+                size=self.embed_dimensions,
+                distance=Distance.COSINE,
+                on_disk=True,
+                hnsw_config=HnswConfigDiff(m=0),
+            ),
+        }
+
+    def point_vector(self, embedding):
+        """The point vector(s) stored for `embedding` in this searcher's collection."""
+        embedding = [float(value) for value in embedding]
+        if self.mode != "coarse":
+            return embedding
+        return {COARSE_VECTOR: truncate_embedding(embedding), FULL_VECTOR: embedding}
+
+    def company_point(self, company: Company) -> PointStruct:
+        return PointStruct(
+            id=company.id,
+            vector=self.point_vector(company.embedding),
+            payload={
+                "name": company.name,
+                "description": company.description,
+                "industry": company.industry,
+                "size": company.size,
+                "location": company.location,
+                "content": company.content
+            }
+        )
+
     def upsert_company(self, company: Company) -> bool:
         """Store company in Qdrant."""
+        return self.upsert_companies([company]) == 1
+
+    def upsert_companies(self, companies: List[Company], batch_size: int = 256) -> int:
+        """
+        Store companies in Qdrant, `batch_size` points per call.
+
+        Returns:
+            Number of companies stored
+        """
+        points = [
+            self.company_point(company) for company in companies
+            if company.embedding is not None and len(company.embedding) > 0
+        ]
+        stored = 0
+        for start in range(0, len(points), batch_size):
+            batch = points[start:start + batch_size]
+            try:
+                with timed("qdrant.upsert"):
+                    self.client.upsert(collection_name=self.collection_name, points=batch)
+                stored += len(batch)
+            except Exception as e:
+                logger.error(f"Error upserting {len(batch)} companies to Qdrant: {e}")
+        return stored
+
+    def delete_companies(self, company_ids: List[int]) -> bool:
+        """Remove companies from Qdrant in one call."""
+        if not company_ids:
+            return True
         try:
-            if company.embedding is None or len(company.embedding) == 0:
-                return False
-            
-            point = PointStruct(
-                id=company.id,
-                vector=company.embedding,
-                payload={
-                    "name": company.name,
-                    "description": company.description,
-                    "industry": company.industry,
-                    "size": company.size,
-                    "location": company.location,
-                    "content": company.content
-                }
-            )
-            
-            self.client.upsert(
-                collection_name=self.collection_name,
-                points=[point]
-            )
+            with timed("qdrant.delete"):
+                self.client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=PointIdsList(points=list(company_ids)),
+                )
             return True
-            
         except Exception as e:
-            logger.error(f"Error upserting company to Qdrant: {e}")
+            logger.error(f"Error deleting {len(company_ids)} companies from Qdrant: {e}")
             return False
     
-    def search_and_embed(self, query_text: str, top: int = 5) -> List[Company]:
+    def generation_collection(self, generation: Optional[int]) -> str:
+        """
+        The collection of search index `generation`. Once the collection name is
+        an alias (scripts/reindex.py prepare) every generation has its own
+        collection `{name}_g{generation}`, kept until cleanup, so a query embedded
+        with a cached, older generation is answered by that generation's vectors.
+        """
+        if generation is None:
+            return self.collection_name
+        now = time.monotonic()
+        if not self._aliased and now - self._alias_checked >= active_index.check_interval:
+            self._alias_checked = now
+            self._aliased = any(
+                alias.alias_name == self.collection_name for alias in self.client.get_aliases().aliases
+            )
+        return f"{self.collection_name}_g{generation}" if self._aliased else self.collection_name
+
+    def _search_points(self, query_vector: List[float], limit: int, with_vectors: bool, collection_name: str):
+        """
+        Runs the ANN query. In coarse mode Qdrant prefetches COARSE_RESCORE_DEPTH
+        candidates from the truncated vectors and rescores them with the full ones.
+        """
+        if self.mode != "coarse":
+            return self.client.query_points(
+                collection_name=collection_name,
+                query=list(query_vector),
+                limit=limit,
+                with_payload=True,
+                with_vectors=with_vectors,
+                timeout=deadline.timeout_seconds(config.DEADLINE_FULLTEXT_RESERVE_SECONDS),
+            ).points
+        return self.client.query_points(
+            collection_name=collection_name,
+            prefetch=Prefetch(
+                query=truncate_embedding(query_vector),
+                using=COARSE_VECTOR,
+                limit=max(config.COARSE_RESCORE_DEPTH, limit),
+            ),
+            query=list(query_vector),
+            using=FULL_VECTOR,
+            limit=limit,
+            with_payload=True,
+            with_vectors=[FULL_VECTOR] if with_vectors else False,
+            timeout=deadline.timeout_seconds(config.DEADLINE_FULLTEXT_RESERVE_SECONDS),
+        ).points
+
+    def search(
+        self,
+        query_vector: List[float],
+        top: int = 5,
+        mmr_lambda: Optional[float] = None,
+        fetch_k: Optional[int] = None,
+        generation: Optional[int] = None,
+    ) -> List[Company]:
+        """
+        Search for companies using an embedding vector.
+
+        Args:
+            query_vector: The embedding vector for similarity search
+            top: Number of results to return
+            mmr_lambda: MMR trade-off between relevance (1.0) and diversity (0.0),
+                defaults to MMR_LAMBDA; None there disables re-ranking
+            fetch_k: Candidates over-fetched with their vectors for MMR
+            generation: Search index generation `query_vector` was embedded with,
+                see `generation_collection`; the collection name by default
+
+        Returns:
+            List of Company objects
+        """
+        mmr_lambda, limit = resolve_options(top, mmr_lambda, fetch_k)
+
+        with timed("qdrant.search"):
+            search_results = self._search_points(
+                query_vector, limit, mmr_lambda is not None, self.generation_collection(generation)
+            )
+
+        if mmr_lambda is not None:
+            search_results = rerank(
+                search_results,
+                [
+                    result.vector[FULL_VECTOR] if isinstance(result.vector, dict) else result.vector
+                    for result in search_results
+                ],
+                [result.score for result in search_results],
+                top,
+                mmr_lambda,
+            )
+
+        # Convert to Company objects
+        companies = []
+        for result in search_results:
+            payload = result.payload
+            company = Company(
+                id=result.id,
+                name=payload.get("name"),
+                description=payload.get("description"),
+                industry=payload.get("industry"),
+                size=payload.get("size"),
+                location=payload.get("location"),
+                content=payload.get("content")
+            )
+            companies.append(company)
+
+        return companies
+
+    def search_and_embed(
+        self,
+        query_text: str,
+        top: int = 5,
+        mmr_lambda: Optional[float] = None,
+        fetch_k: Optional[int] = None,
+    ) -> List[Company]:
         """
         Search for companies using text query.
         
         Args:
             query_text: Search query
             top: Number of results to return
+            mmr_lambda: MMR trade-off, see `search`
+            fetch_k: Candidates over-fetched with their vectors for MMR
             
         Returns:
             List of Company objects
+
+        Raises:
+            DeadlineExceeded: The embedding or the query did not finish before the
+                request deadline, leaving time for a full-text fallback
         """
-        try:
-            # Generate embedding
+        reserve = config.DEADLINE_FULLTEXT_RESERVE_SECONDS
+        for attempt in range(2):
+            current = active_index.current()
             try:
-                query_vector = embedding_util.generate_pinecone(query_text, self.embed_dimensions)
-            except Exception:
-                query_vector = embedding_util.generate(query_text, self.embed_dimensions)
-            
-            # Search in Qdrant
-            search_results = self.client.search(
-                collection_name=self.collection_name,
-                query_vector=query_vector,
-                limit=top,
-                with_payload=True
-            )
-            
-            # Convert to Company objects
-            companies = []
-            for result in search_results:
-                payload = result.payload
-                company = Company(
-                    id=result.id,
-                    name=payload.get("name"),
-                    description=payload.get("description"),
-                    industry=payload.get("industry"),
-                    size=payload.get("size"),
-                    location=payload.get("location"),
-                    content=payload.get("content")
+                # Generate embedding
+                query_vector = deadline.run_within(
+                    "embedding", active_index.embed, query_text, current, reserve=reserve
                 )
-                companies.append(company)
-            
-            return companies
-            
-        except Exception as e:
-            logger.error(f"Error in Qdrant search: {e}")
-            return []
\ No newline at end of file
+                return deadline.run_within(
+                    "qdrant.search", self.search, query_vector, top, mmr_lambda, fetch_k, current["generation"],
+                    reserve=reserve,
+                )
+
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                # The generation's collection is gone after a cutover and cleanup: embed again with the new one
+                if not attempt and active_index.refresh()["generation"] != current["generation"]:
+                    logger.info(f"Search index switched during the search, retrying: {e}")
+                    continue
+                logger.error(f"Error in Qdrant search: {e}")
+                FALLBACKS.labels("qdrant", "search_error").inc()
+                return []
@@ -1,60 +1,319 @@
 from typing import Optional, Any
 import json
+import logging
+import uuid
+import zlib
 from redis import Redis
+from redis.exceptions import WatchError
 from config.main import config
+from services.metrics import CACHE_REQUESTS, timed
+
+logger = logging.getLogger(__name__)
+
 
 class RedisService:
     def __init__(self):
         self.redis_client = Redis(
             host=config.REDIS_HOST,
             port=config.REDIS_PORT,
-            decode_responses=True
+            decode_responses=True,
+            socket_timeout=config.REDIS_TIMEOUT_SECONDS,
+            socket_connect_timeout=config.REDIS_TIMEOUT_SECONDS,
+        )
+        # Compressed values are stored as raw bytes
+        self.binary_client = Redis(
+            host=config.REDIS_HOST,
+            port=config.REDIS_PORT,
+            decode_responses=False,
+            socket_timeout=config.REDIS_TIMEOUT_SECONDS,
+            socket_connect_timeout=config.REDIS_TIMEOUT_SECONDS,
         )
 
     async def get(self, key: str) -> Optional[Any]:
         """Get value from Redis"""
         try:
-            value = self.redis_client.get(key)
+            with timed("redis.get"):
+                value = self.redis_client.get(key)
+            CACHE_REQUESTS.labels(key.split(":")[0], "hit" if value else "miss").inc()
             return json.loads(value) if value else None
-        except Exception as e:
-            print(f"Redis get error: {e}")
+        except Exception:
+            logger.warning("Redis get error", exc_info=True)
             return None
 
     async def set(self, key: str, value: Any, expire: int = 3600) -> bool:
         """Set value in Redis with expiration"""
         try:
-            return self.redis_client.setex(
-                key,
-                expire,
-                json.dumps(value)
-            )
-        except Exception as e:
-            print(f"Redis set error: {e}")
+            with timed("redis.set"):
+                return self.redis_client.setex(
+                    key,
+                    expire,
+                    json.dumps(value)
+                )
+        except Exception:
+            logger.warning("Redis set error", exc_info=True)
             return False
 
     async def delete(self, key: str) -> bool:
         """Delete key from Redis"""
         try:
-            return bool(self.redis_client.delete(key))
-        except Exception as e:
-            print(f"Redis delete error: {e}")
+            with timed("redis.delete"):
+                return bool(self.redis_client.delete(key))
+        except Exception:
+            logger.warning("Redis delete error", exc_info=True)
             return False
 
     async def keys(self, pattern: str) -> list:
         """Get all keys matching the pattern"""
         try:
             return self.redis_client.keys(pattern)
-        except Exception as e:
-            print(f"Redis keys error: {e}")
+        except Exception:
+            logger.warning("Redis keys error", exc_info=True)
             return []
 
     async def scan_and_delete(self, pattern: str) -> bool:
         """Scan and delete all keys matching the pattern"""
         try:
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                return bool(self.redis_client.delete(*keys))
-            return True
-        except Exception as e:
-            print(f"Redis scan and delete error: {e}")
-            return False 
\ No newline at end of file
+            with timed("redis.scan_and_delete"):
+                keys = self.redis_client.keys(pattern)
+                if keys:
+                    return bool(self.redis_client.delete(*keys))
+                return True
+        except Exception:
+            logger.warning("Redis scan and delete error", exc_info=True)
+            return False
+
+    async def publish_change(self, name: str, change: Any, keep: int = 1000) -> Optional[int]:
+        """
+        Append a change to the change log `name` and bump its version atomically.
+        Only the last `keep` changes are retained. Returns the new version.
+        """
+        return await self.publish_changes(name, [change], keep)
+
+    async def publish_changes(self, name: str, changes: list, keep: int = 1000) -> Optional[int]:
+        """
+        Append several changes to the change log `name` in one round trip, the
+        version is bumped by their number. Returns the new version.
+        """
+        if not changes:
+            return None
+        try:
+            with timed("redis.publish_change"):
+                pipeline = self.redis_client.pipeline(transaction=True)
+                pipeline.rpush(f"changes:{name}", *[json.dumps(change) for change in changes])
+                pipeline.ltrim(f"changes:{name}", -keep, -1)
+                pipeline.incrby(f"version:{name}", len(changes))
+                return pipeline.execute()[-1]
+        except Exception:
+            logger.warning("Redis publish change error", exc_info=True)
+            return None
+
+    async def get_namespace_version(self, name: str) -> int:
+        """
+        Current version of the cache namespace `name`. Cache keys embed it, so
+        bumping it invalidates every key of the namespace at once.
+        """
+        try:
+            with timed("redis.get"):
+                return int(self.redis_client.get(f"version:{name}") or 0)
+        except Exception:
+            logger.warning("Redis get namespace version error", exc_info=True)
+            return 0
+
+    async def bump_namespace_version(self, name: str) -> Optional[int]:
+        """Invalidates the cache namespace `name`, stale keys expire with their TTL."""
+        try:
+            with timed("redis.incr"):
+                return self.redis_client.incr(f"version:{name}")
+        except Exception:
+            logger.warning("Redis bump namespace version error", exc_info=True)
+            return None
+
+    async def get_changes(self, name: str, since_version: int) -> tuple:
+        """
+        Get the current version of the change log `name` and the changes after
+        `since_version`. The changes are None when they were already trimmed,
+        in which case the caller must rebuild from scratch.
+        """
+        try:
+            with timed("redis.get_changes"):
+                pipeline = self.redis_client.pipeline(transaction=True)
+                pipeline.get(f"version:{name}")
+                pipeline.lrange(f"changes:{name}", 0, -1)
+                version, log = pipeline.execute()
+            version = int(version or 0)
+            missing = version - since_version
+            if missing <= 0:
+                return version, []
+            if missing > len(log):
+                return version, None
+            return version, [json.loads(change) for change in log[-missing:]]
+        except Exception:
+            logger.warning("Redis get changes error", exc_info=True)
+            # Keep serving the local state rather than rebuilding while Redis is down
+            return since_version, []
+
+    async def exists(self, key: str) -> bool:
+        """Check whether `key` exists, without reading or counting it as a cache lookup"""
+        try:
+            with timed("redis.exists"):
+                return bool(self.redis_client.exists(key))
+        except Exception:
+            logger.warning("Redis exists error", exc_info=True)
+            return False
+
+    async def set_if_absent(self, key: str, value: Any, expire: int) -> bool:
+        """Set `key` only if it does not exist, e.g. a lock held until `expire` seconds"""
+        try:
+            with timed("redis.set"):
+                return bool(self.redis_client.set(key, json.dumps(value), nx=True, ex=expire))
+        except Exception:
+            logger.warning("Redis set if absent error", exc_info=True)
+            return False
+
+    async def increment_score(self, key: str, member: str, expire: int, keep: int) -> bool:
+        """
+        Increment `member` in the sorted set `key` by one and refresh its TTL.
+        Only the `keep` members with the highest scores are retained.
+        """
+        try:
+            with timed("redis.increment_score"):
+                pipeline = self.redis_client.pipeline(transaction=False)
+                pipeline.zincrby(key, 1, member)
+                pipeline.zremrangebyrank(key, 0, -keep - 1)
+                pipeline.expire(key, expire)
+                pipeline.execute()
+                return True
+        except Exception:
+            logger.warning("Redis increment score error", exc_info=True)
+            return False
+
+    async def top_scores(self, keys: list, count: int) -> list:
+        """The `count` members with the highest summed score across the sorted sets `keys`"""
+        try:
+            with timed("redis.top_scores"):
+                members = self.redis_client.zunion(keys, withscores=True)
+            return sorted(members, key=lambda member: member[1], reverse=True)[:count]
+        except Exception:
+            logger.warning("Redis top scores error", exc_info=True)
+            return []
+
+    async def increment_counters(self, updates: dict, version_key: str = None) -> bool:
+        """
+        Apply {hash_key: {field: delta}} increments in one pipeline, bumping
+        `version_key` in the same transaction when given
+        """
+        try:
+            with timed("redis.increment_counters"):
+                pipeline = self.redis_client.pipeline(transaction=True)
+                for key, deltas in updates.items():
+                    for field, delta in deltas.items():
+                        pipeline.hincrby(key, field, delta)
+                if version_key:
+                    pipeline.incr(version_key)
+                pipeline.execute()
+                return True
+        except Exception:
+            logger.warning("Redis increment counters error", exc_info=True)
+            return False
+
+    async def replace_counters(
+        self, counters: dict, expire: int = 0, version_key: str = None, version: int = None
+    ) -> bool:
+        """
+        Replace the hashes {hash_key: {field: count}}, expiring after `expire`
+        seconds when not 0. They are written under temporary keys first and
+        renamed in one transaction, which is aborted (False) when `version_key`
+        is no longer `version`: increments since then are not in the counts.
+        """
+        suffix = uuid.uuid4().hex
+        try:
+            with timed("redis.replace_counters"):
+                pipeline = self.redis_client.pipeline(transaction=False)
+                for key, values in counters.items():
+                    if values:
+                        pipeline.hset(f"{key}:{suffix}", mapping=values)
+                        # Left behind when the rename is aborted
+                        pipeline.expire(f"{key}:{suffix}", 60)
+                pipeline.execute()
+
+                with self.redis_client.pipeline(transaction=True) as pipeline:
+                    if version_key:
+                        pipeline.watch(version_key)
+                        if int(pipeline.get(version_key) or 0) != version:
+                            return False
+                    pipeline.multi()
+                    for key, values in counters.items():
+                        if not values:
+                            pipeline.delete(key)
+                            continue
+                        pipeline.rename(f"{key}:{suffix}", key)
+                        if expire:
+                            pipeline.expire(key, expire)
+                        else:
+                            pipeline.persist(key)
+                    pipeline.execute()
+                return True
+        except WatchError:
+            return False
+        except Exception:
+            logger.warning("Redis replace counters error", exc_info=True)
+            return False
+
+    async def get_counters(self, keys: list) -> Optional[dict]:
+        """Get the hashes `keys` as {hash_key: {field: count}}"""
+        try:
+            with timed("redis.get_counters"):
+                pipeline = self.redis_client.pipeline(transaction=False)
+                for key in keys:
+                    pipeline.hgetall(key)
+                results = pipeline.execute()
+            return {
+                key: {field: int(count) for field, count in values.items()}
+                for key, values in zip(keys, results)
+            }
+        except Exception:
+            logger.warning("Redis get counters error", exc_info=True)
+            return None
+
+    async def get_raw(self, keys: list) -> list:
+        """Get the raw bytes of `keys` in one round trip, None for missing keys"""
+        try:
+            with timed("redis.get"):
+                return self.binary_client.mget(keys)
+        except Exception:
+            logger.warning("Redis get raw error", exc_info=True)
+            return [None] * len(keys)
+
+    async def set_raw(self, values: dict, expire: int = 3600) -> bool:
+        """Set {key: bytes} with expiration in one pipeline"""
+        try:
+            with timed("redis.set"):
+                pipeline = self.binary_client.pipeline(transaction=True)
+                for key, value in values.items():
+                    pipeline.setex(key, expire, value)
+                pipeline.execute()
+                return True
+        except Exception:
+            logger.warning("Redis set raw error", exc_info=True)
+            return False
+
+    def get_compressed(self, key: str) -> Optional[Any]:
+        """Get a zlib compressed JSON value from Redis (blocking)"""
+        try:
+            with timed("redis.get"):
+                value = self.binary_client.get(key)
+            CACHE_REQUESTS.labels(key.split(":")[0], "hit" if value else "miss").inc()
+            return json.loads(zlib.decompress(value)) if value else None
+        except Exception:
+            logger.warning("Redis get compressed error", exc_info=True)
+            return None
+
+    def set_compressed(self, key: str, value: Any, expire: int = 3600) -> bool:
+        """Set a value in Redis as zlib compressed JSON with expiration (blocking)"""
+        try:
+            payload = zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+            with timed("redis.set"):
+                return self.binary_client.setex(key, expire, payload)
+        except Exception:
+            logger.warning("Redis set compressed error", exc_info=True)
+            return False
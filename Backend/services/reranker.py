@@ -0,0 +1,96 @@
+"""
+Maximal Marginal Relevance (MMR) re-ranking over candidate embeddings.
+"""
+
+import time
+from typing import List, Sequence
+
+import numpy as np
+
+from config.main import config
+from services.metrics import timed
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def mmr(
+    candidate_vectors,
+    relevance: Sequence[float],
+    top: int,
+    lambda_mult: float = 0.5,
+    budget_ms: float = None,
+) -> List[int]:
+    """
+    Selects `top` candidates balancing relevance and diversity.
+
+    Args:
+        candidate_vectors: (k, d) embeddings of the over-fetched candidates
+        relevance: Relevance score of each candidate, higher is better; any scale,
+            it is min-max normalized so it is comparable to cosine similarity
+        top: Number of candidates to select
+        lambda_mult: 1.0 is pure relevance, 0.0 is pure diversity
+        budget_ms: Once exceeded, the remaining slots are filled by relevance
+
+    Returns:
+        list[int]: Indices of the selected candidates, in selection order
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    count = len(relevance)
+    top = min(top, count)
+    if top <= 0:
+        return []
+    budget_ms = config.MMR_BUDGET_MS if budget_ms is None else budget_ms
+
+    spread = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones_like(relevance)
+
+    vectors = normalize_rows(candidate_vectors)
+    similarity = vectors @ vectors.T
+
+    start = time.perf_counter()
+    first = int(np.argmax(relevance))
+    selected = [first]
+    available = np.ones(count, dtype=bool)
+    available[first] = False
+    max_similarity = similarity[first].copy()
+
+    while len(selected) < top:
+        if (time.perf_counter() - start) * 1000 > budget_ms:
+            remaining = np.flatnonzero(available)
+            remaining = remaining[np.argsort(-relevance[remaining])]
+            selected.extend(int(i) for i in remaining[:top - len(selected)])
+            break
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return selected
+
+
+def resolve_options(top: int, mmr_lambda: float = None, fetch_k: int = None):
+    """
+    Resolves the per-request MMR options against the configured defaults.
+
+    Returns:
+        tuple: (lambda or None when MMR is disabled, number of candidates to fetch)
+    """
+    mmr_lambda = config.MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+    if mmr_lambda is None:
+        return None, top
+    return mmr_lambda, max(top, fetch_k or config.MMR_FETCH_K)
+
+
+def rerank(items: list, candidate_vectors, relevance: Sequence[float], top: int, lambda_mult: float) -> list:
+    """Returns the `top` items selected by MMR, in selection order."""
+    if not items:
+        return []
+    with timed("mmr"):
+        order = mmr(candidate_vectors, relevance, top, lambda_mult)
+    return [items[i] for i in order]
@@ -0,0 +1,132 @@
+"""
+    This contains the ResponseCache, cached JSON response bodies served with an
+    ETag and precompressed variants.
+"""
+
+import gzip
+import hashlib
+import json
+from typing import Optional
+
+from fastapi import Request, Response
+
+from services.metrics import CACHE_REQUESTS
+from services.redis_service import RedisService
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content encodings by server preference, brotli only when the package is installed
+ENCODINGS = {"gzip": lambda body: gzip.compress(body, compresslevel=6)}
+if brotli is not None:
+    ENCODINGS = {"br": lambda body: brotli.compress(body, quality=5), **ENCODINGS}
+
+
+def json_body(content) -> bytes:
+    return json.dumps(content, separators=(",", ":")).encode("utf-8")
+
+
+def body_etag(body: bytes) -> str:
+    """Weak ETag of a body, every content encoding of it is the same representation."""
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of `etag` with the If-None-Match header."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in [
+        candidate.removeprefix("W/") for candidate in candidates
+    ]
+
+
+def if_none_match(request: Request) -> Optional[str]:
+    """
+    The If-None-Match header of a GET or HEAD request. Other methods would need
+    a 412 rather than a 304 (RFC 9110 13.1.2), their bodies are always sent.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return None
+    return request.headers.get("if-none-match")
+
+
+def accepted_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The preferred ENCODINGS entry the Accept-Encoding header allows, None for identity."""
+    accepted = {}
+    for part in (accept_encoding or "").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip()] = quality
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class ResponseCache:
+    """
+    Stores a JSON body under `key` next to its ETag (`key:etag`) and its
+    compressed variants (`key:gzip`, `key:br`), compressed once when cached.
+    A GET hit whose ETag the client already has is a 304 without reading the
+    body, other hits (and POST requests) send the stored bytes of the accepted
+    encoding as they are, with the ETag.
+    """
+
+    def __init__(self, redis_service: RedisService):
+        self.redis_service = redis_service
+
+    async def get(self, request: Request, key: str) -> Optional[Response]:
+        """The cached response for `key`, 304 when a GET client has it, None when not cached."""
+        header = if_none_match(request)
+        if header:
+            [etag] = await self.redis_service.get_raw([f"{key}:etag"])
+            if etag is not None and etag_matches(header, etag.decode()):
+                CACHE_REQUESTS.labels(key.split(":")[0], "hit").inc()
+                return Response(status_code=304, headers={"ETag": etag.decode(), "Vary": "Accept-Encoding"})
+
+        encoding = accepted_encoding(request.headers.get("accept-encoding"))
+        etag, body = await self.redis_service.get_raw([f"{key}:etag", f"{key}:{encoding}" if encoding else key])
+        CACHE_REQUESTS.labels(key.split(":")[0], "hit" if body else "miss").inc()
+        if etag is None or body is None:
+            return None
+        return self._response(body, etag.decode(), encoding)
+
+    async def set(self, key: str, content, expire: int = 3600) -> str:
+        """
+        Caches `content` as JSON with its ETag and compressed variants.
+
+        Returns:
+            str: The ETag
+        """
+        body = json_body(content)
+        etag = body_etag(body)
+        values = {key: body, f"{key}:etag": etag.encode()}
+        values.update({f"{key}:{encoding}": compress(body) for encoding, compress in ENCODINGS.items()})
+        await self.redis_service.set_raw(values, expire)
+        return etag
+
+    def respond(self, request: Request, content, etag: str) -> Response:
+        """
+        Response for freshly computed `content` with the `etag` of its cached
+        body, they differ in fields such as "source" but are the same representation.
+        """
+        if etag_matches(if_none_match(request), etag):
+            return Response(status_code=304, headers={"ETag": etag, "Vary": "Accept-Encoding"})
+        encoding = accepted_encoding(request.headers.get("accept-encoding"))
+        body = json_body(content)
+        return self._response(ENCODINGS[encoding](body) if encoding else body, etag, encoding)
+
+    @staticmethod
+    def _response(body: bytes, etag: str, encoding: Optional[str]) -> Response:
+        headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="application/json", headers=headers)
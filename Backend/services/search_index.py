@@ -0,0 +1,129 @@
+"""
+    This contains the ActiveIndex, the embedding model and dimensions of the live search index.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List
+
+from sqlalchemy import select
+
+from config.main import config
+from models.database import get_db_session
+from models.search_index import SearchIndex
+from services.embedding import Embedding, embedding_model_name
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "companies"
+
+
+class IndexSwitched(Exception):
+    """The search index was switched while a write was in progress."""
+
+
+def default_index() -> dict:
+    """Generation 1: the index built before any re-indexing, configured from the environment."""
+    return {
+        "generation": 1,
+        "embedding_backend": config.EMBEDDING_BACKEND,
+        "embedding_model": embedding_model_name(),
+        "dimensions": 1024,
+    }
+
+
+class ActiveIndex:
+    """
+    Cached view of the SearchIndex pointer, re-read at most once per
+    `check_interval`. Queries and writes embed with the model and dimensions
+    of the generation being served, so they follow a blue/green cutover
+    without a restart. The cache can lag a cutover: writes `verify` and
+    searches `check` the generation they embedded with in their own
+    transaction, a mismatch refreshes the cache and is retried.
+    """
+
+    def __init__(self, name: str = INDEX_NAME, check_interval: float = None):
+        self.name = name
+        self.check_interval = config.SEARCH_INDEX_CHECK_SECONDS if check_interval is None else check_interval
+        self._current = None
+        self._last_checked = 0.0
+        self._embeddings: Dict[str, Embedding] = {}
+        self._lock = threading.Lock()
+
+    def _read(self, session) -> dict:
+        row = session.execute(select(SearchIndex).where(SearchIndex.name == self.name)).scalar()
+        return row.to_dict() if row is not None else default_index()
+
+    def current(self) -> dict:
+        """The active generation, its embedding backend, model and dimensions."""
+        now = time.monotonic()
+        if self._current is not None and now - self._last_checked < self.check_interval:
+            return self._current
+        try:
+            # The primary, a lagging replica could still point at the previous generation
+            with get_db_session() as session:
+                current = self._read(session)
+        except Exception as e:
+            if self._current is None:
+                raise
+            logger.error(f"Error reading the active search index, keeping generation {self._current['generation']}: {e}")
+            current = self._current
+        if self._current is not None and current["generation"] != self._current["generation"]:
+            logger.info(f"Search index switched to generation {current['generation']} ({current['embedding_model']})")
+        self._current, self._last_checked = current, now
+        return current
+
+    def refresh(self) -> dict:
+        self._last_checked = 0.0
+        return self.current()
+
+    def embedding(self, backend: str) -> Embedding:
+        with self._lock:
+            if backend not in self._embeddings:
+                self._embeddings[backend] = Embedding(backend)
+            return self._embeddings[backend]
+
+    def embed(self, content: str, generation: dict = None) -> List[float]:
+        """Embeds a query or a company with the model of `generation`, the active one by default."""
+        current = generation or self.current()
+        return self.embedding(current["embedding_backend"]).embed(content, current["dimensions"])
+
+    def embed_multiple(self, contents: List[str], generation: dict = None) -> List[List[float]]:
+        """Embeds in batches with the model of `generation`, the active one by default."""
+        current = generation or self.current()
+        return self.embedding(current["embedding_backend"]).embed_multiple(contents, current["dimensions"])
+
+    def _generation(self, session, lock: bool = False) -> int:
+        query = select(SearchIndex.generation).where(SearchIndex.name == self.name)
+        if lock:
+            query = query.with_for_update(read=True)
+        active = session.execute(query).scalar()
+        return active if active is not None else default_index()["generation"]
+
+    def check(self, session, generation: int) -> None:
+        """
+        Checks, within the read transaction of `session` and after its search
+        statements, that `generation` is still active. A cutover commits the
+        pointer and the column swap together, so a search that read the new
+        columns sees the new pointer here and raises IndexSwitched.
+        """
+        active = self._generation(session)
+        if active != generation:
+            self.refresh()
+            raise IndexSwitched(f"Search index switched from generation {generation} to {active}")
+
+    def verify(self, session, generation: int) -> None:
+        """
+        Checks, within the write transaction of `session`, that `generation` is
+        still active. SELECT ... FOR SHARE holds a ROW SHARE lock on the table
+        until the transaction ends: a cutover (EXCLUSIVE lock) waits for the
+        write, or the write sees the new generation and raises IndexSwitched.
+        """
+        active = self._generation(session, lock=True)
+        if active != generation:
+            self.refresh()
+            raise IndexSwitched(f"Search index switched from generation {generation} to {active}")
+
+
+active_index = ActiveIndex()
@@ -0,0 +1,41 @@
+"""
+    This contains the SessionService, storing multi-turn conversation state in Redis.
+"""
+
+import uuid
+from typing import Optional
+
+from config.main import config
+from services.redis_service import RedisService
+
+
+class SessionService:
+    """
+    Keeps the message history and the last retrieved candidate set of a
+    conversation in Redis, refreshed with a TTL on every turn.
+    """
+
+    def __init__(self, redis_service: RedisService = None):
+        self.redis_service = redis_service or RedisService()
+        self.ttl = config.SESSION_TTL
+
+    @staticmethod
+    def key(session_id: str) -> str:
+        return f"session:{session_id}"
+
+    async def create(self) -> str:
+        """Creates an empty session and returns its id"""
+        session_id = uuid.uuid4().hex
+        await self.save(session_id, {"messages": [], "candidates": [], "sent_ids": []})
+        return session_id
+
+    async def get(self, session_id: str) -> Optional[dict]:
+        """Returns the session state, or None if it expired or never existed"""
+        return await self.redis_service.get(self.key(session_id))
+
+    async def save(self, session_id: str, session: dict) -> bool:
+        """Stores the session state and resets its TTL"""
+        return await self.redis_service.set(self.key(session_id), session, self.ttl)
+
+    async def delete(self, session_id: str) -> bool:
+        return await self.redis_service.delete(self.key(session_id))
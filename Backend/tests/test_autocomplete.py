@@ -0,0 +1,171 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+try:
+    from services.autocomplete import AutocompleteIndex
+except OperationalError:  # models/company.py creates the table at import
+    pytest.skip("PostgreSQL is not reachable", allow_module_level=True)
+
+
+class ChangeLog:
+    """The change log part of RedisService, shared by the workers of a test"""
+
+    def __init__(self):
+        self.changes = []
+
+    async def publish_change(self, name, change, keep=1000):
+        return await self.publish_changes(name, [change], keep)
+
+    async def publish_changes(self, name, changes, keep=1000):
+        self.changes.extend(json.dumps(change) for change in changes)
+        return len(self.changes)
+
+    async def get_changes(self, name, since_version):
+        return len(self.changes), [json.loads(change) for change in self.changes[since_version:]]
+
+
+class Index(AutocompleteIndex):
+    """Rebuilt from `rows` instead of the Company table"""
+
+    def __init__(self, change_log, rows=()):
+        super().__init__(change_log, check_interval=0)
+        self.rows = list(rows)
+        self.rebuilds = 0
+        self.fuzzy_queries = []
+
+    def rebuild(self):
+        self.rebuilds += 1
+        self.entries, self.keys_by_id = [], {}
+        for company_id, name in self.rows:
+            self._add(company_id, name)
+        self.loaded = True
+
+    def fuzzy(self, query, limit):
+        self.fuzzy_queries.append(query)
+        return [{"id": 99, "name": "Fuzzy Match"}]
+
+
+def names(completions):
+    return [completion["name"] for completion in completions]
+
+
+def test_prefix_matches_names_and_words():
+    index = Index(ChangeLog(), [(1, "TechVision Solutions"), (2, "Solar Tech"), (3, "Green Energy")])
+    index.rebuild()
+    assert names(index.prefix("tech", 10)) == ["TechVision Solutions", "Solar Tech"]
+    assert names(index.prefix("  SOL ", 10)) == ["Solar Tech", "TechVision Solutions"]
+    assert index.prefix("", 10) == []
+    assert index.prefix("zzz", 10) == []
+
+
+def test_prefix_limit_prefers_full_name_matches():
+    index = Index(ChangeLog(), [(1, "Alpha Beta"), (2, "Beta One"), (3, "Beta Two")])
+    index.rebuild()
+    assert names(index.prefix("beta", 2)) == ["Beta One", "Beta Two"]
+
+
+def test_add_replaces_and_remove_deletes():
+    index = Index(ChangeLog())
+    index.rebuild()
+    index._add(1, "Old Name")
+    index._add(1, "New Name")
+    assert names(index.prefix("old", 10)) == []
+    assert names(index.prefix("new", 10)) == ["New Name"]
+    index._remove(1)
+    index._remove(1)
+    assert index.entries == [] and index.keys_by_id == {}
+
+
+def test_same_key_for_two_companies():
+    index = Index(ChangeLog())
+    index.rebuild()
+    index._add(1, "Acme")
+    index._add(2, "Acme")
+    index._remove(1)
+    assert index.prefix("acme", 10) == [{"id": 2, "name": "Acme"}]
+
+
+def test_other_workers_replay_the_change_log():
+    async def run():
+        change_log = ChangeLog()
+        writer, reader = Index(change_log), Index(change_log)
+        await writer.sync()
+        await reader.sync()
+        await writer.add(1, "Acme")
+        await writer.apply(added=[], removed_ids=[1])
+        await writer.add(2, "Beta")
+        await reader.sync()
+        return writer, reader
+
+    writer, reader = asyncio.run(run())
+    assert names(reader.prefix("b", 10)) == ["Beta"]
+    assert reader.prefix("acme", 10) == []
+    assert (writer.version, reader.version) == (3, 3)
+    assert reader.rebuilds == 1
+
+
+def test_own_changes_are_not_replayed_when_nobody_wrote_in_between():
+    async def run():
+        change_log = ChangeLog()
+        index = Index(change_log)
+        await index.sync()
+        await index.add(1, "Acme")
+        return index
+
+    index = asyncio.run(run())
+    assert index.version == 1
+
+
+def test_interleaved_writes_are_replayed():
+    async def run():
+        change_log = ChangeLog()
+        first, second = Index(change_log), Index(change_log)
+        await first.sync()
+        await second.sync()
+        await first.add(1, "Acme")
+        await second.add(2, "Beta")
+        version_before_sync = second.version
+        await second.sync()
+        return second, version_before_sync
+
+    second, version_before_sync = asyncio.run(run())
+    # Beta was published after Acme, the version still points before Acme
+    assert version_before_sync == 0
+    assert names(second.prefix("a", 10)) == ["Acme"]
+    assert second.version == 2
+
+
+def test_rebuild_change_reloads_every_worker():
+    async def run():
+        change_log = ChangeLog()
+        index = Index(change_log, [(1, "Acme")])
+        await index.sync()
+        index.rows.append((2, "Beta"))
+        await Index(change_log).invalidate()
+        await index.sync()
+        return index
+
+    index = asyncio.run(run())
+    assert index.rebuilds == 2
+    assert names(index.prefix("beta", 10)) == ["Beta"]
+
+
+def test_fuzzy_only_without_prefix_matches():
+    async def run():
+        index = Index(ChangeLog(), [(1, "Acme Rockets")])
+        return index, [
+            await index.complete("acm"),
+            await index.complete("rockt"),
+            await index.complete("rockt", fuzzy=False),
+            await index.complete("zz"),
+        ]
+
+    index, results = asyncio.run(run())
+    assert results[0] == {"completions": [{"id": 1, "name": "Acme Rockets"}], "source": "prefix"}
+    assert results[1] == {"completions": [{"id": 99, "name": "Fuzzy Match"}], "source": "fuzzy"}
+    assert results[2] == {"completions": [], "source": "prefix"}
+    assert results[3] == {"completions": [], "source": "prefix"}
+    assert index.fuzzy_queries == ["rockt"]
@@ -0,0 +1,67 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+try:
+    from models.company import Company
+    from services.context_builder import ContextBuilder
+except OperationalError:  # models/company.py creates the table at import
+    pytest.skip("PostgreSQL is not reachable", allow_module_level=True)
+
+
+def company(id, name="Acme", description="Acme builds rockets. It is based in Berlin. Founded in 1990."):
+    return Company(id=id, name=name, industry="Aerospace", size="50-200", location="Berlin", description=description)
+
+
+def test_no_companies():
+    assert ContextBuilder(100, 50).build("rockets", [], set()) == ""
+
+
+def test_snippet_has_header_and_description():
+    sent = set()
+    context = ContextBuilder(1000, 500).build("rockets", [company(1)], sent)
+    assert context.startswith("- Acme | Aerospace | 50-200 | Berlin\n  Acme builds rockets.")
+    assert sent == {1}
+
+
+def test_relevant_sentences_first_kept_in_order():
+    builder = ContextBuilder(1000, 1000)
+    header = "- Acme | Aerospace | 50-200 | Berlin"
+    first = "Acme builds rockets."
+    # Room for the header and the one sentence matching the query
+    builder.company_token_budget = builder.tokenizer.count(header) + builder.tokenizer.count(first)
+    context = builder.build("rockets", [company(1)], set())
+    assert context == f"{header}\n  {first}"
+
+
+def test_company_budget_smaller_than_the_header():
+    context = ContextBuilder(1000, 1).build("rockets", [company(1)], set())
+    assert context == "- Acme | Aerospace | 50-200 | Berlin"
+
+
+def test_budget_smaller_than_one_company():
+    sent = set()
+    context = ContextBuilder(1, 50).build("rockets", [company(1), company(2, "Beta")], sent)
+    assert context == "(2 more companies omitted to fit the context budget)"
+    assert sent == set()
+
+
+def test_already_sent_companies_are_referenced():
+    sent = {1}
+    context = ContextBuilder(1000, 500).build("rockets", [company(1), company(2, "Beta")], sent)
+    assert context.splitlines()[0] == "- Acme (already listed above)"
+    assert sent == {1, 2}
+
+
+def test_companies_past_the_budget_are_counted():
+    builder = ContextBuilder(1000, 500)
+    first = builder.build("rockets", [company(1)], set())
+    builder.token_budget = builder.tokenizer.count(first)
+    context = builder.build("rockets", [company(1), company(2, "Beta")], set())
+    assert context.splitlines()[-1] == "(1 more companies omitted to fit the context budget)"
+
+
+def test_missing_description_uses_content():
+    item = company(1, description=None)
+    item.content = "Rocket engines."
+    context = ContextBuilder(1000, 500).build("rockets", [item], set())
+    assert context.endswith("\n  Rocket engines.")
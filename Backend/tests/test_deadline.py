@@ -0,0 +1,116 @@
+import asyncio
+import contextvars
+import time
+
+import pytest
+
+from services import deadline
+from services.deadline import DeadlineExceeded
+
+
+@pytest.fixture(autouse=True)
+def no_deadline_left_behind():
+    yield
+    deadline.start_deadline(0)
+
+
+def test_no_deadline():
+    deadline.start_deadline(0)
+    assert deadline.remaining() is None
+    assert deadline.timeout_ms() is None
+    assert deadline.timeout_seconds() is None
+    deadline.check("stage", needed=1000)
+    assert deadline.run_within("stage", lambda x: x * 2, 21) == 42
+
+
+def test_remaining_counts_down_and_subtracts_the_reserve():
+    deadline.start_deadline(10)
+    left = deadline.remaining()
+    assert 9 < left <= 10
+    assert deadline.remaining(reserve=4) == pytest.approx(left - 4, abs=0.1)
+    assert deadline.timeout_seconds() == 10
+    assert 9000 < deadline.timeout_ms() <= 10000
+
+
+def test_timeouts_stay_positive_once_expired():
+    deadline.start_deadline(0.001)
+    time.sleep(0.01)
+    assert deadline.remaining() < 0
+    assert deadline.timeout_ms() == 1
+    assert deadline.timeout_seconds() == 1
+
+
+def test_check():
+    deadline.start_deadline(1)
+    deadline.check("stage", needed=0.5)
+    with pytest.raises(DeadlineExceeded):
+        deadline.check("stage", needed=2)
+    with pytest.raises(DeadlineExceeded):
+        deadline.check("stage", reserve=1)
+
+
+def test_run_within_returns_in_time():
+    deadline.start_deadline(5)
+    assert deadline.run_within("stage", lambda: deadline.remaining() is not None)
+
+
+def test_run_within_gives_up_at_the_deadline():
+    deadline.start_deadline(0.05)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        deadline.run_within("stage", time.sleep, 1)
+    assert time.monotonic() - start < 0.5
+
+
+def test_run_within_fails_fast_when_the_reserve_is_used_up():
+    deadline.start_deadline(0.5)
+    with pytest.raises(DeadlineExceeded):
+        deadline.run_within("stage", lambda: None, reserve=1)
+
+
+def test_run_within_propagates_errors():
+    deadline.start_deadline(5)
+    with pytest.raises(ZeroDivisionError):
+        deadline.run_within("stage", lambda: 1 / 0)
+
+
+def test_degrade_records_once_per_request():
+    degradations = deadline.start_deadline(5)
+    deadline.degrade("no_llm_summary")
+    deadline.degrade("no_llm_summary")
+    deadline.degrade("fulltext_fallback")
+    assert degradations == ["no_llm_summary", "fulltext_fallback"]
+
+
+def test_degrade_without_a_request_is_ignored():
+    contextvars.Context().run(deadline.degrade, "fulltext_fallback")
+
+
+def test_deadline_and_degradations_follow_to_thread():
+    async def request():
+        degradations = deadline.start_deadline(5)
+
+        def stage():
+            deadline.degrade("fulltext_fallback")
+            return deadline.remaining()
+
+        left = await asyncio.to_thread(stage)
+        return left, degradations
+
+    left, degradations = asyncio.run(request())
+    assert 4 < left <= 5
+    assert degradations == ["fulltext_fallback"]
+
+
+def test_with_deadline_bounds_the_client():
+    class Client:
+        def with_options(self, **options):
+            return options
+
+    client = Client()
+    deadline.start_deadline(0)
+    assert deadline.with_deadline(client) is client
+    deadline.start_deadline(5)
+    options = deadline.with_deadline(client, reserve=1)
+    assert options["max_retries"] == 0
+    assert 3 < options["timeout"] <= 4
@@ -0,0 +1,67 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+try:
+    from services.postgres_searcher import candidate_depth, fuse
+except OperationalError:  # models/company.py creates the table at import
+    pytest.skip("PostgreSQL is not reachable", allow_module_level=True)
+
+K = 60
+WEIGHTS = {"vector": 1.0, "fulltext": 1.0}
+
+
+@pytest.fixture(autouse=True)
+def depth_settings(monkeypatch):
+    monkeypatch.setattr("config.main.config.HYBRID_DEPTH_FACTOR", 4)
+    monkeypatch.setattr("config.main.config.HYBRID_MIN_DEPTH", 20)
+    monkeypatch.setattr("config.main.config.HYBRID_MAX_DEPTH", 400)
+
+
+def test_candidate_depth_bounds():
+    assert candidate_depth(1) == 20
+    assert candidate_depth(10) == 40
+    assert candidate_depth(200) == 400
+    # Never fewer candidates than results kept
+    assert candidate_depth(1000) == 1000
+
+
+def test_empty_legs():
+    assert fuse({}, WEIGHTS, K, 10) == []
+    assert fuse({"vector": [], "fulltext": []}, WEIGHTS, K, 10) == []
+
+
+def test_match_in_both_legs_ranks_first():
+    legs = {"vector": [(1, 1), (2, 2)], "fulltext": [(3, 1), (2, 2)]}
+    fused = fuse(legs, WEIGHTS, K, 10)
+    assert [id for id, _ in fused] == [2, 1, 3]
+    assert fused[0][1] == pytest.approx(2 / (K + 2))
+
+
+def test_single_leg_keeps_its_order():
+    fused = fuse({"vector": [(5, 1), (4, 2), (3, 3)]}, WEIGHTS, K, 10)
+    assert [id for id, _ in fused] == [5, 4, 3]
+
+
+def test_limit():
+    fused = fuse({"vector": [(id, id) for id in range(1, 11)]}, WEIGHTS, K, 3)
+    assert [id for id, _ in fused] == [1, 2, 3]
+
+
+def test_ties_keep_first_seen_order():
+    legs = {"vector": [(1, 1), (2, 2)], "fulltext": [(2, 1), (1, 2)]}
+    fused = fuse(legs, WEIGHTS, K, 10)
+    assert fused[0][1] == pytest.approx(fused[1][1])
+    assert [id for id, _ in fused] == [1, 2]
+
+
+def test_zero_weight_leg_does_not_reorder():
+    legs = {"vector": [(1, 1), (2, 2)], "fulltext": [(2, 1), (3, 2)]}
+    fused = fuse(legs, {"vector": 1.0, "fulltext": 0.0}, K, 10)
+    assert [id for id, _ in fused] == [1, 2, 3]
+    assert fused[-1][1] == 0.0
+
+
+def test_weights_shift_the_fusion():
+    legs = {"vector": [(1, 1), (2, 2)], "fulltext": [(2, 1), (1, 2)]}
+    fused = fuse(legs, {"vector": 1.0, "fulltext": 2.0}, K, 10)
+    assert [id for id, _ in fused] == [2, 1]
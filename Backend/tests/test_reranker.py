@@ -0,0 +1,54 @@
+import numpy as np
+
+from services.reranker import mmr, rerank, resolve_options
+
+# Two near-duplicates of the most relevant candidate and one orthogonal candidate
+VECTORS = [[1.0, 0.0], [0.99, 0.01], [0.98, 0.02], [0.0, 1.0]]
+RELEVANCE = [0.9, 0.85, 0.8, 0.5]
+
+
+def test_empty_candidates():
+    assert mmr(np.empty((0, 2)), [], top=5) == []
+    assert rerank([], np.empty((0, 2)), [], top=5, lambda_mult=0.5) == []
+
+
+def test_top_zero_or_above_count():
+    assert mmr(VECTORS, RELEVANCE, top=0) == []
+    assert sorted(mmr(VECTORS, RELEVANCE, top=10, budget_ms=1000)) == [0, 1, 2, 3]
+
+
+def test_lambda_one_is_relevance_order():
+    assert mmr(VECTORS, RELEVANCE, top=4, lambda_mult=1.0, budget_ms=1000) == [0, 1, 2, 3]
+
+
+def test_lambda_zero_picks_the_most_different_after_the_best():
+    assert mmr(VECTORS, RELEVANCE, top=2, lambda_mult=0.0, budget_ms=1000) == [0, 3]
+
+
+def test_diversity_promotes_the_orthogonal_candidate():
+    assert mmr(VECTORS, RELEVANCE, top=2, lambda_mult=0.5, budget_ms=1000) == [0, 3]
+
+
+def test_tied_relevance_keeps_candidate_order():
+    assert mmr(VECTORS, [0.5] * 4, top=4, lambda_mult=1.0, budget_ms=1000) == [0, 1, 2, 3]
+
+
+def test_zero_vectors_do_not_fail():
+    assert mmr([[0.0, 0.0], [0.0, 0.0]], [0.2, 0.7], top=2, budget_ms=1000) == [1, 0]
+
+
+def test_exhausted_budget_fills_by_relevance():
+    assert mmr(VECTORS, RELEVANCE, top=4, lambda_mult=0.0, budget_ms=-1) == [0, 1, 2, 3]
+
+
+def test_rerank_returns_items_in_selection_order():
+    items = ["a", "b", "c", "d"]
+    assert rerank(items, VECTORS, RELEVANCE, top=2, lambda_mult=0.5) == ["a", "d"]
+
+
+def test_resolve_options(monkeypatch):
+    monkeypatch.setattr("config.main.config.MMR_LAMBDA", None)
+    monkeypatch.setattr("config.main.config.MMR_FETCH_K", 30)
+    assert resolve_options(5) == (None, 5)
+    assert resolve_options(5, mmr_lambda=0.3) == (0.3, 30)
+    assert resolve_options(50, mmr_lambda=0.0, fetch_k=10) == (0.0, 50)
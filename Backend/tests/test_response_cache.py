@@ -0,0 +1,83 @@
+import pytest
+from fastapi import Request
+
+from services.response_cache import (
+    ENCODINGS,
+    ResponseCache,
+    accepted_encoding,
+    body_etag,
+    etag_matches,
+    if_none_match,
+)
+
+ETAG = 'W/"abc"'
+PREFERRED = next(iter(ENCODINGS))
+
+
+@pytest.mark.parametrize("header", [None, "", '"other"', 'W/"other", "abcd"'])
+def test_etag_mismatch(header):
+    assert not etag_matches(header, ETAG)
+
+
+@pytest.mark.parametrize("header", ['W/"abc"', '"abc"', '"other", W/"abc"', ' W/"x" ,"abc" ', "*"])
+def test_etag_weak_match(header):
+    assert etag_matches(header, ETAG)
+
+
+def test_strong_etag_matches_weak_header():
+    assert etag_matches('W/"abc"', '"abc"')
+
+
+def test_body_etag_is_weak_and_stable():
+    assert body_etag(b"{}") == body_etag(b"{}")
+    assert body_etag(b"{}").startswith('W/"')
+    assert body_etag(b"{}") != body_etag(b"[]")
+
+
+@pytest.mark.parametrize("header", [None, "", "identity", "deflate", "gzip;q=0", "*;q=0", "gzip;q=0, br;q=0"])
+def test_identity(header):
+    assert accepted_encoding(header) is None
+
+
+def test_gzip():
+    assert accepted_encoding("gzip") == "gzip"
+    assert accepted_encoding("GZIP; q=0.5, deflate") == "gzip"
+    assert accepted_encoding("br;q=0, gzip") == "gzip"
+
+
+def test_wildcard():
+    assert accepted_encoding("*") == PREFERRED
+    assert accepted_encoding("gzip;q=0, *") == ("br" if "br" in ENCODINGS else None)
+
+
+def test_invalid_quality_is_refused():
+    assert accepted_encoding("gzip;q=abc") is None
+
+
+def test_server_preference_wins_over_client_order():
+    assert accepted_encoding("gzip, br") == PREFERRED
+
+
+def request(method, headers=None):
+    return Request({
+        "type": "http",
+        "method": method,
+        "headers": [(name.encode(), value.encode()) for name, value in (headers or {}).items()],
+    })
+
+
+@pytest.mark.parametrize("method", ["GET", "HEAD"])
+def test_conditional_get(method):
+    response = ResponseCache(None).respond(request(method, {"if-none-match": ETAG}), {"a": 1}, ETAG)
+    assert response.status_code == 304
+    assert response.headers["etag"] == ETAG
+
+
+def test_post_always_gets_the_body():
+    response = ResponseCache(None).respond(
+        request("POST", {"if-none-match": ETAG, "accept-encoding": "gzip"}), {"a": 1}, ETAG
+    )
+    assert response.status_code == 200
+    assert response.headers["etag"] == ETAG
+    assert response.headers["content-encoding"] == "gzip"
+    assert if_none_match(request("POST", {"if-none-match": "*"})) is None